@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# rFactor MAS index
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import logging
+
+import rfactortools
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='rFactor MAS index')
+    parser.add_argument('INDEXFILE', action='store', type=str,
+                        help='index file, created if it does not exist')
+    parser.add_argument('-u', '--update', metavar='DIR', action='append', default=[],
+                        help="index all .mas files in DIR")
+    parser.add_argument('-f', '--find', metavar='NAME', action='append', default=[],
+                        help="list the .mas files containing NAME, wildcards are allowed")
+    parser.add_argument('-l', '--list', metavar='DIR', action='store', nargs='?', const='', default=None,
+                        help="list the content of all indexed .mas files, optionally limited to DIR")
+    parser.add_argument('-v', '--verbose', action='store_true', default=False,
+                        help="be more verbose")
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    with rfactortools.MASIndex(args.INDEXFILE) as index:
+        for directory in args.update:
+            updated, removed = index.update(directory)
+            print("%s: %d archives indexed, %d removed" % (directory, updated, removed))
+
+        for name in args.find:
+            for entry in index.find(name):
+                print("%s: %s" % (entry.archive, entry.name))
+
+        if args.list is not None:
+            for entry in index.list(args.list or None):
+                if args.verbose:
+                    print("%s: %8d %8d %s" % (entry.archive, entry.size, entry.zsize, entry.name))
+                else:
+                    print("%s: %s" % (entry.archive, entry.name))
+
+# EOF #
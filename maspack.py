@@ -31,14 +31,49 @@ if __name__ == "__main__":
                         help="Read input files from file instead of directory")
     parser.add_argument('-t', '--type', metavar='INT', action='store', type=int, default=1,
                         help='MAS file type (0: GTL/GTR2, 1: rFactor, GSC2013)')
+    parser.add_argument('-j', '--jobs', metavar='INT', action='store', type=int, default=8,
+                        help='number of compression threads')
+    parser.add_argument('-m', '--max-memory', metavar='MB', action='store', type=int, default=64,
+                        help='maximum amount of uncompressed data held in memory')
+    parser.add_argument('-z', '--level', metavar='INT', action='store', type=int, default=-1,
+                        help='zlib compression level (0-9, -1: zlib default)')
+    parser.add_argument('--strategy', action='store', default="default",
+                        choices=sorted(rfactortools.mas.compression_strategies),
+                        help='zlib compression strategy')
+    parser.add_argument('--store-ext', metavar='EXT', action='append', default=[],
+                        help="store files with extension EXT uncompressed, e.g. '.jpg', "
+                        "'precompressed' selects %s" % ", ".join(rfactortools.mas.precompressed_extensions))
+    parser.add_argument('--min-gain', metavar='PERCENT', action='store', type=float, default=0.0,
+                        help='store files uncompressed when compression saves less then PERCENT')
+    parser.add_argument('--probe-size', metavar='BYTES', action='store', type=int, default=None,
+                        help='guess compressibility from the first BYTES of a file, e.g. 4096')
+    parser.add_argument('--cache', metavar='DIR', action='store', type=str,
+                        help='cache compressed files in DIR and reuse them in later runs')
     args = parser.parse_args()
 
+    store_extensions = []
+    for ext in args.store_ext:
+        if ext == "precompressed":
+            store_extensions += rfactortools.mas.precompressed_extensions
+        else:
+            store_extensions.append(ext)
+
+    policy = rfactortools.MASCompressionPolicy(level=args.level,
+                                               strategy=args.strategy,
+                                               store_extensions=store_extensions,
+                                               min_gain=args.min_gain / 100.0,
+                                               probe_size=args.probe_size)
+
+    cache = rfactortools.MASBlobCache(args.cache) if args.cache else None
+
     if args.inputfile:
         with open(args.INPUTDIR, "r") as fin:
             files = fin.read().splitlines()
     else:
         files = [os.path.join(args.INPUTDIR, name) for name in sorted(os.listdir(args.INPUTDIR))]
 
-    rfactortools.mas_pack(files, args.MASFILE, args.type)
+    rfactortools.mas_pack(files, args.MASFILE, args.type,
+                          jobs=args.jobs, max_inflight=args.max_memory * 1024 * 1024,
+                          policy=policy, cache=cache)
 
 # EOF #
@@ -17,13 +17,16 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+import json
+import os
+import sys
 
 import rfactortools
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='rFactor MAS packer')
     parser.add_argument('MASFILE', action='store', type=str,
-                        help='.mas file to unpack')
+                        help='.mas file to unpack, or directory to verify')
     parser.add_argument('OUTDIR', action='store', type=str, nargs='?',
                         help='output directory')
     parser.add_argument('-l', '--list', action='store_true',
@@ -32,11 +35,40 @@ if __name__ == "__main__":
                         help="prefix listing with filename")
     parser.add_argument('-v', '--verbose', action='store_true', default=False,
                         help="be more verbose")
+    parser.add_argument('-j', '--jobs', metavar='INT', action='store', type=int, default=os.cpu_count() or 1,
+                        help="number of threads used for extraction, or processes used for verification")
+    parser.add_argument('--verify', action='store_true', default=False,
+                        help="verify all .mas files in MASFILE without extracting anything")
+    parser.add_argument('--report', metavar='FILE', action='store', type=str,
+                        help="write the verification report as JSON to FILE, '-' for stdout")
     args = parser.parse_args()
 
-    if args.list:
+    if args.verify:
+        reports = rfactortools.mas_verify_tree(args.MASFILE, jobs=args.jobs)
+
+        if args.report == "-":
+            json.dump(reports, sys.stdout, indent=2)
+            print()
+        else:
+            if args.report:
+                with open(args.report, "w") as fout:
+                    json.dump(reports, fout, indent=2)
+
+            for report in reports:
+                if report["ok"]:
+                    if args.verbose:
+                        print("%s: OK (%d entries)" % (report["file"], report["entries"]))
+                else:
+                    for error in report["errors"]:
+                        print("%s: %s: %s" % (report["file"], error["entry"] or "<file table>", error["error"]))
+
+            print("%d archives verified, %d broken" % (len(reports), sum(not r["ok"] for r in reports)))
+
+        if not all(r["ok"] for r in reports):
+            sys.exit(1)
+    elif args.list:
         rfactortools.mas_list(args.MASFILE, args.verbose, args.with_filename)
     else:
-        rfactortools.mas_unpack(args.MASFILE, args.OUTDIR, args.verbose)
+        rfactortools.mas_unpack(args.MASFILE, args.OUTDIR, args.verbose, jobs=args.jobs)
 
 # EOF #
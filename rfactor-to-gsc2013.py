@@ -38,8 +38,23 @@ if __name__ == "__main__":
                         help="be more verbose")
     parser.add_argument('-q', '--quiet', action='store_true', default=False,
                         help="be less verbose")
+    parser.add_argument('--cache', metavar='DIR', type=str,
+                        help="cache compressed .mas entries in DIR and reuse them in later runs")
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=cfg.jobs,
+                        help="convert N files in parallel")
+    parser.add_argument('-n', '--dry-run', action='store_true', default=False,
+                        help="print what would be converted and the estimated cost, without converting")
+    parser.add_argument('--stats-csv', metavar='FILE', type=str,
+                        help="write the time spent on each file to FILE as CSV")
+    parser.add_argument('--rebuild', action='store_true', default=False,
+                        help="convert all files, even those that are up to date in the output directory")
     args = parser.parse_args()
 
+    cfg.mas_cache_directory = args.cache
+    cfg.jobs = args.jobs
+    cfg.incremental = not args.rebuild
+    cfg.stats_csv = args.stats_csv
+
     target_directory = args.output
 
     if args.verbose:
@@ -56,11 +71,25 @@ if __name__ == "__main__":
     else:
         if not target_directory:
             raise Exception("--output DIR must be set")
+        elif args.dry_run:
+            for source_directory in args.DIRECTORY:
+                converter = rfactortools.rFactorToGSC2013(source_directory, cfg)
+                converter.plan(target_directory).write(sys.stdout)
         else:
             for source_directory in args.DIRECTORY:
                 converter = rfactortools.rFactorToGSC2013(source_directory, cfg)
                 converter.convert_all(target_directory)
                 print("-- rfactor-to-gsc2013 conversion complete --")
+                totals = converter.stats.totals
+                print("%d files, %d errors, %d bytes in, %d bytes out, %.1fs wall, %.1fs cpu" %
+                      (totals["count"], totals["errors"], totals["bytes_in"], totals["bytes_out"],
+                       converter.stats.wall, totals["cpu"]))
+                print("build manifest: %d up to date, %d converted" %
+                      (converter.manifest.uptodate, converter.manifest.converted))
+                print("mas cache: %d hits, %d misses" % (converter.mas_cache.hits, converter.mas_cache.misses))
+                actions = converter.mas_encryptor.actions
+                print("mas encryption: %d passthrough, %d encrypted, %d reencrypted" %
+                      (actions["passthrough"], actions["encrypted"], actions["reencrypted"]))
 
 
 # EOF #
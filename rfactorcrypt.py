@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
+import sys
 
 import rfactortools
 
@@ -12,10 +14,27 @@ class store_int_from_hex(argparse.Action):
         return
 
 
+def scan(args):
+    cache = rfactortools.CryptInfoCache(args.cache) if args.cache else None
+    results = rfactortools.scan_crypt_info(args.FILE, mas_entries=args.mas, jobs=args.jobs, cache=cache)
+    if cache is not None:
+        cache.save()
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print("%-40s %10s %12s" % ("game", "files", "MiB"))
+        for game, (count, size) in rfactortools.summarize_crypt_info(results).items():
+            print("%-40s %10d %12.1f" % (game or "unknown/unencrypted", count, size / (1024 * 1024)))
+        if cache is not None and args.verbose:
+            print("cache: %d hits, %d misses" % (cache.hits, cache.misses))
+
+
 def main():
     parser = argparse.ArgumentParser(description='rFactor MAS packer')
     parser.add_argument('FILE', action='store', type=str, nargs='+',
-                        help='.mas file to unpack')
+                        help='files to process, or directories to scan')
     parser.add_argument('-i', '--info', action='store_true',
                         help="show file info")
     parser.add_argument('-e', '--encrypt', action='store_true',
@@ -26,18 +45,37 @@ def main():
                         help="use key for encryption")
     parser.add_argument('-s', '--sign', default=0x4b1dca9f960524e8, type=lambda s: int(s, 0),
                         help="use signature for encryption")
+    parser.add_argument('-c', '--chunk-size', metavar='KB', default=1024, type=int,
+                        help="process files in chunks of KB kilobytes")
+    parser.add_argument('--scan', action='store_true',
+                        help="scan files and directories and summarize the encryption signatures found")
+    parser.add_argument('--mas', action='store_true',
+                        help="scan the entries of .mas files instead of the .mas files themselves")
+    parser.add_argument('--json', action='store_true',
+                        help="print the scan results for each file as JSON instead of a summary")
+    parser.add_argument('--cache', metavar='FILE', type=str,
+                        help="cache scan results in FILE, only files that changed get rescanned")
+    parser.add_argument('-j', '--jobs', metavar='INT', default=16, type=int,
+                        help="number of threads used for scanning")
     parser.add_argument('-v', '--verbose', action='store_true', default=False,
                         help="be more verbose")
     args = parser.parse_args()
 
+    if args.scan:
+        scan(args)
+        return
+
     for filename in args.FILE:
         sign, key = rfactortools.crypt_info_from_file(filename)
         print("sign:%016x key:%016x '%s' '%s'" % (sign, key, rfactortools.games.get(sign), filename))
 
         if args.encrypt:
-            rfactortools.encrypt_file(filename, filename, args.key, args.sign)
+            action = rfactortools.encrypt_file(filename, filename, args.key, args.sign,
+                                               chunk_size=args.chunk_size * 1024)
+            if args.verbose:
+                print("%s: %s" % (filename, action))
         elif args.decrypt:
-            rfactortools.decrypt_file(filename, filename)
+            rfactortools.decrypt_file(filename, filename, chunk_size=args.chunk_size * 1024)
 
 
 if __name__ == "__main__":
@@ -16,17 +16,27 @@
 
 from .aiw import parse_aiwfile, render_aiw
 from .crypt import games, crypt_info, crypt_info_from_file, get_skip, \
-    encrypt_file, encrypt_data, decrypt_file, decrypt_data
+    encrypt_file, encrypt_data, decrypt_file, decrypt_data, encrypt_chunks, decrypt_chunks, transcode, \
+    MASEncryptor, crypt_backends, get_crypt_backend, set_crypt_backend
+from .crypt_scan import scan_crypt_info, summarize_crypt_info, CryptInfoCache
 from .gtr2 import GTR2ToGSC2013
 from .gsc2013 import rFactorToGSC2013, rFactorToGSC2013Config
 from .gsc2013_excludes import exclude_files
 from .img import resize_to_fit_img_file, resize_to_fit_img_file_with_target, \
     resize_to_aspect_ratio, resize_to_aspect_ratio_from_file, resize_to_file
-from .mas import mas_pack, mas_unpack, mas_list, mas_pack_from_data, mas_unpack_to_data
+from .mas import mas_pack, mas_unpack, mas_list, mas_pack_from_data, mas_pack_from_iter, mas_unpack_to_data, \
+    mas_verify, mas_verify_tree, MASArchive, MASCompressedEntry, MASCompressionPolicy, MASBlobCache
+from .mas_index import MASIndex
+from .manifest import BuildManifest
+from .plan import ConversionPlan, PlanStep, PlannedFile, estimate_cost
+from .stats import ConversionStats, Timer, worker_cpu_time
+from .rules import Rule, FunctionRule, RuleSet
+from .scheduler import ConversionScheduler
 from .scn import gen_check_errors, process_gen_directory, modify_vehicle_file
 from .scn_parser import ScnParser, InfoScnParser, SearchReplaceScnParser, process_scnfile
 from .util import find_files, lookup_path_icase, nt2posixpath, in_directory, \
-    path_exists, file_exists, directory_exists, open_read, find_file
+    path_exists, file_exists, directory_exists, open_read, find_file, CaseInsensitiveIndex, \
+    WalkEntry, walk, scan_directory, DirectoryTree, BasenameIndex
 from .sfx import parse_sfxfile, modify_sfxfile, try_fix_wav_path
 from .gdb import process_gdb_file
 from .veh import parse_vehfile, print_veh_tree, print_veh_info, process_veh_file
@@ -34,17 +44,29 @@ from .veh import parse_vehfile, print_veh_tree, print_veh_info, process_veh_file
 __all__ = [
     'parse_aiwfile', 'render_aiw',
     "games", "crypt_info", "crypt_info_from_file", "get_skip",
-    "encrypt_file", "encrypt_data", "decrypt_file", "decrypt_data",
+    "encrypt_file", "encrypt_data", "decrypt_file", "decrypt_data", "encrypt_chunks", "decrypt_chunks",
+    "transcode", "MASEncryptor",
+    "crypt_backends", "get_crypt_backend", "set_crypt_backend",
+    "scan_crypt_info", "summarize_crypt_info", "CryptInfoCache",
     'GTR2ToGSC2013',
     "rFactorToGSC2013", "rFactorToGSC2013Config",
     "exclude_files",
     "resize_to_fit_img_file", "resize_to_fit_img_file_with_target",
     "resize_to_aspect_ratio", "resize_to_aspect_ratio_from_file", "resize_to_file",
-    "mas_pack", "mas_unpack", "mas_list", "mas_pack_from_data", "mas_unpack_to_data",
+    "mas_pack", "mas_unpack", "mas_list", "mas_pack_from_data", "mas_pack_from_iter", "mas_unpack_to_data",
+    "mas_verify", "mas_verify_tree",
+    "MASArchive", "MASCompressedEntry", "MASCompressionPolicy", "MASBlobCache",
+    "MASIndex",
+    "BuildManifest",
+    "ConversionPlan", "PlanStep", "PlannedFile", "estimate_cost",
+    "ConversionStats", "Timer", "worker_cpu_time",
+    "Rule", "FunctionRule", "RuleSet",
+    "ConversionScheduler",
     "gen_check_errors", "process_gen_directory", "modify_vehicle_file",
     "ScnParser", "InfoScnParser", "SearchReplaceScnParser", "process_scnfile",
     "find_files", "lookup_path_icase", "nt2posixpath", "in_directory",
-    "path_exists", "file_exists", "directory_exists", "open_read", "find_file",
+    "path_exists", "file_exists", "directory_exists", "open_read", "find_file", "CaseInsensitiveIndex",
+    "WalkEntry", "walk", "scan_directory", "DirectoryTree", "BasenameIndex",
     "parse_sfxfile", "modify_sfxfile", "try_fix_wav_path",
     "process_gdb_file",
     "parse_vehfile", "print_veh_tree", "print_veh_info", "process_veh_file",
@@ -0,0 +1,312 @@
+# rFactor encryption and decryption, NumPy implementation
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Fallback for the rfactortools._crypt extension with the same API,
+a port of rfactortools_crypt.cpp.
+
+Decryption is vectorized over whole runs of blocks: the key of each
+block only depends on the ciphertext of the blocks before it, so all
+keys can be computed up front with a cumulative XOR. In encryption the
+key depends on the output of the previous block, so only the bytes
+within a block are processed together.
+"""
+
+
+import struct
+
+import numpy
+
+
+_M64 = 0xffffffffffffffff
+
+_enctypes = {
+    0x38af5637e81bc9a0: 0,  # rFactor
+    0x2eb8f5cc9b14ea3b: 0,  # ARCA Sim Racing
+    0x6a9d37283a9f3d9f: 0,  # Simulador Turismo Carretera
+    0xde4139f961fa2817: 0,  # Top Race Simulador 2009
+    0x38af3150902cc55b: 1,  # Superleague Formula
+    0x4b1dca9f960524e8: 1,  # Game Stock Car
+    0x06a66ad328aeaed6: 1,  # Simulador Turismo Carretera 2012
+    0x28b7856a3a5996da: 1,  # Game Stock Car: Formula Truck
+}
+
+# the two masks of keyz0/keyz1 that affect the key, the other four
+# columns only feed into a value that cancels itself out, see _isi_key()
+_keyz_masks = [
+    [(0xff00000000000000, 0x00000000000000ff),
+     (0x0000ff0000000000, 0x0000000000ff0000),
+     (0x00000000ff000000, 0x000000ff00000000),
+     (0x000000000000ff00, 0x00ff000000000000),
+     (0x00000000000000ff, 0xff00000000000000),
+     (0x0000000000ff0000, 0x0000ff0000000000),
+     (0x000000ff00000000, 0x00000000ff000000),
+     (0x00ff000000000000, 0x000000000000ff00)],
+    [(0xff00000000000000, 0x0000000000ff0000),
+     (0x0000ff0000000000, 0x000000ff00000000),
+     (0x00000000ff000000, 0x00ff000000000000),
+     (0x000000000000ff00, 0xff00000000000000),
+     (0x00000000000000ff, 0x0000ff0000000000),
+     (0x0000000000ff0000, 0x00000000ff000000),
+     (0x000000ff00000000, 0x000000000000ff00),
+     (0x00ff000000000000, 0x00000000000000ff)],
+]
+
+_shz = [(0x0c, 0x07, 0x38), (0x10, 0x11, 0x18), (0x06, 0x17, 0x08), (0x03, 0x06, 0x28),
+        (0x26, 0x0e, 0x38), (0x12, 0x0a, 0x18), (0x0c, 0x07, 0x08), (0x16, 0x07, 0x28)]
+
+_table0 = numpy.array([0x00, 0x28, 0x18, 0x08, 0x20, 0x38, 0x10, 0x30], dtype=numpy.uint64)
+_table1 = numpy.array([0x38, 0x20, 0x30, 0x10, 0x28, 0x00, 0x08, 0x18], dtype=numpy.uint64)
+
+_blocksizes = [0x40, 0x80]
+
+# number of blocks decrypted at once, bounds the size of temporary arrays
+_slab_blocks = 4096
+
+
+def _isi_key(enctype, key):
+    ret = 0
+    for n in range(8):
+        mask4, mask5 = _keyz_masks[enctype][n]
+        shz = _shz[n]
+
+        # the C version computes t1 and t2 here and applies key ^= t2
+        # twice, which leaves key unchanged, so they are left out
+        if n == 0:
+            t3 = (key & mask4) >> shz[2]
+        elif n in (1, 6, 7):
+            t3 = (ret & mask4) >> shz[2]
+        else:
+            t3 = ((ret & mask4) << shz[2]) & _M64
+        ret = (t3 ^ (key & mask5)) | ret
+    return ret
+
+
+def _keystream(enctype, key, pos, count):
+    """Returns the keystream for ``count`` bytes starting at ``pos``
+    within a block encrypted with ``key``"""
+
+    if enctype == 0:
+        shifts = _table0[(numpy.arange(pos, pos + count, dtype=numpy.uint64) & numpy.uint64(7))]
+        return ((numpy.uint64(key) >> shifts) & numpy.uint64(0xff)).astype(numpy.uint8)
+    else:
+        return numpy.uint8((key >> int(_table1[key & 7])) & 0xff)
+
+
+def _gather_bits(c, bit, first):
+    """Collects bit ``bit`` of the bytes ``c`` at positions ``first``,
+    ``first + 1``, ... in a 64 bit word, positions wrap around at 64"""
+
+    bits = ((c >> numpy.uint8(bit)) & numpy.uint8(1)).astype(numpy.uint64)
+    positions = (numpy.arange(first, first + len(c), dtype=numpy.uint64) & numpy.uint64(0x3f))
+    return int(numpy.bitwise_or.reduce(bits << positions)) if len(c) else 0
+
+
+class CryptContext:
+
+    """CryptContext(key, sign, length, skip, encrypt)
+
+    Encrypts or decrypts ``length`` bytes of data, excluding the 16 byte
+    header, that are passed in chunks of arbitrary size to update()."""
+
+    def __init__(self, key, sign, length, skip, encrypt):
+        if skip not in (0, 4):
+            raise RuntimeError("only skip values of 0 and 4 are supported")
+        if length < 0:
+            raise ValueError("length must not be negative")
+        if sign not in _enctypes:
+            raise RuntimeError("unknown game signature")
+
+        skip = min(skip, length)
+
+        self._enctype = _enctypes[sign]
+        self._encrypt = bool(encrypt)
+        self._blocksz = _blocksizes[self._enctype]
+        self._key = _isi_key(self._enctype, key)
+        self._t = 0
+        self._bit = 0
+        self._block = 0
+        self._pos = 0
+        self._i = 0
+        self._left = (length - skip) % self._blocksz
+        self._skip = skip
+        self._busy = False
+        self.remaining = length
+
+    def _start_block(self):
+        self._key ^= self._t
+        self._t = 0
+        self._block += 1
+        self._bit = self._block & 7
+        self._i = 0
+        self._left = self._blocksz
+
+    def _crypt_segment(self, output, data):
+        """Processes ``data``, which must fit into the current block"""
+
+        count = len(data)
+        result = data ^ _keystream(self._enctype, self._key, self._pos, count)
+        c = result if self._encrypt else data
+        self._t |= (_gather_bits(c, self._bit, self._i) << self._bit) & _M64
+        output[:] = result
+
+        self._i += count
+        self._left -= count
+        self._pos += count
+
+    def _decrypt_blocks(self, output, data):
+        """Decrypts a run of full blocks, starting at a block boundary"""
+
+        blocksz = self._blocksz
+        nblocks = len(data) // blocksz
+        blocks = data.reshape(nblocks, blocksz)
+
+        numbers = numpy.arange(self._block + 1, self._block + 1 + nblocks, dtype=numpy.uint64)
+        bitnums = (numbers & numpy.uint64(7)).astype(numpy.uint8)
+
+        # t of each block, bytes 64 apart end up in the same bit
+        bits = (blocks >> bitnums[:, None]) & numpy.uint8(1)
+        if blocksz == 0x80:
+            bits = bits[:, :64] | bits[:, 64:]
+        words = numpy.packbits(bits, axis=1, bitorder="little").view("<u8").ravel()
+        ts = words << bitnums.astype(numpy.uint64)
+
+        # the key of each block is the first key XORed with the t of all previous blocks
+        keys = numpy.empty(nblocks, dtype=numpy.uint64)
+        keys[0] = self._key ^ self._t
+        keys[1:] = ts[:-1]
+        keys = numpy.bitwise_xor.accumulate(keys)
+
+        if self._enctype == 0:
+            positions = numpy.arange(self._pos, self._pos + blocksz, dtype=numpy.uint64) & numpy.uint64(7)
+            stream = (keys[:, None] >> _table0[positions][None, :]) & numpy.uint64(0xff)
+        else:
+            stream = ((keys >> _table1[keys & numpy.uint64(7)]) & numpy.uint64(0xff))[:, None]
+
+        output[:] = (blocks ^ stream.astype(numpy.uint8)).ravel()
+
+        self._key = int(keys[-1])
+        self._t = int(ts[-1])
+        self._block += nblocks
+        self._bit = self._block & 7
+        self._i = blocksz
+        self._left = 0
+        self._pos += nblocks * blocksz
+
+    def _process(self, output, data):
+        if self._busy:
+            raise RuntimeError("CryptContext is in use by another thread")
+        if len(data) > self.remaining:
+            raise ValueError("more data than announced in the length")
+
+        self._busy = True
+        try:
+            # the skipped bytes at the start are passed through unchanged
+            n = min(len(data), self._skip)
+            output[:n] = data[:n]
+            self._skip -= n
+
+            length = len(data)
+            while n < length:
+                if self._left == 0:
+                    nblocks = min((length - n) // self._blocksz, _slab_blocks)
+                    if not self._encrypt and nblocks > 0:
+                        end = n + nblocks * self._blocksz
+                        self._decrypt_blocks(output[n:end], data[n:end])
+                        n = end
+                        continue
+                    self._start_block()
+
+                end = n + min(self._left, length - n)
+                self._crypt_segment(output[n:end], data[n:end])
+                n = end
+
+            self.remaining -= length
+        finally:
+            self._busy = False
+
+    def update(self, data):
+        """Encrypt or decrypt the next chunk of data"""
+        data = numpy.frombuffer(data, dtype=numpy.uint8)
+        output = numpy.empty_like(data)
+        self._process(output, data)
+        return output.tobytes()
+
+    def update_into(self, output, data):
+        """Like update(), but writes into ``output``, which may be ``input`` itself"""
+        data = numpy.frombuffer(data, dtype=numpy.uint8)
+        output = _writable(output, len(data))
+        self._process(output[:len(data)], data)
+        return len(data)
+
+    def finalize(self):
+        """Check that all data has been processed"""
+        if self.remaining != 0:
+            raise RuntimeError("data incomplete, %d bytes missing" % self.remaining)
+        return b""
+
+
+def _writable(output, length):
+    if memoryview(output).readonly:
+        raise TypeError("output buffer must be writable")
+    output = numpy.frombuffer(output, dtype=numpy.uint8)
+    if len(output) < length:
+        raise ValueError("output buffer too small, %d bytes required" % length)
+    return output
+
+
+def _check_decrypt_length(data):
+    if len(data) < 16:
+        raise RuntimeError("input to small for decryption, must be at least 16 bytes")
+
+
+def encrypt_into(output, data, key, sign, skip):
+    """Encrypt ``input`` into the ``len(input) + 16`` bytes at the start of ``output``"""
+    data = numpy.frombuffer(data, dtype=numpy.uint8)
+    context = CryptContext(key, sign, len(data), skip, True)
+    output = _writable(output, len(data) + 16)
+    output[:16] = numpy.frombuffer(struct.pack("<QQ", sign ^ key, key), dtype=numpy.uint8)
+    context.update_into(output[16:], data)
+    return len(data) + 16
+
+
+def decrypt_into(output, data, skip):
+    """Decrypt ``input`` into the ``len(input) - 16`` bytes at the start of
+    ``output``, which may be ``input`` itself"""
+    data = numpy.frombuffer(data, dtype=numpy.uint8)
+    _check_decrypt_length(data)
+    sign, key = struct.unpack("<QQ", data[:16].tobytes())
+    context = CryptContext(key, sign ^ key, len(data) - 16, skip, False)
+    output = _writable(output, len(data) - 16)
+    context.update_into(output, data[16:])
+    return len(data) - 16
+
+
+def encrypt(data, key, sign, skip):
+    """Encrypt the given data"""
+    output = bytearray(len(memoryview(data).cast("B")) + 16)
+    encrypt_into(output, data, key, sign, skip)
+    return bytes(output)
+
+
+def decrypt(data, skip):
+    """Decrypt the given data"""
+    _check_decrypt_length(memoryview(data).cast("B"))
+    output = bytearray(len(memoryview(data).cast("B")) - 16)
+    decrypt_into(output, data, skip)
+    return bytes(output)
+
+
+# EOF #
@@ -14,10 +14,50 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import struct
+import collections
+import itertools
 import os
+import struct
+import tempfile
+import threading
+
+# available implementations of encrypt/decrypt, the first one is the default
+crypt_backends = collections.OrderedDict()
+
+try:
+    import rfactortools._crypt
+    crypt_backends["c"] = rfactortools._crypt
+except ImportError:
+    pass
+
+try:
+    import rfactortools._crypt_numpy
+    crypt_backends["numpy"] = rfactortools._crypt_numpy
+except ImportError:
+    pass
+
+_crypt_backend = next(iter(crypt_backends), None)
+
+
+def get_crypt_backend():
+    """Returns the name of the crypt backend in use"""
+    return _crypt_backend
+
+
+def set_crypt_backend(name):
+    """Selects the crypt backend ``name`` from ``crypt_backends``"""
+    global _crypt_backend
+    if name not in crypt_backends:
+        raise RuntimeError("unknown or unavailable crypt backend '%s', available: %s" %
+                           (name, ", ".join(crypt_backends)))
+    _crypt_backend = name
+
+
+def _backend():
+    if _crypt_backend is None:
+        raise RuntimeError("no crypt backend available, neither the _crypt extension nor numpy could be loaded")
+    return crypt_backends[_crypt_backend]
 
-import rfactortools._crypt
 
 games = \
     {
@@ -32,41 +72,232 @@ games = \
     }
 
 
+def _is_encrypted_with(head, length, key, sign, skip):
+    """Returns True if the data of size ``length`` starting with
+    ``head`` is encrypted with ``key`` and ``sign`` and nothing else.
+    The inner layer is checked by decrypting the first 32 bytes of
+    ``head``, so it doesn't need to contain more."""
+
+    if crypt_info(head) != (sign, key):
+        return False
+
+    context = _backend().CryptContext(key, sign, length - 16, skip, False)
+    inner = context.update(memoryview(head)[16:32])
+    return not games.get(crypt_info(inner)[0])
+
+
+def _transcode_action(head, length, key, sign, skip):
+    """Returns the action transcode() takes on the data of size
+    ``length`` starting with ``head``"""
+
+    if _is_encrypted_with(head, length, key, sign, skip):
+        return "passthrough"
+    elif games.get(crypt_info(head)[0]):
+        return "reencrypted"
+    else:
+        return "encrypted"
+
+
+def transcode(data, key=1, sign=0x4b1dca9f960524e8, skip=0):
+    """Brings ``data`` into the encryption given by ``key`` and
+    ``sign``, inspecting the signature and walking the layers of
+    encryption only once. Returns the result together with the action
+    taken: "passthrough" when ``data`` was already encrypted that way
+    and is returned untouched, "encrypted" for plain data and
+    "reencrypted" for data that had a different encryption."""
+
+    action = _transcode_action(data, len(data), key, sign, skip)
+    if action == "passthrough":
+        return data, action
+    else:
+        return _backend().encrypt(decrypt_data(data, skip), key, sign, skip), action
+
+
 def encrypt_data(data, key, sign, skip):
-    data = decrypt_data(data, skip)
-    return rfactortools._crypt.encrypt(data, key, sign, skip)
+    return transcode(data, key, sign, skip)[0]
 
 
 def decrypt_data(data, skip):
+    """Removes all layers of encryption from ``data``, which can be
+    any bytes-like object. Unencrypted data is returned as is, the
+    first layer is decrypted into a new bytearray and all further
+    layers are decrypted in place."""
+
     sign, key = crypt_info(data)
-    while games.get(sign):
-        data = rfactortools._crypt.decrypt(data, skip)
-        sign, key = crypt_info(data)
-    return data
+    if not games.get(sign):
+        return data
 
+    buf = bytearray(len(data) - 16)
+    length = _backend().decrypt_into(buf, data, skip)
+    with memoryview(buf) as view:
+        while games.get(crypt_info(view[:length])[0]):
+            length = _backend().decrypt_into(view, view[:length], skip)
+    del buf[length:]
+    return buf
 
-def encrypt_file(input, output, key=1, sign=0x4b1dca9f960524e8):
-    skip = get_skip(input)
-    with open(input, 'rb') as fin:
-        data = fin.read()
 
-    data = decrypt_data(data, skip)
+class MASEncryptor:
+
+    """
+    Encrypts the entries of a .mas file with ``key`` and ``sign``
+    while they are packed, for use as ``transform`` in
+    mas_pack_from_iter(). ``actions`` counts the entries, and loose
+    files passed to encrypt_file(), by the action taken, see
+    transcode().
+    """
+
+    def __init__(self, key=1, sign=0x4b1dca9f960524e8):
+        self.key = key
+        self.sign = sign
+        self.actions = collections.Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, action):
+        with self._lock:
+            self.actions[action] += 1
 
-    encrypted_data = encrypt_data(data, key, sign, skip)
+    def __call__(self, name, data):
+        data, action = transcode(data, self.key, self.sign, get_skip(name))
+        self._count(action)
+        return data
 
-    with open(output, 'wb') as fout:
-        fout.write(encrypted_data)
+    def encrypt_file(self, input, output):
+        """Encrypts the loose file ``input`` to ``output`` with
+        encrypt_file(), counting the action like for entries"""
 
+        self._count(encrypt_file(input, output, self.key, self.sign))
+
+    def cache_key(self, name):
+        return ("encrypt", self.key, self.sign, get_skip(name))
+
+    def cached(self, name, data):
+        """Counts the action for ``data`` whose result was found in the
+        cache, only the header of ``data`` is looked at"""
+
+        self._count(_transcode_action(memoryview(data)[:32], len(data), self.key, self.sign, get_skip(name)))
+
+    def entries(self, mas):
+        """Yields the entries of the MASArchive ``mas`` as (name, data)
+        tuples. Entries that already are encrypted with ``key`` and
+        ``sign`` would come out of encrypt_data() unchanged, they are
+        passed through with their original compressed data as
+        MASCompressedEntry instead of being inflated, reencrypted and
+        compressed again."""
+
+        for entry in mas:
+            if _is_encrypted_with(mas.peek(entry, 32), entry.size, self.key, self.sign, get_skip(entry.name)):
+                self._count("passthrough")
+                yield mas.compressed_entry(entry)
+            else:
+                yield entry.name, mas.read(entry)
+
+
+def _split_header(chunks):
+    """Splits the first 16 bytes off the iterable ``chunks``, returns
+    them together with an iterator over the rest"""
+
+    chunks = iter(chunks)
+    header = b""
+    for chunk in chunks:
+        n = 16 - len(header)
+        header += chunk[:n]
+        if len(header) == 16:
+            return header, itertools.chain([memoryview(chunk)[n:]], chunks)
+    return header, chunks
+
+
+def _crypt_chunks(context, chunks):
+    for chunk in chunks:
+        if chunk:
+            view = memoryview(chunk)
+            if view.readonly:
+                yield context.update(view)
+            else:
+                context.update_into(view, view)
+                yield view
+    context.finalize()
+
+
+def decrypt_chunks(chunks, length, skip):
+    """Removes all layers of encryption from the data in ``chunks`` of
+    total size ``length`` on the fly, returns the length of the
+    decrypted data together with an iterator over its chunks. Writable
+    chunks are decrypted in place."""
+
+    while True:
+        header, chunks = _split_header(chunks)
+        sign, key = crypt_info(header)
+        if not games.get(sign):
+            return length, itertools.chain([header], chunks)
+
+        length -= 16
+        context = _backend().CryptContext(key, sign, length, skip, False)
+        chunks = _crypt_chunks(context, chunks)
+
+
+def encrypt_chunks(chunks, length, key, sign, skip):
+    """Encrypts the plain data in ``chunks`` of total size ``length``
+    on the fly, yields the encrypted chunks including the header.
+    Writable chunks are encrypted in place."""
+
+    context = _backend().CryptContext(key, sign, length, skip, True)
+    yield struct.pack("<QQ", sign ^ key, key)
+    yield from _crypt_chunks(context, chunks)
+
+
+def _read_chunks(fin, chunk_size):
+    """Yields the content of ``fin`` in chunks, the chunks share a
+    single buffer and are only valid until the next one is read"""
+
+    buf = bytearray(chunk_size)
+    with memoryview(buf) as view:
+        while True:
+            n = fin.readinto(buf)
+            if not n:
+                break
+            yield view[:n]
+
+
+def _write_chunks(output, chunks):
+    """Writes ``chunks`` to a temporary file next to ``output`` that
+    replaces ``output`` once complete, so ``output`` may be the input"""
+
+    fd, tmpfile = tempfile.mkstemp(prefix=".rfactortools", dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        with os.fdopen(fd, "wb") as fout:
+            for chunk in chunks:
+                fout.write(chunk)
+        os.replace(tmpfile, output)
+    except BaseException:
+        os.remove(tmpfile)
+        raise
+
+
+def encrypt_file(input, output, key=1, sign=0x4b1dca9f960524e8, chunk_size=1024 * 1024):
+    """Streaming version of transcode(), returns the action taken"""
 
-def decrypt_file(input, output):
     skip = get_skip(input)
     with open(input, 'rb') as fin:
-        data = fin.read()
+        length = os.fstat(fin.fileno()).st_size
+        if _is_encrypted_with(fin.read(32), length, key, sign, skip):
+            if not (os.path.exists(output) and os.path.samefile(input, output)):
+                fin.seek(0)
+                _write_chunks(output, _read_chunks(fin, chunk_size))
+            return "passthrough"
+
+        fin.seek(0)
+        plain_length, chunks = decrypt_chunks(_read_chunks(fin, chunk_size), length, skip)
+        _write_chunks(output, encrypt_chunks(chunks, plain_length, key, sign, skip))
 
-    data = decrypt_data(data, skip)
+    return "encrypted" if plain_length == length else "reencrypted"
 
-    with open(output, 'wb') as fout:
-        fout.write(data)
+
+def decrypt_file(input, output, chunk_size=1024 * 1024):
+    skip = get_skip(input)
+    with open(input, 'rb') as fin:
+        length = os.fstat(fin.fileno()).st_size
+        length, chunks = decrypt_chunks(_read_chunks(fin, chunk_size), length, skip)
+        _write_chunks(output, chunks)
 
 
 def crypt_info(data):
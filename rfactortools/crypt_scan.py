@@ -0,0 +1,148 @@
+# Bulk scanning of encryption signatures
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import rfactortools
+
+
+class CryptInfoCache:
+
+    """
+    Caches the signatures found in files in a JSON file, keyed by
+    path, size and mtime, so rescanning unchanged files only costs a
+    stat() call.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        if os.path.exists(filename):
+            try:
+                with open(filename, "r") as fin:
+                    self._entries = json.load(fin)
+            except ValueError:
+                logging.warning("%s: ignoring broken cache file", filename)
+
+    def get(self, path, st, kind):
+        with self._lock:
+            record = self._entries.get(path)
+            if record is not None and \
+               record["kind"] == kind and \
+               record["size"] == st.st_size and \
+               record["mtime"] == st.st_mtime_ns:
+                self.hits += 1
+                return record["results"]
+            else:
+                self.misses += 1
+                return None
+
+    def put(self, path, st, kind, results):
+        with self._lock:
+            self._entries[path] = {"kind": kind, "size": st.st_size, "mtime": st.st_mtime_ns, "results": results}
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmpfile = tempfile.mkstemp(prefix=".rfactortools", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as fout:
+                json.dump(self._entries, fout)
+            os.replace(tmpfile, self.filename)
+        except BaseException:
+            os.remove(tmpfile)
+            raise
+
+
+def _scan_file(path, st):
+    with open(path, "rb") as fin:
+        return [[None, st.st_size] + list(rfactortools.crypt_info(fin.read(16)))]
+
+
+def _scan_mas(path):
+    try:
+        with rfactortools.MASArchive(path) as mas:
+            return [[entry.name, entry.size] + list(rfactortools.crypt_info(mas.peek(entry, 16)))
+                    for entry in mas]
+    except (struct.error, zlib.error) as err:
+        raise RuntimeError("broken .mas file: %s" % err) from err
+
+
+def scan_crypt_info(paths, mas_entries=False, jobs=16, cache=None):
+    """Reads the encryption signature of all files in ``paths``,
+    directories are searched recursively. With ``mas_entries`` the
+    entries of .mas files are scanned instead of the .mas files
+    themselves. Returns a list of dicts with the keys file, entry,
+    size, sign, key, game and error. Files that can't be read give a
+    single dict with the message in error, which is None otherwise."""
+
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames += rfactortools.find_files(path)
+        else:
+            filenames.append(path)
+
+    def scan(path):
+        try:
+            st = os.stat(path)
+            kind = "mas" if mas_entries and path.lower().endswith(".mas") else "file"
+
+            results = cache.get(path, st, kind) if cache is not None else None
+            if results is None:
+                results = _scan_mas(path) if kind == "mas" else _scan_file(path, st)
+                if cache is not None:
+                    cache.put(path, st, kind, results)
+        except (OSError, ValueError, RuntimeError) as err:
+            logging.error("%s: couldn't scan file: %s", path, err)
+            return [{"file": path, "entry": None, "size": 0, "sign": None, "key": None, "game": None,
+                     "error": str(err)}]
+
+        return [{"file": path, "entry": entry, "size": size, "sign": sign, "key": key,
+                 "game": rfactortools.games.get(sign), "error": None}
+                for entry, size, sign, key in results]
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return [result for results in executor.map(scan, filenames) for result in results]
+
+
+def summarize_crypt_info(results):
+    """Aggregates the results of scan_crypt_info() by game, returns a
+    dict mapping the game name, or None for unknown signatures, to the
+    number of files and their total size. Files that couldn't be read
+    are counted last under "error"."""
+
+    summary = collections.OrderedDict()
+    for result in sorted(results, key=lambda r: (r["error"] is not None, r["game"] is None, r["game"] or "")):
+        group = "error" if result["error"] is not None else result["game"]
+        count, size = summary.get(group, (0, 0))
+        summary[group] = (count + 1, size + result["size"])
+    return summary
+
+
+# EOF #
@@ -15,12 +15,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import hashlib
 import io
 import logging
 import os
 import pathlib
 import re
 import shutil
+import threading
 
 import rfactortools
 
@@ -109,11 +111,12 @@ def find_track_directory(gdb_filename):
         return result
 
 
-def find_data_directories(directory):
+def find_data_directories(directory, tree=None):
     """Returns the ``GameData/`` directory inside of ``directory``, throws
     exception when more then one ``GameData/`` is found, return
     ``None``, if none is found (not an error, as tracks don't contain
-    a ``GameData/``)
+    a ``GameData/``). ``tree`` is an optional DirectoryTree of
+    ``directory`` to walk instead of the disk.
     """
 
     basedir = os.path.basename(directory)
@@ -122,19 +125,20 @@ def find_data_directories(directory):
     else:
         gamedata_dirs = set()
         track_dirs = set()
-        for path, dirs, files in os.walk(directory):
-            for d in list(dirs):
-                if d.lower() == "gamedata":
-                    gamedata_dirs.add(os.path.join(path, d))
-                    dirs.remove(d)
-
-            for f in files:
-                rest, ext = os.path.splitext(f)
-                if ext.lower() == ".gdb":
-                    try:
-                        track_dirs.add(find_track_directory(os.path.join(path, f)))
-                    except Exception:
-                        logging.exception("track directory location failed")
+
+        def prune(entry):
+            if entry.name.lower() == "gamedata":
+                gamedata_dirs.add(entry.path)
+                return True
+            else:
+                return False
+
+        walk = tree.walk if tree is not None else rfactortools.walk
+        for entry in walk(directory, exts=[".gdb"], prune=prune):
+            try:
+                track_dirs.add(find_track_directory(entry.path))
+            except Exception:
+                logging.exception("track directory location failed")
 
         return gamedata_dirs, track_dirs
 
@@ -153,6 +157,142 @@ class rFactorToGSC2013Config:
         self.fix_light_intensity = True
         self.copy_missing_textures = True
 
+        # compression of repacked .mas files, see MASCompressionPolicy
+        self.mas_compression_level = -1
+        self.mas_compression_strategy = "default"
+        self.mas_store_extensions = []
+        self.mas_min_gain = 0.0
+
+        # directory for caching compressed .mas entries between runs,
+        # within a run duplicate entries are always only processed once
+        self.mas_cache_directory = None
+
+        # number of threads used to scan the source directory, more
+        # than one only pays off on network storage
+        self.walk_jobs = 1
+
+        # number of files converted in parallel
+        self.jobs = 1
+
+        # skip files whose output in the target directory is up to
+        # date according to the build manifest stored there
+        self.incremental = True
+
+        # file to write the time spent on each converted file to as CSV
+        self.stats_csv = None
+
+    def fingerprint(self):
+        """Returns a hash of the settings that affect the converted files"""
+        settings = sorted((k, v) for k, v in vars(self).items() if k not in _unfingerprinted_settings)
+        return hashlib.sha1(repr(settings).encode("utf-8")).hexdigest()
+
+
+# settings that don't change the output of a conversion
+_unfingerprinted_settings = ["mas_cache_directory", "walk_jobs", "jobs", "incremental", "stats_csv"]
+
+# name of the build manifest in the target directory
+manifest_filename = "rfactortools-manifest.json"
+
+# name of the summary of ConversionStats written to the target directory
+stats_filename = "rfactortools-stats.json"
+
+# handlers of rFactorToGSC2013.convert_file() by extension, other files are copied
+_file_handlers = {
+    ".gdb": "gdb", ".veh": "veh", ".scn": "scn", ".aiw": "aiw", ".gmt": "gmt",
+    ".tdf": "tdf", ".mas": "mas", ".sfx": "sfx", ".tga": "tga", ".jpg": "jpg",
+    ".gfx": "gfx",
+}
+
+
+def file_handler(filename):
+    """Returns the name of the handler converting ``filename``, "ignored"
+    for files that are left out and "copy" for files copied unchanged"""
+
+    if filename.lower() in rfactortools.exclude_files:
+        return "ignored"
+    else:
+        return _file_handlers.get(os.path.splitext(filename)[1].lower(), "copy")
+
+
+def _fix_light_intensity(line, filename):
+    m = _directional_light_regex.match(line)
+    if m:
+        try:
+            intensity = float(m.group(1))
+            if intensity > 1.0:
+                intensity = 0.9
+                line = _light_intensity_regex.sub(r'Intensity=(%f)' % intensity, line)
+        except ValueError:
+            logging.exception("%s: couldn't parse light intensity: %s", filename, m.group(1))
+    return line
+
+
+_directional_light_regex = re.compile(r'\s*Type=Directional.*Intensity=\(([0-9.]+)\).*')
+_light_intensity_regex = re.compile(r'Intensity=\([^\)]*\)', re.IGNORECASE)
+
+
+class ConversionRules:
+
+    """
+    The line rewrite rules for .veh, .gdb and track .scn files,
+    compiled once from ``cfg``
+    """
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+
+        gdb_rules = [rfactortools.Rule("filter properties", r'Filter Properties *=.*',
+                                       r'Filter Properties = %s' % cfg.track_filter_properties, re.IGNORECASE)]
+        if cfg.track_category:
+            gdb_rules.append(rfactortools.Rule("venuename", r'^(\s*)VenueName\s*=\s*(.*)',
+                                               r'\1VenueName = %s, \2' % cfg.track_category, re.IGNORECASE))
+        self.gdb = rfactortools.RuleSet(gdb_rules)
+
+        scn_rules = []
+        if cfg.fix_light_intensity:
+            scn_rules.append(rfactortools.FunctionRule("Type=Directional", _fix_light_intensity))
+        self.track_scn = rfactortools.RuleSet(scn_rules)
+
+        # reiza5 (Mini Challenge) is needed for the cars to show up in the car list
+        self._classes_rules = []
+        if cfg.clear_classes:
+            self._classes_rules.append(rfactortools.Rule('classes="', r'^Classes=".*',
+                                                         r'Classes="%s"' % cfg.reiza_class,
+                                                         re.IGNORECASE, anchored=True))
+        elif cfg.reiza_class:
+            self._classes_rules.append(rfactortools.Rule('classes="', r'^Classes="',
+                                                         r'Classes="%s,' % cfg.reiza_class,
+                                                         re.IGNORECASE, anchored=True))
+
+        self._category_rules = []
+        if cfg.vehicle_category:
+            self._category_rules.append(rfactortools.Rule('category="', r'^Category="([^"]*)"',
+                                                          r'Category="%s, \1"' % cfg.vehicle_category,
+                                                          re.IGNORECASE, anchored=True))
+
+        self._veh = {}
+        self._lock = threading.Lock()
+
+    def veh(self, mod_name):
+        """Returns the RuleSet for the .veh files of ``mod_name``"""
+
+        with self._lock:
+            rules = self._veh.get(mod_name)
+            if rules is None:
+                # Adding a suffix to Team is needed as conflicts in
+                # Team names lead to cars getting sorted into the
+                # wrong hierachy (e.g. a F1 car would show up in the
+                # wrong year of F1, as multiple F1 years share the
+                # same team names). Without a suffix the rule still
+                # normalizes the case of ``Team=``.
+                team_suffix = " %s" % mod_name if self.cfg.unique_team_names else ""
+                team_rule = rfactortools.Rule('team="', r'^Team="([^"]*)"', r'Team="\1%s"' % team_suffix,
+                                              re.IGNORECASE, anchored=True)
+
+                rules = rfactortools.RuleSet(self._classes_rules + [team_rule] + self._category_rules)
+                self._veh[mod_name] = rules
+            return rules
+
 
 class rFactorToGSC2013:
 
@@ -163,35 +303,38 @@ class rFactorToGSC2013:
     def __init__(self, source_directory, cfg):
         self.source_directory = os.path.normpath(source_directory)
         self.cfg = cfg or rFactorToGSC2013Config()
+
+        # the source directory is only walked once, all later traversals use the snapshot
+        self.source_tree = rfactortools.DirectoryTree(self.source_directory, jobs=self.cfg.walk_jobs)
         self.source_gamedata_directories, self.source_track_directories \
-            = find_data_directories(self.source_directory)
+            = find_data_directories(self.source_directory, self.source_tree)
+
+        self.mas_policy = rfactortools.MASCompressionPolicy(level=self.cfg.mas_compression_level,
+                                                            strategy=self.cfg.mas_compression_strategy,
+                                                            store_extensions=self.cfg.mas_store_extensions,
+                                                            min_gain=self.cfg.mas_min_gain)
+        self.mas_cache = rfactortools.MASBlobCache(self.cfg.mas_cache_directory)
+        self.mas_encryptor = rfactortools.MASEncryptor()
+        self.rules = ConversionRules(self.cfg)
 
         self.progress_cb = lambda *args: None
+        self.scheduler = None
+        self.manifest = None
+        self.stats = None
         if not self.source_gamedata_directories and not self.source_track_directories:
             raise Exception("couldn't locate 'GameData/' or track directory")
 
     def report_progress(self, *args):
-        self.progress_cb(*args)
+        if self.scheduler is not None:
+            self.scheduler.report(*args)
+        else:
+            self.progress_cb(*args)
 
     def print_info(self, fout):
         fout.write("GameData: \"%s\"\n" % self.source_gamedata_directories)
 
     def convert_gdb(self, filename, target_file):
-        with rfactortools.open_read(filename) as fin:
-            lines = fin.readlines()
-
-        with open(target_file, "wt", newline='\r\n', encoding="latin-1", errors="replace") as fout:
-            for line in lines:
-                line = re.sub(r'Filter Properties *=.*',
-                              r'Filter Properties = %s' % self.cfg.track_filter_properties,
-                              line, flags=re.IGNORECASE)
-
-                if self.cfg.track_category:
-                    line = re.sub(r'^(\s*)VenueName\s*=\s*(.*)',
-                                  r'\1VenueName = %s, \2' % self.cfg.track_category,
-                                  line, flags=re.IGNORECASE)
-
-                fout.write(line)
+        self.rules.gdb.rewrite_file(filename, target_file)
 
         if self.cfg.copy_missing_textures:
             missing_textures = ["racegroove.dds", "skidhard.dds",
@@ -210,26 +353,7 @@ class rFactorToGSC2013:
                                           source_tex_file, target_tex_file)
 
     def convert_track_scn(self, source_file, target_file, modname):
-        with rfactortools.open_read(source_file) as fin:
-            lines = fin.readlines()
-
-        with open(target_file, "wt", newline='\r\n', encoding="latin-1", errors="replace") as fout:
-            for line in lines:
-                # fix light intensity
-                if self.cfg.fix_light_intensity:
-                    m = re.match(r'\s*Type=Directional.*Intensity=\(([0-9.]+)\).*', line)
-                    if m:
-                        try:
-                            intensity = float(m.group(1))
-                            if intensity > 1.0:
-                                intensity = 0.9
-                                line = re.sub(r'Intensity=\([^\)]*\)',
-                                              r'Intensity=(%f)' % intensity,
-                                              line, flags=re.IGNORECASE)
-                        except ValueError:
-                            logging.exception("%s: couldn't parse light intensity: %s", source_file, m.group(1))
-
-                fout.write(line)
+        self.rules.track_scn.rewrite_file(source_file, target_file)
 
     def convert_scn(self, source_file, target_file, modname):
         if rfactortools.file_exists(source_file[:-4] + ".gdb"):
@@ -258,60 +382,26 @@ class rFactorToGSC2013:
             img.save(target_mini_file)
 
     def convert_veh(self, source_file, target_file, mod_name):
-        with rfactortools.open_read(source_file) as fin:
-            lines = fin.readlines()
-
-        if self.cfg.unique_team_names:
-            team_suffix = " %s" % mod_name
-        else:
-            team_suffix = ""
-
-        with open(target_file, "wt", newline='\r\n', encoding="latin-1", errors="replace") as fout:
-            for line in lines:
-                # reiza5 (Mini Challenge) is needed for the cars to
-                # show up in the car list
-                if self.cfg.clear_classes:
-                    line = re.sub(r'^Classes=".*',
-                                  r'Classes="%s"' % self.cfg.reiza_class,
-                                  line, flags=re.IGNORECASE)
-                elif self.cfg.reiza_class:
-                    line = re.sub(r'^Classes="',
-                                  r'Classes="%s,' % self.cfg.reiza_class,
-                                  line, flags=re.IGNORECASE)
-
-                # Adding a suffix to Team is needed as conflicts in
-                # Team names lead to cars getting sorted into the
-                # wrong hierachy (e.g. a F1 car would show up in the
-                # wrong year of F1, as multiple F1 years share the
-                # same team names)
-                line = re.sub(r'^Team="([^"]*)"',
-                              r'Team="\1%s"' % team_suffix,
-                              line, flags=re.IGNORECASE)
-
-                if self.cfg.vehicle_category:
-                    line = re.sub(r'^Category="([^"]*)"',
-                                  r'Category="%s, \1"' % self.cfg.vehicle_category,
-                                  line, flags=re.IGNORECASE)
-
-                fout.write(line)
+        self.rules.veh(mod_name).rewrite_file(source_file, target_file)
 
     def convert_gmt(self, source_file, target_file):
-        rfactortools.encrypt_file(source_file, target_file)
+        self.mas_encryptor.encrypt_file(source_file, target_file)
 
     def convert_mas(self, source_file, target_file):
-        logging.info("mas unpacking %s", source_file)
-        mas_content = rfactortools.mas_unpack_to_data(source_file)
-        self.report_progress()
-
-        logging.info("encrypting files")
-        encrypted_mas_content = []
-        for i, (name, data) in enumerate(mas_content):
+        logging.info("mas repacking %s", source_file)
+        with rfactortools.MASArchive(source_file) as mas:
             self.report_progress()
-            logging.debug("processing %d/%d: %s", i, len(mas_content), name)
-            encrypted_data = rfactortools.encrypt_data(data, 1, 0x4b1dca9f960524e8, rfactortools.get_skip(name))
-            encrypted_mas_content.append((name, encrypted_data))
 
-        rfactortools.mas_pack_from_data(encrypted_mas_content, target_file)
+            def entries():
+                for i, entry in enumerate(self.mas_encryptor.entries(mas)):
+                    self.report_progress()
+                    logging.debug("processing %d/%d: %s", i, len(mas), mas.file_table[i].name)
+                    yield entry
+
+            rfactortools.mas_pack_from_iter(entries(), target_file, count=len(mas),
+                                            policy=self.mas_policy,
+                                            cache=self.mas_cache,
+                                            transform=self.mas_encryptor)
 
     def convert_tdf(self, source_file, target_file):
         shutil.copy(source_file, target_file)
@@ -325,14 +415,11 @@ class rFactorToGSC2013:
         if not os.path.isdir(target_directory):
             os.makedirs(os.path.normpath(target_directory))
 
-        for path, dirs, files in os.walk(source_directory):
-            relpath = os.path.relpath(path, source_directory)
-
-            for d in dirs:
-                t = os.path.join(target_directory, relpath, d)
-                logging.info("creating %s", t)
-                if not os.path.isdir(t):
-                    os.mkdir(t)
+        for entry in self.source_tree.walk(source_directory, exts=[], include_dirs=True):
+            t = os.path.join(target_directory, os.path.relpath(entry.path, source_directory))
+            logging.info("creating %s", t)
+            if not os.path.isdir(t):
+                os.mkdir(t)
 
     def convert_jpg(self, source_file, target_file):
         is_track_loading = bool(source_file.lower().endswith("_loading.jpg") and
@@ -359,118 +446,191 @@ class rFactorToGSC2013:
             shutil.copy(source_file, target_file)
 
     def convert_gamedata(self, source_directory, target_directory):
-        for fname in os.listdir(source_directory):
-            path = os.path.join(source_directory, fname)
+        step = rfactortools.PlanStep(source_directory)
+        self.plan_gamedata(step, source_directory, target_directory)
+        self.convert_step_files(step)
+
+    def convert_toplevel_subdir(self, source_directory, target_directory, dname):
+        step = rfactortools.PlanStep(os.path.join(source_directory, dname))
+        self.plan_toplevel_subdir(step, source_directory, target_directory, dname)
+        self.convert_step_files(step)
 
-            if os.path.isdir(path):
-                self.convert_toplevel_subdir(source_directory, target_directory, fname)
-            elif os.path.isfile(path):
-                self.convert_file(source_directory, target_directory, fname)
+    def convert_mod_subdir(self, source_directory, target_directory, dname, modname):
+        step = rfactortools.PlanStep(os.path.join(source_directory, dname))
+        self.plan_mod_subdir(step, source_directory, target_directory, dname, modname)
+        self.convert_step_files(step)
+
+    def convert_step_files(self, step):
+        """Converts the files of ``step``, queued on the scheduler during
+        convert_all() and right away otherwise"""
+
+        total = sum(f.cost for f in step.files)
+        completed = 0
+        for f in step.files:
+            completed += f.cost
+            if self.scheduler is not None:
+                self.scheduler.submit(self.convert_planned_file, f, completed, total)
+            else:
+                self.convert_planned_file(f, completed, total)
+
+    def plan_gamedata(self, step, source_directory, target_directory):
+        for entry in self.source_tree.scan_directory(source_directory):
+            if entry.is_dir:
+                self.plan_toplevel_subdir(step, source_directory, target_directory, entry.name)
+            elif entry.is_file:
+                self.plan_file(step, source_directory, target_directory, entry.name, None, entry)
             else:
-                logging.error("%s: ignoring unknown file", path)
+                logging.error("%s: ignoring unknown file", entry.path)
 
-    def convert_toplevel_subdir(self, source_directory, target_directory, dname):
+    def plan_toplevel_subdir(self, step, source_directory, target_directory, dname):
         """Convert ``Vehicles``, ``Locations``, etc."""
 
         source = os.path.join(source_directory, dname)
 
-        for fname in os.listdir(source):
-            path = os.path.join(source, fname)
-
-            if os.path.isdir(path):
-                self.convert_mod_subdir(source_directory, target_directory, os.path.join(dname, fname), fname)
-            elif os.path.isfile(path):
-                self.convert_file(source_directory, target_directory, os.path.join(dname, fname), None)
+        for entry in self.source_tree.scan_directory(source):
+            if entry.is_dir:
+                self.plan_mod_subdir(step, source_directory, target_directory,
+                                     os.path.join(dname, entry.name), entry.name)
+            elif entry.is_file:
+                self.plan_file(step, source_directory, target_directory, os.path.join(dname, entry.name), None,
+                               entry)
             else:
-                logging.error("%s: ignoring unknown file", path)
+                logging.error("%s: ignoring unknown file", entry.path)
 
-    def convert_mod_subdir(self, source_directory, target_directory, dname, modname):
+    def plan_mod_subdir(self, step, source_directory, target_directory, dname, modname):
         """Convert ``Vehicles/some_mod/``, ``Locations/some_mod``, etc."""
 
         source = os.path.join(source_directory, dname)
 
-        for path, dirs, files in os.walk(source):
-            relpath = os.path.relpath(path, source)
-
-            for fname in files:
-                self.convert_file(source_directory, target_directory,
-                                  os.path.normpath(os.path.join(dname, relpath, fname)), modname)
+        for entry in self.source_tree.walk(source):
+            self.plan_file(step, source_directory, target_directory,
+                           os.path.normpath(os.path.join(dname, os.path.relpath(entry.path, source))), modname,
+                           entry)
+
+    def plan_file(self, step, source_directory, target_directory, filename, modname=None, entry=None):
+        source_file = os.path.join(source_directory, filename)
+        handler = file_handler(filename)
+        try:
+            size = entry.stat().st_size if entry is not None else os.path.getsize(source_file)
+        except OSError:
+            size = 0
+        cost = rfactortools.estimate_cost(handler, source_file, size)
+        step.files.append(rfactortools.PlannedFile(source_directory, target_directory, filename, modname,
+                                                   handler, size, cost))
 
     def convert_file(self, source_directory, target_directory, filename, modname=None):
         logging.info("processing '%s' of mod '%s'", filename, modname)
         self.report_progress("file", modname, filename)
 
-        if filename.lower() in rfactortools.exclude_files:
+        timer = rfactortools.Timer()
+        handler = file_handler(filename)
+        if handler == "ignored":
+            self.record_stats(handler, modname, filename, "ignored", timer)
             self.report_progress("file_ignored", modname, filename)
         else:
             source_file = os.path.join(source_directory, filename)
             target_file = os.path.join(target_directory, filename)
 
+            if self.manifest is not None:
+                fingerprint = "%s:%s" % (self.fingerprint, modname)
+                if self.cfg.incremental and self.manifest.is_uptodate(target_file, source_file, fingerprint):
+                    self.record_stats(handler, modname, filename, "uptodate", timer)
+                    self.report_progress("file_uptodate", modname, filename)
+                    return
+
             try:
-                ext = os.path.splitext(filename)[1].lower()
-                if ext == ".gdb":
-                    self.convert_gdb(source_file, target_file)
-                elif ext == ".veh":
-                    self.convert_veh(source_file, target_file, modname)
-                elif ext == ".scn":
-                    self.convert_scn(source_file, target_file, modname)
-                elif ext == ".aiw":
-                    self.convert_aiw(source_file, target_file)
-                elif ext == ".gmt":
-                    self.convert_gmt(source_file, target_file)
-                elif ext == ".tdf":
-                    self.convert_tdf(source_file, target_file)
-                elif ext == ".mas":
-                    self.convert_mas(source_file, target_file)
-                elif ext == ".sfx":
-                    self.convert_sfx(source_file, target_file, modname)
-                elif ext == ".tga":
-                    self.convert_tga(source_file, target_file)
-                elif ext == ".jpg":
-                    self.convert_jpg(source_file, target_file)
-                elif ext == ".gfx":
-                    pass
-                else:
-                    shutil.copy(source_file, target_file)
+                # the timer also collects the CPU time of the .mas compression workers
+                with timer:
+                    self.run_handler(handler, source_file, target_file, modname)
 
             except Exception:
                 logging.exception("%s: %s: rfactortools.convert_file failed", source_file, target_file)
+                self.record_stats(handler, modname, filename, "error", timer, source_file, target_file)
                 self.report_progress("file_error", modname, filename)
 
             else:
+                if self.manifest is not None:
+                    self.manifest.record(target_file, source_file, fingerprint)
+                self.record_stats(handler, modname, filename, "done", timer, source_file, target_file)
                 self.report_progress("file_done", modname, filename)
 
-    def convert_all(self, target_directory):
-        self.report_progress("start")
+    def run_handler(self, handler, source_file, target_file, modname):
+        """Converts ``source_file`` to ``target_file`` with ``handler``, see file_handler()"""
+
+        if handler == "gdb":
+            self.convert_gdb(source_file, target_file)
+        elif handler == "veh":
+            self.convert_veh(source_file, target_file, modname)
+        elif handler == "scn":
+            self.convert_scn(source_file, target_file, modname)
+        elif handler == "aiw":
+            self.convert_aiw(source_file, target_file)
+        elif handler == "gmt":
+            self.convert_gmt(source_file, target_file)
+        elif handler == "tdf":
+            self.convert_tdf(source_file, target_file)
+        elif handler == "mas":
+            self.convert_mas(source_file, target_file)
+        elif handler == "sfx":
+            self.convert_sfx(source_file, target_file, modname)
+        elif handler == "tga":
+            self.convert_tga(source_file, target_file)
+        elif handler == "jpg":
+            self.convert_jpg(source_file, target_file)
+        elif handler == "gfx":
+            pass
+        else:
+            shutil.copy(source_file, target_file)
+
+    def record_stats(self, handler, modname, filename, status, timer, source_file=None, target_file=None):
+        if self.stats is not None:
+            bytes_in = bytes_out = 0
+            if source_file is not None and os.path.isfile(source_file):
+                bytes_in = os.path.getsize(source_file)
+            if target_file is not None and os.path.isfile(target_file):
+                bytes_out = os.path.getsize(target_file)
+            self.stats.record(handler, modname, filename, status, timer, bytes_in, bytes_out)
+
+    def convert_planned_file(self, f, completed, total):
+        self.convert_file(f.source_directory, f.target_directory, f.filename, f.modname)
+        self.report_progress("progress", completed, total)
+
+    def convert_planned_file_failed(self, err, f, completed, total):
+        """Reports ``f`` as failed when convert_planned_file() raised ``err``"""
+
+        self.record_stats(f.handler, f.modname, f.filename, "error", rfactortools.Timer())
+        self.report_progress("file_error", f.modname, f.filename)
+        self.report_progress("progress", completed, total)
+
+    def plan(self, target_directory):
+        """Returns the ConversionPlan for converting to ``target_directory``,
+        without touching the target directory"""
 
         target_directory = os.path.normpath(target_directory)
+        plan = rfactortools.ConversionPlan(target_directory)
 
         # convert GameData/ directories
         for d in self.source_gamedata_directories:
-            self.report_progress("directory", d)
-
-            self.source_gamedata_directory = os.path.normpath(d)
+            source_gamedata_directory = os.path.normpath(d)
+            step = rfactortools.PlanStep(d, source_gamedata_directory)
 
             if self.cfg.single_gamedata:
                 target_gamedata_directory = os.path.join(target_directory, "GameData")
             else:
                 target_gamedata_directory = os.path.join(target_directory,
-                                                         os.path.relpath(self.source_gamedata_directory,
+                                                         os.path.relpath(source_gamedata_directory,
                                                                          self.source_directory))
 
-            logging.info("converting GameData %s to %s", self.source_gamedata_directory, target_gamedata_directory)
-
-            self.copy_directory_hierachy(self.source_gamedata_directory, target_gamedata_directory)
-            self.convert_gamedata(self.source_gamedata_directory, target_gamedata_directory)
+            logging.info("planning GameData %s to %s", source_gamedata_directory, target_gamedata_directory)
 
-            try:
-                rfactortools.process_gen_directory(target_gamedata_directory, True, io.StringIO())
-            except Exception:
-                logging.exception("rfactortools.process_gen_directory")
+            step.hierachies.append((source_gamedata_directory, target_gamedata_directory))
+            self.plan_gamedata(step, source_gamedata_directory, target_gamedata_directory)
+            step.gen_directory = target_gamedata_directory
+            plan.steps.append(step)
 
         # convert tracks that don't have a toplevel GameData/ directory
         for d, prefix in self.source_track_directories:
-            self.report_progress("directory", d)
+            step = rfactortools.PlanStep(d)
 
             logging.debug("track: prefix:\"%s\" - directory:\"%s\"", prefix, d)
             source_directory = os.path.normpath(d)
@@ -483,15 +643,15 @@ class rFactorToGSC2013:
                                                                          self.source_directory),
                                                          "GameData")
 
-            logging.info("converting track %s to %s", source_directory, target_gamedata_directory)
+            logging.info("planning track %s to %s", source_directory, target_gamedata_directory)
             # create directory hierachy
             modname = os.path.basename(d)
             if prefix:
-                self.copy_directory_hierachy(source_directory,
-                                             os.path.join(target_gamedata_directory, "Locations", prefix, modname))
+                step.hierachies.append((source_directory,
+                                        os.path.join(target_gamedata_directory, "Locations", prefix, modname)))
             else:
-                self.copy_directory_hierachy(source_directory,
-                                             os.path.join(target_gamedata_directory, "Locations", modname))
+                step.hierachies.append((source_directory,
+                                        os.path.join(target_gamedata_directory, "Locations", modname)))
 
             logging.debug("modname: %s", modname)
             if prefix:
@@ -500,8 +660,82 @@ class rFactorToGSC2013:
                 target_d = os.path.join(target_gamedata_directory, "Locations")
             logging.debug("track: source_directory: %s", source_directory)
             logging.debug("track: target_directory: %s", target_d)
-            self.convert_mod_subdir(os.path.dirname(source_directory), target_d, modname, modname)
+            self.plan_mod_subdir(step, os.path.dirname(source_directory), target_d, modname, modname)
+            plan.steps.append(step)
+
+        return plan
+
+    def convert_all(self, target_directory, plan=None):
+        """Converts everything to ``target_directory`` following ``plan``,
+        which is created with plan() if not given"""
+
+        if plan is None:
+            plan = self.plan(target_directory)
+
+        self.scheduler = rfactortools.ConversionScheduler(self.cfg.jobs, lambda *args: self.progress_cb(*args),
+                                                          self.convert_planned_file_failed)
+        self.manifest = rfactortools.BuildManifest(os.path.join(target_directory, manifest_filename))
+        self.fingerprint = self.cfg.fingerprint()
+        self.stats = rfactortools.ConversionStats()
+        try:
+            self.execute_plan(plan)
+        finally:
+            self.scheduler.shutdown()
+            self.scheduler = None
+            self.stats.finish()
+
+            # also keeps the files done so far of a failed or canceled conversion
+            if os.path.isdir(target_directory):
+                self.manifest.save()
+                self.stats.write_json(os.path.join(target_directory, stats_filename))
+            if self.cfg.stats_csv:
+                self.stats.write_csv(self.cfg.stats_csv)
+
+    def execute_plan(self, plan):
+        self.report_progress("start")
+
+        total = plan.total_cost
+        completed = 0
+        self.report_progress("progress", completed, total)
 
+        for step in plan.steps:
+            self.report_progress("directory", step.directory)
+
+            if step.gamedata_directory is not None:
+                self.source_gamedata_directory = step.gamedata_directory
+
+            for source, target in step.hierachies:
+                self.copy_directory_hierachy(source, target)
+
+            for f in step.files:
+                completed += f.cost
+                self.scheduler.submit(self.convert_planned_file, f, completed, total)
+
+            if step.gen_directory is not None:
+                self.scheduler.wait()
+                timer = rfactortools.Timer()
+                try:
+                    rfactortools.process_gen_directory(step.gen_directory, True, io.StringIO())
+                except Exception:
+                    logging.exception("rfactortools.process_gen_directory")
+                    self.stats.record("gen_check", None, step.gen_directory, "error", timer)
+                else:
+                    self.stats.record("gen_check", None, step.gen_directory, "done", timer)
+
+        self.scheduler.wait()
+
+        logging.info("build manifest: %d up to date, %d converted", self.manifest.uptodate, self.manifest.converted)
+        logging.info("mas cache: %d hits, %d misses", self.mas_cache.hits, self.mas_cache.misses)
+        actions = self.mas_encryptor.actions
+        logging.info("encryption: %d passthrough, %d encrypted, %d reencrypted",
+                     actions["passthrough"], actions["encrypted"], actions["reencrypted"])
+
+        self.stats.finish()
+        for handler, counters in sorted(self.stats.handlers.items()):
+            logging.info("%s: %d files, %.2fs wall, %.2fs cpu, %d bytes in, %d bytes out",
+                         handler, counters["count"], counters["wall"], counters["cpu"],
+                         counters["bytes_in"], counters["bytes_out"])
+        self.report_progress("stats", self.stats.summary())
         self.report_progress("finished")
 
 
@@ -27,22 +27,18 @@ class GTR2ToGSC2013:
     def __init__(self, gtr2_directory, source_directory):
         self.gtr2_directory = os.path.normpath(gtr2_directory)
         self.source_directory = os.path.normpath(source_directory)
+        self.mas_encryptor = rfactortools.MASEncryptor()
 
     def convert_gtr(self, source_file, target_file):
-        logging.info("mas unpacking %s", source_file)
-        mas_content = rfactortools.mas_unpack_to_data(source_file)
+        logging.info("mas repacking %s", source_file)
 
         # TOOD: This doesn't work .gmt files have different formats in
         # GSC2013 and rFactor and need to be converted first.
 
-        logging.info("encrypting files")
-        encrypted_mas_content = []
-        for i, (name, data) in enumerate(mas_content):
-            logging.debug("processing %d/%d: %s", i, len(mas_content), name)
-            encrypted_data = rfactortools.encrypt_data(data, 1, 0x4b1dca9f960524e8, rfactortools.get_skip(name))
-            encrypted_mas_content.append((name, encrypted_data))
-
-        rfactortools.mas_pack_from_data(encrypted_mas_content, target_file)
+        with rfactortools.MASArchive(source_file) as mas:
+            # entries are encrypted in the worker threads of the packer
+            rfactortools.mas_pack_from_iter(self.mas_encryptor.entries(mas), target_file, count=len(mas),
+                                            transform=self.mas_encryptor)
 
     def convert_trk(self, source_file, target_file):
         with rfactortools.open_read(source_file) as fin:
@@ -86,5 +82,9 @@ class GTR2ToGSC2013:
 
                 print("%s -> %s" % (source_file, target_file))
 
+        actions = self.mas_encryptor.actions
+        print("mas encryption: %d passthrough, %d encrypted, %d reencrypted" %
+              (actions["passthrough"], actions["encrypted"], actions["reencrypted"]))
+
 
 # EOF #
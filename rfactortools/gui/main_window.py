@@ -166,6 +166,12 @@ class MainWindow(tk.Tk):
         self.track_filter_properties_entry = tk.Entry(self.option_frame, textvariable=self.track_filter_properties)
         self.track_filter_properties_entry.grid(column=3, row=3, sticky=W)
 
+        self.jobs = tk.IntVar(value=defaults.jobs)
+        self.jobs_label = tk.Label(self.option_frame, text="Parallel Jobs:")
+        self.jobs_label.grid(column=2, row=4, sticky=E)
+        self.jobs_spinbox = tk.Spinbox(self.option_frame, from_=1, to=64, width=4, textvariable=self.jobs)
+        self.jobs_spinbox.grid(column=3, row=4, sticky=W)
+
         # Buttons
         self.button_frame = tk.Frame(self)
         self.button_frame.grid(column=0, row=3, columnspan=3, sticky=W+E+N+S)
@@ -235,6 +241,11 @@ class MainWindow(tk.Tk):
 
             cfg.track_filter_properties = self.track_filter_properties.get().strip()
 
+            try:
+                cfg.jobs = max(1, self.jobs.get())
+            except tk.TclError:
+                logging.error("invalid number of jobs, converting serially")
+
             self.app.start_conversion(self.source_directory.get(), self.target_directory.get(), cfg)
 
     def do_veh_tree(self):
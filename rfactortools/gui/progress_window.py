@@ -17,6 +17,7 @@
 
 from tkinter import N, S, W, E
 import queue
+import time
 import tkinter as tk
 
 
@@ -82,12 +83,16 @@ class ProgressWindow(tk.Toplevel):
         confirm_button_frame = tk.Frame(frame)
         confirm_button_frame.pack(side=tk.RIGHT)
 
+        status = tk.Label(frame, anchor=W)
+        status.pack(side=tk.LEFT, padx=8)
+
         cancel_btn = tk.Button(confirm_button_frame)
         cancel_btn["text"] = "Cancel"
         cancel_btn["command"] = self.on_cancel
         cancel_btn.grid(column=3, row=0, sticky=S, pady=8, padx=8)
 
         self.cancel_btn = cancel_btn
+        self.status = status
         self.text = text
 
     def on_cancel(self):
@@ -105,8 +110,18 @@ class ProgressWindow(tk.Toplevel):
 
         if msg == "start":
             self.conversion_had_errors = False
+            self.start_time = time.time()
+
+        elif msg == "progress":
+            completed, total = args
+            if total and completed:
+                elapsed = time.time() - self.start_time
+                remaining = int(elapsed * (total - completed) / completed)
+                self.status["text"] = "%d%% done, about %d:%02d remaining" % \
+                    (100 * completed // total, remaining // 60, remaining % 60)
 
         elif msg == "finished":
+            self.status["text"] = "100% done"
             self.cancel_btn["text"] = "Finish"
             self.cancel_btn["command"] = self.on_finish
             self.cancel_btn.config(state=tk.NORMAL)
@@ -140,6 +155,21 @@ class ProgressWindow(tk.Toplevel):
             self.text.config(state=tk.DISABLED)
             self.conversion_had_errors = True
 
+        elif msg == "stats":
+            summary, = args
+            totals = summary["totals"]
+            self.text.config(state=tk.NORMAL)
+            self.text.insert(tk.END, "\n%d files, %d bytes in, %d bytes out, %.1fs\n" %
+                             (totals["count"], totals["bytes_in"], totals["bytes_out"], summary["wall"]))
+            for handler, counters in sorted(summary["handlers"].items(), key=lambda item: -item[1]["wall"]):
+                self.text.insert(tk.END, "  %-10s %5d files %8.1fs\n" % (handler, counters["count"], counters["wall"]))
+            self.text.config(state=tk.DISABLED)
+
+        elif msg == "file_uptodate":
+            self.text.config(state=tk.NORMAL)
+            self.text.insert(tk.END, "up to date\n")
+            self.text.config(state=tk.DISABLED)
+
         elif msg == "file_done":
             self.text.config(state=tk.NORMAL)
             self.text.insert(tk.END, "done\n")
@@ -0,0 +1,161 @@
+# Build manifest for incremental conversions
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+
+def hash_file(filename, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(filename, "rb") as fin:
+        while True:
+            chunk = fin.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildManifest:
+
+    """
+    Records for every output file below the directory of ``filename``
+    the source it was built from (path, size, mtime and hash), a
+    fingerprint of the settings used and the size and mtime of the
+    output itself. An output is up to date when all of them still
+    match, a source with a new mtime but unchanged content is fine.
+    """
+
+    version = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.directory = os.path.dirname(os.path.abspath(filename))
+        self.uptodate = 0
+        self.converted = 0
+
+        self._lock = threading.Lock()
+        self._outputs = {}
+        self._touched = set()
+
+        if os.path.exists(filename):
+            try:
+                with open(filename, "r") as fin:
+                    content = json.load(fin)
+                if content.get("version") == self.version:
+                    self._outputs = content["outputs"]
+            except (ValueError, KeyError, AttributeError):
+                logging.warning("%s: ignoring broken build manifest", filename)
+
+    def _key(self, target):
+        return os.path.relpath(os.path.abspath(target), self.directory)
+
+    def is_uptodate(self, target, source, fingerprint):
+        """Returns True if ``target`` was built from the current content
+        of ``source`` with settings matching ``fingerprint``, an
+        unreadable ``source`` or ``target`` is never up to date"""
+
+        key = self._key(target)
+        with self._lock:
+            record = self._outputs.get(key)
+        if record is None or \
+           record["source"] != os.path.abspath(source) or \
+           record["fingerprint"] != fingerprint:
+            return False
+
+        try:
+            st = os.stat(target)
+            source_st = os.stat(source)
+        except OSError:
+            return False
+
+        if [st.st_size, st.st_mtime_ns] != [record["target_size"], record["target_mtime"]] or \
+           source_st.st_size != record["size"]:
+            return False
+
+        if source_st.st_mtime_ns != record["mtime"]:
+            # touched, but maybe not changed
+            try:
+                if hash_file(source) != record["hash"]:
+                    return False
+            except OSError:
+                return False
+
+        with self._lock:
+            record["mtime"] = source_st.st_mtime_ns
+            self._touched.add(key)
+            self.uptodate += 1
+        return True
+
+    def record(self, target, source, fingerprint):
+        """Remembers that ``target`` has just been built from ``source``,
+        when ``source`` can't be read anymore ``target`` is forgotten
+        instead and gets rebuilt next time"""
+
+        key = self._key(target)
+        try:
+            st = os.stat(source)
+            record = {"source": os.path.abspath(source),
+                      "size": st.st_size,
+                      "mtime": st.st_mtime_ns,
+                      "hash": hash_file(source),
+                      "fingerprint": fingerprint,
+                      "target_size": None,
+                      "target_mtime": None}
+        except OSError as err:
+            logging.warning("%s: not recorded in build manifest: %s", target, err)
+            with self._lock:
+                self._outputs.pop(key, None)
+                self._touched.discard(key)
+            return
+
+        with self._lock:
+            self._outputs[key] = record
+            self._touched.add(key)
+            self.converted += 1
+
+    def save(self):
+        """Writes the manifest, the size and mtime of all outputs built or
+        checked since the last save() are taken from the disk now, so
+        changes made to them by later build steps are accepted"""
+
+        with self._lock:
+            for key in self._touched:
+                try:
+                    st = os.stat(os.path.join(self.directory, key))
+                except OSError:
+                    del self._outputs[key]
+                else:
+                    self._outputs[key]["target_size"] = st.st_size
+                    self._outputs[key]["target_mtime"] = st.st_mtime_ns
+            self._touched.clear()
+
+            fd, tmpfile = tempfile.mkstemp(prefix=".rfactortools", dir=self.directory)
+            try:
+                with os.fdopen(fd, "w") as fout:
+                    json.dump({"version": self.version, "outputs": self._outputs}, fout, indent=1, sort_keys=True)
+                os.replace(tmpfile, self.filename)
+            except BaseException:
+                os.remove(tmpfile)
+                raise
+
+
+# EOF #
@@ -15,13 +15,22 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from concurrent.futures import ThreadPoolExecutor
-import io
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import array
+import collections
+import hashlib
 import logging
+import mmap
 import os
+import shutil
 import struct
+import tempfile
+import threading
+import weakref
 import zlib
 
+import rfactortools
+
 
 mas_type0 = b"GMOTORMAS10\0\0\0\0\0"
 mas_type1 = b"\xC8\xCF\xD2\xD8\xCE\xD8\xE6\xC9\xCA\xDD\xD8\xBE\xBB\xA6\xBF\x90"
@@ -44,10 +53,46 @@ class MASFileType:
 
 class MASFileEntry:
 
+    __slots__ = ["type", "flags", "name", "offset", "size", "zsize"]
+
     def __init__(self, *args):
         self.type, self.flags, self.name, self.offset, self.size, self.zsize = args
 
 
+class MASFileTable:
+
+    """
+    Columnar storage for the file table of a .mas file, the numeric
+    fields are kept in arrays and MASFileEntry objects are only
+    created when entries are accessed. Behaves like a list of
+    MASFileEntry.
+    """
+
+    __slots__ = ["types", "flags", "names", "offsets", "sizes", "zsizes"]
+
+    def __init__(self, types, flags, names, offsets, sizes, zsizes):
+        self.types = array.array("B", types)
+        self.flags = array.array("B", flags)
+        self.names = list(names)
+        self.offsets = array.array("q", offsets)
+        self.sizes = array.array("q", sizes)
+        self.zsizes = array.array("q", zsizes)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        else:
+            return MASFileEntry(self.types[i], self.flags[i], self.names[i],
+                                self.offsets[i], self.sizes[i], self.zsizes[i])
+
+    def __iter__(self):
+        for args in zip(self.types, self.flags, self.names, self.offsets, self.sizes, self.zsizes):
+            yield MASFileEntry(*args)
+
+
 def get_mas_type(signature):
     if signature == mas_type0:
         return 0
@@ -87,87 +132,392 @@ def get_file_type(filename):
         return MASFileType.UNKNOWN
 
 
-def mas_pack_from_data(files, masfile, mas_type=1):
-    """files is a (filename, data) tuple"""
-    with open(masfile, "wb") as fout:
+def _mas_header_size(mas_type):
+    if mas_type == 1:
+        return 28
+    elif mas_type == 0 or mas_type == 3:
+        return 24
+    else:
+        raise RuntimeError("invalid mas_type: %s" % mas_type)
+
+
+def _write_mas_header(fout, mas_type, file_count, data_size):
+    if mas_type == 0:
+        fout.write(mas_type0)
+    elif mas_type == 1:
+        fout.write(mas_type1)
+    elif mas_type == 3:
+        fout.write(mas_type3)
+    else:
+        raise RuntimeError("invalid mas_type: %s" % mas_type)
+
+    if mas_type == 1:
+        fout.write(struct.pack("<4xll", file_count, data_size))
+    else:
+        fout.write(struct.pack("<ll", file_count, data_size))
+
+
+def _write_file_table(fout, mas_type, file_table):
+    for file_type, flags, name, offset, size, zsize in file_table:
+        logging.debug("%8d %8d %8d %s", offset, size, zsize, name)
+
+        name_bytes = name.encode("latin-1", "replace")
+
         if mas_type == 0:
-            fout.write(mas_type0)
+            fout.write(struct.pack("<4xlll240s", offset, size, zsize, name_bytes))
         elif mas_type == 1:
-            fout.write(mas_type1)
+            fout.write(struct.pack("<BBxx236slll4x", file_type, flags, name_bytes, offset, size, zsize))
+        elif mas_type == 2:
+            fout.write(struct.pack("<4x16slll4x", name_bytes, offset, size, zsize))
         elif mas_type == 3:
-            fout.write(mas_type3)
+            fout.write(struct.pack("<4xlll4x236s", offset, size, zsize, name_bytes))
         else:
-            raise RuntimeError("invalid mas_type: %s" % mas_type)
+            raise RuntimeError("invalid map_type")
 
-        if mas_type == 1:
-            base_offset = 28 + len(files) * 256
-        else:
-            base_offset = 24 + len(files) * 256
 
-        file_table = []
-        offset = 0
-        fout.seek(base_offset)
+class MASCompressedEntry:
 
-        compressed_files = []
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            for name, data in files:
-                logging.debug("compressing %s", name)
-                compressed_files.append((name, data, executor.submit(zlib.compress, data)))
-        compressed_files = [(name, data, deflated_data.result()) for name, data, deflated_data in compressed_files]
+    """A pack entry with already compressed data, the data is copied
+    into the archive as is"""
 
-        for name, data, deflated_data in compressed_files:
-            logging.debug("packing %s", name)
-            file_type = get_file_type(name)
-            flags = 0
+    def __init__(self, name, size, zdata):
+        self.name = name
+        self.size = size
+        self.zdata = zdata
 
-            # deflated_data = zlib.compress(data)
 
-            file_table.append((file_type, flags, name, offset, len(data), len(deflated_data)))
-            fout.write(deflated_data)
-            offset += len(deflated_data)
+def _entry_size(entry):
+    """Returns the uncompressed size of a pack entry, used for memory accounting"""
+    if isinstance(entry, str):
+        return os.path.getsize(entry)
+    elif isinstance(entry, MASCompressedEntry):
+        return len(entry.zdata)
+    else:
+        name, data = entry
+        return len(data)
 
-        data_size = offset
-        if mas_type == 1:
-            fout.seek(20)
-        else:
-            fout.seek(16)
-        fout.write(struct.pack("<ll", len(file_table), data_size))
 
-        # write file table to the start of the file
-        if mas_type == 1:
-            fout.seek(28)
+def _load_entry(entry):
+    """Returns a (name, data) tuple for a filename or a (name, data) tuple"""
+    if isinstance(entry, str):
+        logging.info("reading %s", entry)
+        with open(entry, "rb") as fin:
+            return os.path.basename(entry), fin.read()
+    else:
+        return entry
+
+
+compression_strategies = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED,
+}
+
+
+# formats that are compressed already and gain nothing from zlib
+precompressed_extensions = [".bik", ".jpg", ".png"]
+
+
+class MASCompressionPolicy:
+
+    """
+    Decides how the entries of a .mas file are compressed. Entries
+    are stored uncompressed (size == zsize) when their extension is in
+    ``store_extensions`` or when compression saves less then
+    ``min_gain`` (a fraction of the size). When ``probe_size`` is set,
+    the first ``probe_size`` bytes are compressed first and the entry
+    is stored right away if the probe doesn't reach ``min_gain``. That
+    is only a guess, so it is off by default.
+    """
+
+    def __init__(self, level=zlib.Z_DEFAULT_COMPRESSION, strategy="default",
+                 store_extensions=None, min_gain=0.0, probe_size=None):
+        if strategy not in compression_strategies:
+            raise RuntimeError("unknown compression strategy: %s" % strategy)
+
+        self.level = level
+        self.strategy = strategy
+        self.store_extensions = [ext.lower() for ext in store_extensions or []]
+        self.min_gain = min_gain
+        self.probe_size = probe_size
+
+    def _deflate(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, zlib.MAX_WBITS, 9,
+                                      compression_strategies[self.strategy])
+        return compressor.compress(data) + compressor.flush()
+
+    def _worth_it(self, size, zsize):
+        # a compressed entry must never have size == zsize, as that marks stored entries
+        return zsize < size and (size - zsize) >= size * self.min_gain
+
+    def settings(self, name):
+        """Returns everything that affects the compression of ``name``, for use in cache keys"""
+        return (self.level, self.strategy, self.min_gain, self.probe_size,
+                os.path.splitext(name)[1].lower() in self.store_extensions)
+
+    def compress(self, name, data):
+        """Returns the data to be written to the .mas file, which is
+        ``data`` itself when the entry is to be stored"""
+
+        if os.path.splitext(name)[1].lower() in self.store_extensions:
+            return data
+
+        if self.probe_size and len(data) > self.probe_size:
+            probe = data[:self.probe_size]
+            if not self._worth_it(len(probe), len(self._deflate(probe))):
+                return data
+
+        zdata = self._deflate(data)
+        if self._worth_it(len(data), len(zdata)):
+            return zdata
         else:
-            fout.seek(24)
-
-        for file_type, flags, name, offset, size, zsize in file_table:
-            logging.debug("%8d %8d %8d %s", offset, size, zsize, name)
-
-            name_bytes = name.encode("latin-1", "replace")
-
-            if mas_type == 0:
-                fout.write(struct.pack("<4xlll240s", offset, size, zsize, name_bytes))
-            elif mas_type == 1:
-                fout.write(struct.pack("<BBxx236slll4x", file_type, flags, name_bytes, offset, size, zsize))
-            elif mas_type == 2:
-                fout.write(struct.pack("<4x16slll4x", name_bytes, offset, size, zsize))
-            elif mas_type == 3:
-                fout.write(struct.pack("<4xlll4x236s", name_bytes, offset, size, zsize))
+            return data
+
+
+# size, zsize and CRC32 of zdata in front of each file of a MASBlobCache directory
+_blob_header = struct.Struct("<qqI")
+
+
+class MASBlobCache:
+
+    """
+    Content addressed cache of compressed entries. Keys are a hash of
+    the raw data together with everything that affects the result
+    (compression settings, encryption), so identical entries in
+    different archives are only processed once. With ``directory``
+    the cache is kept on disk and shared between runs, in memory at
+    most ``max_memory`` bytes are kept.
+    """
+
+    def __init__(self, directory=None, max_memory=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_memory = max_memory
+        self.hits = 0
+        self.misses = 0
+
+        self._blobs = collections.OrderedDict()
+        self._memory = 0
+        self._lock = threading.Lock()
+
+        if self.directory is not None and not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    @staticmethod
+    def key(data, settings):
+        digest = hashlib.sha1(repr(settings).encode("utf-8"))
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[0:2], key)
+
+    def get(self, key):
+        """Returns the (size, zdata) tuple for ``key`` or None"""
+
+        with self._lock:
+            result = self._blobs.get(key)
+            if result is not None:
+                self._blobs.move_to_end(key)
+                self.hits += 1
+                return result
+
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as fin:
+                    size, zsize, crc = _blob_header.unpack(fin.read(_blob_header.size))
+                    zdata = fin.read()
+                if len(zdata) != zsize or zlib.crc32(zdata) != crc:
+                    raise ValueError("expected %d bytes of data, got %d or a checksum mismatch" % (zsize, len(zdata)))
+                result = size, zdata
+            except FileNotFoundError:
+                pass
+            except (OSError, struct.error, ValueError) as err:
+                # left behind by a crash or a full disk, treated as miss
+                logging.warning("%s: removing broken cache file: %s", path, err)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
             else:
-                raise RuntimeError("invalid map_type")
+                self._remember(key, result)
+                with self._lock:
+                    self.hits += 1
+                return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, size, zdata):
+        result = size, bytes(zdata)
+        self._remember(key, result)
+
+        if self.directory is not None:
+            path = self._path(key)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            # unique, the cache directory may be shared with other processes
+            fd, tmpfile = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as fout:
+                    fout.write(_blob_header.pack(size, len(result[1]), zlib.crc32(result[1])))
+                    fout.write(result[1])
+                os.replace(tmpfile, path)
+            except BaseException:
+                os.remove(tmpfile)
+                raise
+
+    def _remember(self, key, result):
+        with self._lock:
+            if key not in self._blobs:
+                self._blobs[key] = result
+                self._memory += len(result[1])
+
+            while self._memory > self.max_memory and self._blobs:
+                _, (size, zdata) = self._blobs.popitem(last=False)
+                self._memory -= len(zdata)
+
+
+def _compress_entry(entry, policy, cache, transform):
+    if isinstance(entry, MASCompressedEntry):
+        logging.debug("passing through %s", entry.name)
+        return entry.name, entry.size, entry.zdata
+
+    name, data = _load_entry(entry)
+
+    if cache is not None:
+        settings = policy.settings(name)
+        if transform is not None:
+            settings += transform.cache_key(name)
+        key = cache.key(data, settings)
+        result = cache.get(key)
+        if result is not None:
+            logging.debug("reusing %s", name)
+            if transform is not None:
+                transform.cached(name, data)
+            size, zdata = result
+            return name, size, zdata
+
+    if transform is not None:
+        data = transform(name, data)
+
+    logging.debug("compressing %s", name)
+    zdata = policy.compress(name, data)
+
+    if cache is not None:
+        cache.put(key, len(data), zdata)
+
+    return name, len(data), zdata
+
+
+def _ordered_map(func, items, jobs, max_inflight, size_func):
+    """Applies ``func`` to ``items`` in a pool of ``jobs`` threads and
+    yields the results in input order. No new work is submitted while
+    more then ``max_inflight`` bytes, as reported by ``size_func``,
+    are in flight."""
+
+    func = rfactortools.worker_cpu_time(func)
+    pending = collections.deque()
+    inflight = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        try:
+            for item in items:
+                size = size_func(item)
+                while pending and inflight + size > max_inflight:
+                    future, future_size = pending.popleft()
+                    inflight -= future_size
+                    yield future.result()
+
+                pending.append((executor.submit(func, item), size))
+                inflight += size
+
+            while pending:
+                future, future_size = pending.popleft()
+                yield future.result()
+        except BaseException:
+            # don't start the work queued behind a failure or a
+            # consumer that stopped early
+            for future, future_size in pending:
+                future.cancel()
+            raise
+
+
+def _compress_entries(entries, policy, cache, transform, jobs, max_inflight):
+    """Yields (name, size, zdata) tuples in input order"""
+    return _ordered_map(lambda entry: _compress_entry(entry, policy, cache, transform),
+                        entries, jobs, max_inflight, _entry_size)
+
+
+def _write_entries(entries, fout, policy, cache, transform, jobs, max_inflight):
+    file_table = []
+    offset = 0
+    for name, size, zdata in _compress_entries(entries, policy, cache, transform, jobs, max_inflight):
+        logging.debug("packing %s", name)
+        file_table.append((get_file_type(name), 0, name, offset, size, len(zdata)))
+        fout.write(zdata)
+        offset += len(zdata)
+    return file_table, offset
+
+
+def mas_pack_from_iter(entries, masfile, mas_type=1, count=None, jobs=8, max_inflight=64 * 1024 * 1024,
+                       policy=None, cache=None, transform=None):
+    """Packs ``entries`` into ``masfile``. Each entry is either a
+    filename, a (name, data) tuple or a MASCompressedEntry. Entries
+    are compressed according to the MASCompressionPolicy ``policy`` in
+    a pool of ``jobs`` threads and written as soon as they are ready,
+    so peak memory is bound by ``max_inflight`` bytes instead of the
+    archive size.
+
+    ``transform`` is an optional callable (name, data) -> data that is
+    applied in the workers before compression. With a MASBlobCache
+    ``cache`` entries are looked up before being transformed and
+    compressed, ``transform`` then needs a ``cache_key(name)`` method
+    returning a tuple that identifies what it does to ``name`` and a
+    ``cached(name, data)`` method that is called instead of it when
+    the result is found in the cache.
+
+    The file table comes before the data, so the number of entries
+    has to be known up front to write the data in place. If
+    ``count`` is not given and ``entries`` has no len(), the
+    compressed data is spooled to a temporary file first."""
+
+    if count is None and hasattr(entries, "__len__"):
+        count = len(entries)
+
+    header_size = _mas_header_size(mas_type)
+    policy = policy or MASCompressionPolicy()
+
+    with open(masfile, "wb") as fout:
+        if count is not None:
+            fout.seek(header_size + count * 256)
+            file_table, data_size = _write_entries(entries, fout, policy, cache, transform, jobs, max_inflight)
+            if len(file_table) != count:
+                raise RuntimeError("%s: expected %d entries, got %d" % (masfile, count, len(file_table)))
+        else:
+            with tempfile.TemporaryFile() as spool:
+                file_table, data_size = _write_entries(entries, spool, policy, cache, transform, jobs, max_inflight)
+                fout.seek(header_size + len(file_table) * 256)
+                spool.seek(0)
+                shutil.copyfileobj(spool, fout, 1024 * 1024)
 
+        # write header and file table to the start of the file
+        fout.seek(0)
+        _write_mas_header(fout, mas_type, len(file_table), data_size)
+        _write_file_table(fout, mas_type, file_table)
 
-def mas_pack(files, masfile, mas_type):
-    files_with_data = []
 
-    for filename in files:
-        logging.info("reading %s", filename)
-        name = os.path.basename(filename)
+def mas_pack_from_data(files, masfile, mas_type=1, policy=None, cache=None):
+    """files is a (filename, data) tuple"""
+    mas_pack_from_iter(files, masfile, mas_type, policy=policy, cache=cache)
 
-        with open(filename, "rb") as fin:
-            data = fin.read()
-            files_with_data.append((name, data))
 
-    mas_pack_from_data(files_with_data, masfile, mas_type)
+def mas_pack(files, masfile, mas_type=1, jobs=8, max_inflight=64 * 1024 * 1024, policy=None, cache=None):
+    """Packs the list of filenames ``files`` into ``masfile``, files
+    are read lazily, so only ``max_inflight`` bytes are kept in memory"""
+    mas_pack_from_iter(files, masfile, mas_type, jobs=jobs, max_inflight=max_inflight, policy=policy, cache=cache)
 
 
 def mas_list(masfile, verbose=False, with_filename=False):
@@ -196,53 +546,325 @@ def mas_list(masfile, verbose=False, with_filename=False):
                 print(entry.name)
 
 
-def mas_unpack(masfile, outdir, verbose=False):
+def _inflate_entry(entry, data):
+    if entry.size != entry.zsize:
+        inflated_data = zlib.decompress(data)
+    else:
+        inflated_data = data
+
+    if len(inflated_data) != entry.size:
+        raise RuntimeError("invalid inflated size %d for %s should be %d" %
+                           (len(inflated_data), entry.name, entry.size))
+
+    return inflated_data
+
+
+def _read_entries(fin, file_table):
+    """Yields (entry, data) tuples with the compressed data of each entry"""
+    for entry in file_table:
+        fin.seek(entry.offset)
+        yield entry, fin.read(entry.zsize)
+
+
+def _unpacked_size(item):
+    entry, data = item
+    return entry.zsize + entry.size
+
+
+def _stream_entry(fin, entry, write, chunk_size):
+    """Inflates ``entry`` from ``fin`` and passes it to ``write`` in
+    chunks of at most ``chunk_size`` bytes, so memory use doesn't
+    depend on the size of the entry"""
+
+    fin.seek(entry.offset)
+
+    if entry.size != entry.zsize:
+        decompressor = zlib.decompressobj()
+    else:
+        decompressor = None
+
+    inflated_size = 0
+    remaining = entry.zsize
+    while remaining > 0:
+        chunk = fin.read(min(chunk_size, remaining))
+        if not chunk:
+            break  # truncated .mas file, caught by the size check below
+        remaining -= len(chunk)
+
+        if decompressor is None:
+            write(chunk)
+            inflated_size += len(chunk)
+        else:
+            while chunk:
+                data = decompressor.decompress(chunk, chunk_size)
+                write(data)
+                inflated_size += len(data)
+                chunk = decompressor.unconsumed_tail
+
+    if decompressor is not None:
+        data = decompressor.flush()
+        write(data)
+        inflated_size += len(data)
+
+        if not decompressor.eof:
+            raise RuntimeError("incomplete compressed data for %s" % entry.name)
+
+    if inflated_size != entry.size:
+        raise RuntimeError("invalid inflated size %d for %s should be %d" %
+                           (inflated_size, entry.name, entry.size))
+
+
+def _unpack_entry_to_file(masfile, entry, outfile, chunk_size):
+    with open(masfile, "rb") as fin, open(outfile, "wb") as fout:
+        _stream_entry(fin, entry, fout.write, chunk_size)
+
+
+def mas_unpack(masfile, outdir, verbose=False, jobs=1, chunk_size=1024 * 1024):
+    """Extracts all files from ``masfile`` into ``outdir``. Entries are
+    streamed in chunks of ``chunk_size`` bytes by a pool of ``jobs``
+    threads, each reading the archive on its own, so memory use is
+    independent of the size of the entries."""
+
+    def unpack_entry(entry):
+        outfile = os.path.join(outdir, entry.name)
+        logging.info("%8d %8d %8d %s", entry.offset, entry.size, entry.zsize, outfile)
+        _unpack_entry_to_file(masfile, entry, outfile, chunk_size)
+
+    def unpack_entries(entries):
+        # in archive order, so the last of several entries for the
+        # same file wins, like when unpacking serially
+        for entry in entries:
+            unpack_entry(entry)
+
     with open(masfile, "rb") as fin:
         file_table = mas_unpack_file_table(fin)
 
-        os.mkdir(outdir)
-        for entry in file_table:
-            fin.seek(entry.offset)
-            data = fin.read(entry.zsize)
-
-            outfile = os.path.join(outdir, entry.name)
-            logging.info("%8d %8d %8d %s", entry.offset, entry.size, entry.zsize, outfile)
-            with open(outfile, "wb") as fout:
-                if entry.size != entry.zsize:
-                    inflated_data = zlib.decompress(data)
+    # entries ending up in the same file, also on case insensitive
+    # filesystems, must not be written concurrently
+    groups = collections.OrderedDict()
+    for entry in file_table:
+        groups.setdefault(os.path.normcase(entry.name).lower(), []).append(entry)
+    for entries in groups.values():
+        if len(entries) > 1:
+            logging.warning("%s: %d entries named %s, the last one wins", masfile, len(entries), entries[-1].name)
+
+    os.mkdir(outdir)
+    for _ in _ordered_map(unpack_entries, groups.values(), jobs, jobs * chunk_size, lambda entries: chunk_size):
+        pass
+
+
+def mas_verify(masfile, chunk_size=1024 * 1024):
+    """Checks the integrity of ``masfile`` without writing anything:
+    the file table must be readable, all entries must lie within the
+    file and must not overlap, and every entry must inflate to its
+    recorded size. Returns a report as dict."""
+
+    report = {"file": masfile, "entries": 0, "size": 0, "errors": []}
+
+    def error(entry, msg):
+        report["errors"].append({"entry": entry.name if entry else None, "error": msg})
+
+    try:
+        with open(masfile, "rb") as fin:
+            file_size = os.fstat(fin.fileno()).st_size
+            report["size"] = file_size
+
+            file_table = mas_unpack_file_table(fin)
+            data_start = fin.tell()
+            report["entries"] = len(file_table)
+
+            valid = []
+            for entry in file_table:
+                if entry.size < 0 or entry.zsize < 0:
+                    error(entry, "negative size %d or zsize %d" % (entry.size, entry.zsize))
+                elif entry.offset < data_start or entry.offset + entry.zsize > file_size:
+                    error(entry, "data at %d-%d outside of data section %d-%d" %
+                          (entry.offset, entry.offset + entry.zsize, data_start, file_size))
                 else:
-                    inflated_data = data
+                    valid.append(entry)
 
-                if len(inflated_data) != entry.size:
-                    raise RuntimeError("invalid inflated size %d for %s should be %d" %
-                                       (len(inflated_data), entry.name, entry.size))
-                fout.write(inflated_data)
+            last = None
+            for entry in sorted(valid, key=lambda e: e.offset):
+                if entry.zsize == 0:
+                    continue
+                if last is not None and entry.offset < last.offset + last.zsize:
+                    error(entry, "data overlaps with %s" % last.name)
+                last = entry
 
+            for entry in valid:
+                try:
+                    _stream_entry(fin, entry, lambda data: None, chunk_size)
+                except Exception as e:
+                    error(entry, str(e))
 
-def mas_unpack_to_data(masfile):
-    with open(masfile, "rb") as fin:
-        file_table = mas_unpack_file_table(fin)
+    except Exception as e:
+        error(None, str(e))
 
-        results = []
+    report["ok"] = not report["errors"]
+    return report
+
+
+def mas_verify_tree(path, jobs=None):
+    """Verifies all .mas files below ``path`` (or ``path`` itself if
+    it is a file) in a pool of ``jobs`` processes, returns a list of
+    reports as produced by mas_verify()"""
+
+    if os.path.isdir(path):
+        masfiles = sorted(rfactortools.find_files(path, ".mas"))
+    else:
+        masfiles = [path]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(mas_verify, masfiles))
 
-        for entry in file_table:
-            fin.seek(entry.offset)
-            data = fin.read(entry.zsize)
 
-            logging.debug("%8d %8d %8d %s", entry.offset, entry.size, entry.zsize, entry.name)
+def mas_unpack_to_data(masfile, jobs=1, max_inflight=64 * 1024 * 1024):
+    """Returns the content of ``masfile`` as list of (name, data)
+    tuples, entries are inflated by a pool of ``jobs`` threads"""
 
-            if entry.size != entry.zsize:
-                inflated_data = zlib.decompress(data)
+    def unpack_entry(item):
+        entry, data = item
+        logging.debug("%8d %8d %8d %s", entry.offset, entry.size, entry.zsize, entry.name)
+        return entry.name, _inflate_entry(entry, data)
+
+    with open(masfile, "rb") as fin:
+        file_table = mas_unpack_file_table(fin)
+        return list(_ordered_map(unpack_entry, _read_entries(fin, file_table), jobs, max_inflight, _unpacked_size))
+
+
+class MASArchive:
+
+    """
+    Random access to the entries of a .mas file. The file table is
+    parsed once and the archive is memory mapped, so single entries
+    can be read without inflating the whole archive. Lookup by name
+    ignores case.
+
+    Stored entries and the data of compressed_entry() are returned as
+    zero-copy ``memoryview`` slices into the mapping. close() releases
+    them, so they can't be used after the archive is closed. Views
+    derived from them that are still alive make close() raise
+    BufferError and leave the mapping open, so it can be closed again
+    once they are gone. Leaving a ``with`` block by an exception never
+    raises BufferError.
+    """
+
+    def __init__(self, masfile):
+        self.filename = masfile
+        self._fin = open(masfile, "rb")
+        try:
+            self.file_table = mas_unpack_file_table(self._fin)
+            if os.fstat(self._fin.fileno()).st_size > 0:
+                self._mmap = mmap.mmap(self._fin.fileno(), 0, access=mmap.ACCESS_READ)
             else:
-                inflated_data = data
+                self._mmap = None
+        except Exception:
+            self._fin.close()
+            raise
 
-            if len(inflated_data) != entry.size:
-                raise RuntimeError("invalid inflated size %d for %s should be %d" %
-                                   (len(inflated_data), entry.name, entry.size))
+        self._views = weakref.WeakSet()
+        self._views_lock = threading.Lock()
 
-            results.append((entry.name, inflated_data))
+        self._index = {}
+        for i, name in enumerate(self.file_table.names):
+            # first entry wins when a name is not unique
+            self._index.setdefault(name.lower(), i)
 
-        return results
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # the traceback may still reference entries, the mapping
+            # then goes away with them instead of hiding the error
+            try:
+                self.close()
+            except BufferError:
+                self._mmap = None
+
+    def __len__(self):
+        return len(self.file_table)
+
+    def __iter__(self):
+        return iter(self.file_table)
+
+    def __contains__(self, name):
+        return name.lower() in self._index
+
+    def close(self):
+        try:
+            if self._mmap is not None:
+                with self._views_lock:
+                    views = list(self._views)
+                for view in views:
+                    try:
+                        view.release()
+                    except BufferError:
+                        pass  # in use right now, mmap.close() reports it
+                self._mmap.close()
+                self._mmap = None
+        finally:
+            self._fin.close()
+
+    def get_entry(self, name):
+        i = self._index.get(name.lower())
+        if i is None:
+            raise KeyError("%s: no entry named %s" % (self.filename, name))
+        else:
+            return self.file_table[i]
+
+    def _lookup(self, entry):
+        if isinstance(entry, str):
+            return self.get_entry(entry)
+        else:
+            return entry
+
+    def read_raw(self, entry):
+        """Returns the compressed data of ``entry`` as ``memoryview``,
+        ``entry`` is either a name or a MASFileEntry"""
+        entry = self._lookup(entry)
+        if entry.zsize == 0:
+            return memoryview(b"")
+        else:
+            view = memoryview(self._mmap)[entry.offset:entry.offset + entry.zsize]
+            with self._views_lock:
+                self._views.add(view)
+            return view
+
+    def read(self, entry):
+        """Returns the inflated data of ``entry``, ``entry`` is either a
+        name or a MASFileEntry"""
+        entry = self._lookup(entry)
+        raw = self.read_raw(entry)
+        if entry.size == entry.zsize:
+            return _inflate_entry(entry, raw)
+        else:
+            with raw:
+                return _inflate_entry(entry, raw)
+
+    def peek(self, entry, length):
+        """Returns the first ``length`` bytes of the inflated data of
+        ``entry``, only as much data as needed is inflated"""
+        entry = self._lookup(entry)
+        with self.read_raw(entry) as raw:
+            if entry.size == entry.zsize:
+                return bytes(raw[:length])
+            else:
+                decompressor = zlib.decompressobj()
+                head = b""
+                pos = 0
+                while len(head) < length and pos < len(raw) and not decompressor.eof:
+                    head += decompressor.decompress(raw[pos:pos + 4096], length - len(head))
+                    pos += 4096
+                return head
+
+    def compressed_entry(self, entry):
+        """Returns ``entry`` as MASCompressedEntry for repacking it
+        without inflating and recompressing"""
+        entry = self._lookup(entry)
+        return MASCompressedEntry(entry.name, entry.size, self.read_raw(entry))
 
 
 def mas_unpack_file_table(fin):
@@ -250,7 +872,7 @@ def mas_unpack_file_table(fin):
     mas_type = get_mas_type(signature)
 
     if mas_type == 5:  # empty file
-        return []
+        return MASFileTable([], [], [], [], [], [])
 
     if mas_type == 1:
         fin.seek(16)
@@ -262,47 +884,59 @@ def mas_unpack_file_table(fin):
         fin.seek(16)
         file_count, data_size = struct.unpack("<ll", fin.read(8))
 
+    # reject garbage counts before they turn into huge or negative reads
+    if file_count < 0:
+        raise RuntimeError("negative file count %d" % file_count)
+
+    toc_offset = fin.tell()
+    file_size = fin.seek(0, os.SEEK_END)
+    fin.seek(toc_offset)
+
     if mas_type == 4:
+        if toc_offset + data_size > file_size:
+            raise RuntimeError("compressed file table of %d bytes exceeds file size %d" % (data_size, file_size))
         mas_type = 1  # once uncompressed, IFD file behaves same as mas_type=1
-        toc = fin.read(data_size)
-        toc_in = io.BytesIO(zlib.decompress(toc))
+        toc = zlib.decompress(fin.read(data_size))
     else:
-        toc_in = fin
+        if toc_offset + file_count * 256 > file_size:
+            raise RuntimeError("file count %d exceeds file size %d" % (file_count, file_size))
+        toc = fin.read(file_count * 256)
 
-    file_table = []
-    for i in range(0, file_count):
-        if mas_type == 0:
-            offset, size, zsize, name = struct.unpack("<4xlll240s", toc_in.read(256))
-            entry = MASFileEntry(0,  # type
-                                 0,  # flags
-                                 name, offset, size, zsize)
-        elif mas_type == 1 or mas_type == 4:
-            entry = MASFileEntry(*struct.unpack("<BBxx236slll4x", toc_in.read(256)))
-        elif mas_type == 2:
-            name, offset, size, zsize = struct.unpack("<4x16slll4x", toc_in.read(256))
-            entry = MASFileEntry(0,  # type
-                                 0,  # flags
-                                 name, offset, size, zsize)
-        elif mas_type == 3:
-            name, offset, size, zsize = struct.unpack("<4xlll4x236s", toc_in.read(256))
-            entry = MASFileEntry(0,  # type
-                                 0,  # flags
-                                 name, offset, size, zsize)
-        else:
-            raise RuntimeError("invalid map_type")
-
-        # No support for ASCIZ strings struct.unpack, thus ugly hackery
-        entry.name = entry.name.split(b'\0', 1)[0].decode('latin-1')
-
-        file_table.append(entry)
+    if len(toc) < file_count * 256:
+        raise RuntimeError("file table too short, expected %d entries" % file_count)
 
     # base_offset = 28 + file_count * 256
     base_offset = fin.tell()
 
-    for entry in file_table:
-        entry.offset += base_offset
+    return _decode_file_table(mas_type, toc[:file_count * 256], base_offset)
+
+
+def _decode_file_table(mas_type, toc, base_offset):
+    """Decodes the whole file table in one go, offsets are made
+    absolute by adding ``base_offset``"""
+
+    count = len(toc) // 256
+    if count == 0:
+        return MASFileTable([], [], [], [], [], [])
+
+    if mas_type == 0:
+        offsets, sizes, zsizes, names = zip(*struct.iter_unpack("<4xlll240s", toc))
+        types = flags = bytes(count)
+    elif mas_type == 1:
+        types, flags, names, offsets, sizes, zsizes = zip(*struct.iter_unpack("<BBxx236slll4x", toc))
+    elif mas_type == 2:
+        names, offsets, sizes, zsizes = zip(*struct.iter_unpack("<4x16slll4x", toc))
+        types = flags = bytes(count)
+    elif mas_type == 3:
+        offsets, sizes, zsizes, names = zip(*struct.iter_unpack("<4xlll4x236s", toc))
+        types = flags = bytes(count)
+    else:
+        raise RuntimeError("invalid map_type")
 
-    return file_table
+    # No support for ASCIZ strings struct.unpack, thus ugly hackery
+    names = [name.partition(b'\0')[0].decode('latin-1') for name in names]
+    offsets = [offset + base_offset for offset in offsets]
 
+    return MASFileTable(types, flags, names, offsets, sizes, zsizes)
 
 # EOF #
@@ -0,0 +1,177 @@
+# Persistent index of .mas file tables
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import os
+import sqlite3
+
+import rfactortools
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS archives (
+  id    INTEGER PRIMARY KEY,
+  path  TEXT UNIQUE NOT NULL,
+  size  INTEGER NOT NULL,
+  mtime INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS entries (
+  archive_id INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+  name       TEXT NOT NULL,
+  lname      TEXT NOT NULL,
+  type       INTEGER NOT NULL,
+  flags      INTEGER NOT NULL,
+  offset     INTEGER NOT NULL,
+  size       INTEGER NOT NULL,
+  zsize      INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS entries_lname ON entries (lname);
+CREATE INDEX IF NOT EXISTS entries_archive_id ON entries (archive_id);
+"""
+
+_select_entries = """
+SELECT archives.path, entries.name, entries.type, entries.flags, entries.offset, entries.size, entries.zsize
+FROM entries JOIN archives ON entries.archive_id = archives.id
+"""
+
+
+def _directory_filter(directory):
+    """Returns an SQL condition and its arguments that select the
+    archives within ``directory``, case is only ignored where the
+    filesystem does, see os.path.normcase()"""
+
+    directory = os.path.normcase(os.path.abspath(directory))
+    prefix = os.path.join(directory, "")
+    return ("(normcase(archives.path) = ? OR substr(normcase(archives.path), 1, length(?)) = ?)",
+            (directory, prefix, prefix))
+
+
+class MASIndexEntry:
+
+    def __init__(self, *args):
+        self.archive, self.name, self.type, self.flags, self.offset, self.size, self.zsize = args
+
+
+class MASIndex:
+
+    """
+    SQLite backed index of the file tables of all .mas files below a
+    set of directories. Archives are keyed by path, size and mtime, so
+    update() only reparses archives that changed since the last run.
+    """
+
+    def __init__(self, dbfile):
+        self.dbfile = dbfile
+        self.db = sqlite3.connect(dbfile)
+        self.db.create_function("normcase", 1, os.path.normcase)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(_schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, directory):
+        """Brings the index for ``directory`` up to date, returns the
+        number of archives that got (re)indexed and removed"""
+
+        directory = os.path.abspath(directory)
+
+        where, args = _directory_filter(directory)
+        known = {path: (archive_id, size, mtime) for archive_id, path, size, mtime in self.db.execute(
+            "SELECT id, path, size, mtime FROM archives WHERE " + where, args)}
+
+        updated = 0
+        with self.db:
+            for masfile in rfactortools.find_files(directory, ".mas"):
+                masfile = os.path.normpath(masfile)
+                try:
+                    st = os.stat(masfile)
+                except OSError as err:
+                    # treated like a removed archive
+                    logging.warning("%s: skipping archive: %s", masfile, err)
+                    continue
+
+                row = known.pop(masfile, None)
+                if row is not None:
+                    archive_id, size, mtime = row
+                    if size == st.st_size and mtime == st.st_mtime_ns:
+                        continue
+                    self.db.execute("DELETE FROM archives WHERE id = ?", (archive_id,))
+
+                self._add_archive(masfile, st)
+                updated += 1
+
+            # archives that are gone from the disk
+            for archive_id, size, mtime in known.values():
+                self.db.execute("DELETE FROM archives WHERE id = ?", (archive_id,))
+
+        return updated, len(known)
+
+    def _add_archive(self, masfile, st):
+        logging.info("indexing %s", masfile)
+        try:
+            with open(masfile, "rb") as fin:
+                file_table = rfactortools.mas.mas_unpack_file_table(fin)
+        except Exception:
+            # keep broken archives in the index, so they aren't reparsed on every update
+            logging.exception("%s: couldn't read file table", masfile)
+            file_table = []
+
+        cursor = self.db.execute("INSERT INTO archives (path, size, mtime) VALUES (?, ?, ?)",
+                                 (masfile, st.st_size, st.st_mtime_ns))
+        self.db.executemany("INSERT INTO entries (archive_id, name, lname, type, flags, offset, size, zsize) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            [(cursor.lastrowid, e.name, e.name.lower(), e.type, e.flags, e.offset, e.size, e.zsize)
+                             for e in file_table])
+
+    def find(self, name):
+        """Returns all entries matching ``name``, case is ignored and
+        shell style wildcards are allowed"""
+
+        if any(c in name for c in "*?["):
+            where, arg = "entries.lname GLOB ?", name.lower()
+        else:
+            where, arg = "entries.lname = ?", name.lower()
+
+        return [MASIndexEntry(*row) for row in self.db.execute(
+            _select_entries + "WHERE " + where + " ORDER BY archives.path, entries.rowid", (arg,))]
+
+    def list(self, directory=None):
+        """Returns all indexed entries, optionally limited to the archives below ``directory``"""
+
+        if directory is None:
+            where, args = "", ()
+        else:
+            where, args = _directory_filter(directory)
+            where = "WHERE " + where + " "
+
+        return [MASIndexEntry(*row) for row in self.db.execute(
+            _select_entries + where + "ORDER BY archives.path, entries.rowid", args)]
+
+    def archives(self):
+        return [path for path, in self.db.execute("SELECT path FROM archives ORDER BY path")]
+
+
+# EOF #
@@ -0,0 +1,153 @@
+# Conversion plans with cost estimates
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import logging
+import os
+
+import PIL.Image
+
+import rfactortools
+
+
+# bytes of work for rendering the thumbnail of a track
+_aiw_thumbnail_cost = 252 * 249 * 4
+
+
+def estimate_cost(handler, path, size):
+    """Returns the estimated work for converting the file ``path`` of
+    ``size`` bytes with ``handler``, in bytes read, written or
+    processed. Only headers are read: the table of contents of .mas
+    files and the dimensions of images."""
+
+    if handler in ("ignored", "gfx"):
+        return 0
+    elif handler == "gmt":
+        # decrypted and encrypted again
+        return 2 * size
+    elif handler == "mas":
+        try:
+            with rfactortools.MASArchive(path) as mas:
+                # every entry gets inflated and compressed again
+                return size + 2 * sum(entry.size for entry in mas)
+        except Exception:
+            logging.warning("%s: couldn't read .mas table of contents", path)
+            return 4 * size
+    elif handler in ("tga", "jpg"):
+        try:
+            with PIL.Image.open(path) as img:
+                width, height = img.size
+                return size + 4 * width * height
+        except Exception:
+            return size
+    elif handler == "aiw":
+        return size + _aiw_thumbnail_cost
+    else:
+        return size
+
+
+class PlannedFile:
+
+    """A file to be converted by ``handler``, see rFactorToGSC2013.convert_file()"""
+
+    def __init__(self, source_directory, target_directory, filename, modname, handler, size, cost):
+        self.source_directory = source_directory
+        self.target_directory = target_directory
+        self.filename = filename
+        self.modname = modname
+        self.handler = handler
+        self.size = size
+        self.cost = cost
+
+    @property
+    def source_file(self):
+        return os.path.join(self.source_directory, self.filename)
+
+    @property
+    def target_file(self):
+        return os.path.join(self.target_directory, self.filename)
+
+
+class PlanStep:
+
+    """
+    Conversion of one ``GameData/`` or track directory: the directory
+    hierachies to create, the files to convert and the directory to
+    run process_gen_directory() on afterwards, if any.
+    """
+
+    def __init__(self, directory, gamedata_directory=None):
+        self.directory = directory
+        self.gamedata_directory = gamedata_directory
+        self.hierachies = []
+        self.files = []
+        self.gen_directory = None
+
+
+class ConversionPlan:
+
+    """
+    All the work of a conversion, built before anything is written.
+    Costs are estimates in bytes, see estimate_cost().
+    """
+
+    def __init__(self, target_directory):
+        self.target_directory = target_directory
+        self.steps = []
+
+    def files(self):
+        for step in self.steps:
+            yield from step.files
+
+    @property
+    def total_size(self):
+        return sum(f.size for f in self.files())
+
+    @property
+    def total_cost(self):
+        return sum(f.cost for f in self.files())
+
+    def summary(self):
+        """Returns a dict mapping handlers to the number, size and cost
+        of their files, most expensive first"""
+
+        summary = collections.defaultdict(lambda: [0, 0, 0])
+        for f in self.files():
+            summary[f.handler][0] += 1
+            summary[f.handler][1] += f.size
+            summary[f.handler][2] += f.cost
+        return collections.OrderedDict(sorted(((handler, tuple(values)) for handler, values in summary.items()),
+                                              key=lambda item: -item[1][2]))
+
+    def write(self, fout):
+        for step in self.steps:
+            fout.write("directory: %s\n" % step.directory)
+            for source, target in step.hierachies:
+                fout.write("  hierachy: %s -> %s\n" % (source, target))
+            for f in step.files:
+                fout.write("  %-8s %12d %12d  %s -> %s\n" % (f.handler, f.size, f.cost, f.source_file, f.target_file))
+            if step.gen_directory is not None:
+                fout.write("  gen check: %s\n" % step.gen_directory)
+            fout.write("\n")
+
+        fout.write("%-8s %6s %12s %12s\n" % ("handler", "files", "size", "cost"))
+        for handler, (count, size, cost) in self.summary().items():
+            fout.write("%-8s %6d %12d %12d\n" % (handler, count, size, cost))
+        fout.write("%-8s %6d %12d %12d\n" % ("total", len(list(self.files())), self.total_size, self.total_cost))
+
+
+# EOF #
@@ -0,0 +1,95 @@
+# Line based rewrite rules for text files
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import re
+
+import rfactortools
+
+
+class Rule:
+
+    """
+    Replaces ``pattern`` with ``repl`` like re.sub(). ``needle`` is a
+    string that must be contained in every line the pattern can match,
+    lowercase for case insensitive patterns. With ``anchored`` the
+    line has to start with it. Lines without it skip the regex.
+    """
+
+    def __init__(self, needle, pattern, repl, flags=0, anchored=False):
+        self.needle = needle
+        self.anchored = anchored
+        self.ignorecase = bool(flags & re.IGNORECASE)
+        self.regex = re.compile(pattern, flags)
+        self.repl = repl
+
+    def matches(self, line, lowered):
+        text = lowered if self.ignorecase else line
+        if self.anchored:
+            return text.startswith(self.needle)
+        else:
+            return self.needle in text
+
+    def apply(self, line, filename):
+        return self.regex.sub(self.repl, line)
+
+
+class FunctionRule(Rule):
+
+    """Rule that rewrites lines containing ``needle`` with ``func(line, filename)``"""
+
+    def __init__(self, needle, func, ignorecase=False, anchored=False):
+        self.needle = needle
+        self.anchored = anchored
+        self.ignorecase = ignorecase
+        self.func = func
+
+    def apply(self, line, filename):
+        return self.func(line, filename)
+
+
+class RuleSet:
+
+    """
+    A list of rules applied in order to every line of a file in a
+    single pass.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+
+    def rewrite(self, line, filename=None):
+        lowered = line.lower()
+        for rule in self.rules:
+            if rule.matches(line, lowered):
+                result = rule.apply(line, filename)
+                if result != line:
+                    line = result
+                    lowered = line.lower()
+        return line
+
+    def rewrite_file(self, source_file, target_file):
+        """Writes ``source_file`` rewritten to ``target_file`` with DOS line endings"""
+
+        with rfactortools.open_read(source_file) as fin:
+            lines = fin.readlines()
+
+        with open(target_file, "wt", newline='\r\n', encoding="latin-1", errors="replace") as fout:
+            for line in lines:
+                fout.write(self.rewrite(line, source_file))
+
+
+# EOF #
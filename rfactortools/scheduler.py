@@ -0,0 +1,124 @@
+# Parallel execution of conversion jobs with ordered progress events
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import logging
+import threading
+
+
+class ConversionScheduler:
+
+    """
+    Runs the jobs passed to submit() on a pool of ``jobs`` threads.
+
+    The progress events a job passes to report() are collected and
+    handed to ``progress_cb`` in the order the jobs were submitted, on
+    the thread that calls submit(), report() and wait(), so the events
+    of different jobs never interleave. Events without arguments are
+    only checks for cancellation, they go to ``progress_cb`` right away
+    from the worker thread. With ``jobs`` == 1 jobs run immediately on
+    the calling thread, exactly as if called directly.
+
+    An exception raised by a job is passed to ``error_cb(exc, *args)``
+    with the arguments of the job, on the thread the job ran on, so
+    the events it reports take the place of the events of the failed
+    job and the remaining jobs go on. Without ``error_cb`` the
+    exception is raised again by submit() or wait().
+    """
+
+    def __init__(self, jobs=1, progress_cb=lambda *args: None, error_cb=None):
+        self.jobs = max(1, jobs)
+        self.progress_cb = progress_cb
+        self.error_cb = error_cb
+
+        self._local = threading.local()
+        self._pending = collections.deque()
+        self._executor = ThreadPoolExecutor(max_workers=self.jobs) if self.jobs > 1 else None
+
+    def _call(self, func, args):
+        try:
+            func(*args)
+        except Exception as err:
+            if self.error_cb is None:
+                raise
+            logging.exception("%s: job failed", func.__name__)
+            self.error_cb(err, *args)
+
+    def _run(self, events, func, args):
+        self._local.events = events
+        try:
+            self._call(func, args)
+        finally:
+            self._local.events = None
+
+    def _deliver(self, block):
+        """Passes the events of finished jobs at the head of the queue
+        on to ``progress_cb``, with ``block`` waits for all jobs"""
+
+        while self._pending:
+            future, events = self._pending[0]
+            if future is not None:
+                if not block and not future.done():
+                    break
+                future.result()
+
+            self._pending.popleft()
+            for args in events:
+                self.progress_cb(*args)
+
+    def report(self, *args):
+        events = getattr(self._local, "events", None)
+        if events is not None and args:
+            events.append(args)
+        elif events is None and self._pending:
+            # queued behind the events of the jobs submitted before
+            self._pending.append((None, [args]))
+            self._deliver(block=False)
+        else:
+            self.progress_cb(*args)
+
+    def submit(self, func, *args):
+        """Runs ``func(*args)`` as a job"""
+
+        if self._executor is None:
+            self._call(func, args)
+        else:
+            events = []
+            self._pending.append((self._executor.submit(self._run, events, func, args), events))
+
+            # keep the events close to the work actually done
+            if len(self._pending) > 4 * self.jobs:
+                future, events = self._pending[0]
+                if future is not None:
+                    future.exception()
+            self._deliver(block=False)
+
+    def wait(self):
+        """Waits for all submitted jobs and delivers their events"""
+        self._deliver(block=True)
+
+    def shutdown(self):
+        """Drops the jobs that haven't started yet and waits for the running ones"""
+
+        self._pending.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+# EOF #
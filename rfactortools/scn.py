@@ -72,18 +72,14 @@ def process_gen_directory(directory, fix, fout):
     scn_files = []
     mas_files = []
 
-    for fname in rfactortools.find_files(directory):
-        ext = os.path.splitext(fname)[1].lower()
-        if ext == ".gen":
-            gen_files.append(fname)
-        elif ext == ".veh":
-            veh_files.append(fname)
-        elif ext == ".scn":
-            scn_files.append(fname)
-        elif ext == ".gdb":
-            gdb_files.append(fname)
-        elif ext == ".mas":
-            mas_files.append(fname)
+    files_by_ext = {".gen": gen_files, ".veh": veh_files, ".scn": scn_files, ".gdb": gdb_files, ".mas": mas_files}
+    entries = list(rfactortools.walk(directory, include_dirs=True))
+    for entry in entries:
+        if entry.ext in files_by_ext:
+            files_by_ext[entry.ext].append(entry.path)
+
+    # .gen and cmaps.mas lookups of all vehicles are answered from the same walk
+    index = rfactortools.BasenameIndex(directory, entries)
 
     errors = []
     for gdb in sorted(gdb_files):
@@ -96,7 +92,7 @@ def process_gen_directory(directory, fix, fout):
 
     for veh in sorted(veh_files):
         try:
-            rfactortools.process_veh_file(veh, fix, errors, fout)
+            rfactortools.process_veh_file(veh, fix, errors, fout, index)
         except Exception as e:
             e = traceback.format_exc()
             fout.write("raised error:\n%s\n\n" % e)
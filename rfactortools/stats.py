@@ -0,0 +1,154 @@
+# Timing and throughput statistics of conversions
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import csv
+import json
+import threading
+import time
+
+
+_local = threading.local()
+
+
+class Timer:
+
+    """
+    Measures the wall clock time since its creation and the CPU time
+    of the calling thread. While the timer is active, in a ``with``
+    block, work handed to other threads through worker_cpu_time() is
+    charged to it as well.
+    """
+
+    def __init__(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        self._worker_cpu = 0.0
+        self._lock = threading.Lock()
+        self._outer = None
+
+    def __enter__(self):
+        self._outer = getattr(_local, "timer", None)
+        _local.timer = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.timer = self._outer
+        self._outer = None
+
+    def add_cpu(self, seconds):
+        with self._lock:
+            self._worker_cpu += seconds
+
+    def elapsed(self):
+        with self._lock:
+            worker_cpu = self._worker_cpu
+        return time.perf_counter() - self.wall_start, time.thread_time() - self.cpu_start + worker_cpu
+
+
+def worker_cpu_time(func):
+    """Wraps ``func``, which is going to run in another thread, so that
+    the CPU time it uses there is charged to the Timer active in the
+    calling thread, if any"""
+
+    timer = getattr(_local, "timer", None)
+    if timer is None:
+        return func
+
+    def wrapper(*args, **kwargs):
+        start = time.thread_time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timer.add_cpu(time.thread_time() - start)
+
+    return wrapper
+
+
+def _new_counters():
+    return collections.OrderedDict([("count", 0), ("errors", 0), ("wall", 0.0), ("cpu", 0.0),
+                                    ("bytes_in", 0), ("bytes_out", 0)])
+
+
+class ConversionStats:
+
+    """
+    Collects the wall clock and CPU time, bytes read and written and
+    the number of files per handler and per mod of a conversion.
+    record() may be called from multiple threads.
+    """
+
+    csv_fields = ["handler", "mod", "file", "status", "wall", "cpu", "bytes_in", "bytes_out"]
+
+    def __init__(self):
+        self.files = []
+        self.handlers = collections.defaultdict(_new_counters)
+        self.mods = collections.defaultdict(_new_counters)
+        self.totals = _new_counters()
+        self.wall_start = time.perf_counter()
+        self.wall = 0.0
+
+        self._lock = threading.Lock()
+
+    def record(self, handler, modname, filename, status, timer, bytes_in=0, bytes_out=0):
+        """Adds a file processed by ``handler``, ``status`` is "done",
+        "error", "ignored" or "uptodate", ``timer`` a Timer started
+        when processing began"""
+
+        wall, cpu = timer.elapsed()
+        with self._lock:
+            self.files.append((handler, modname, filename, status, wall, cpu, bytes_in, bytes_out))
+            for counters in (self.handlers[handler], self.mods[modname], self.totals):
+                counters["count"] += 1
+                counters["errors"] += status == "error"
+                counters["wall"] += wall
+                counters["cpu"] += cpu
+                counters["bytes_in"] += bytes_in
+                counters["bytes_out"] += bytes_out
+
+    def finish(self):
+        """Stops the clock for the total wall time of the conversion"""
+        self.wall = time.perf_counter() - self.wall_start
+
+    def summary(self):
+        """Returns the totals, the counters by handler and by mod and the
+        overall wall time as dict"""
+
+        with self._lock:
+            return collections.OrderedDict([
+                ("wall", self.wall),
+                ("totals", dict(self.totals)),
+                ("handlers", {handler: dict(counters) for handler, counters in self.handlers.items()}),
+                # JSON keys can't be None, files outside of mods are listed under ""
+                ("mods", {modname or "": dict(counters) for modname, counters in self.mods.items()})])
+
+    def write_json(self, filename):
+        with open(filename, "w") as fout:
+            json.dump(self.summary(), fout, indent=2, sort_keys=True)
+
+    def write_csv(self, filename):
+        with self._lock:
+            files = list(self.files)
+
+        with open(filename, "w", newline="") as fout:
+            writer = csv.writer(fout)
+            writer.writerow(self.csv_fields)
+            for row in files:
+                writer.writerow(row)
+
+
+# EOF #
@@ -15,11 +15,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import ntpath
 import os
 import pathlib
 import posixpath
+import stat
+import time
 
 
 def nt2posixpath(path):
@@ -50,44 +53,307 @@ def in_directory(path, directory):
         return True
 
 
+class WalkEntry:
+
+    """
+    A file or directory found by walk(). ``ext`` is the lowercase
+    extension of files, the result of stat() is cached. ``is_dir`` and
+    ``is_file`` come from the directory listing, only symlinks and
+    filesystems without file types need a stat() for them.
+    """
+
+    __slots__ = ["path", "name", "ext", "is_dir", "is_file", "is_symlink", "_entry", "_stat"]
+
+    def __init__(self, entry):
+        self.path = entry.path
+        self.name = entry.name
+        self.is_dir = entry.is_dir()
+        self.is_file = not self.is_dir and entry.is_file()
+        self.is_symlink = entry.is_symlink()
+        self.ext = "" if self.is_dir else os.path.splitext(entry.name)[1].lower()
+        self._entry = entry
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = self._entry.stat()
+        return self._stat
+
+    def __repr__(self):
+        return "WalkEntry(%r)" % self.path
+
+
+def scan_directory(directory, stat=False):
+    """Returns the content of ``directory`` as list of WalkEntry, an
+    empty list if it can't be read. With ``stat`` all entries get
+    stat()'ed right away."""
+
+    try:
+        with os.scandir(directory) as it:
+            entries = [WalkEntry(entry) for entry in it]
+    except OSError:
+        return []
+
+    if stat:
+        for entry in entries:
+            try:
+                entry.stat()
+            except OSError:
+                pass
+
+    return entries
+
+
+def _walk_entries(directory, exts, prune, include_dirs, submit):
+    """Yields the entries below ``directory`` in the order of
+    os.walk(), files of a directory before its subdirectories.
+    ``submit(directory)`` returns a function delivering the content of
+    ``directory``, so scanning may run ahead in other threads."""
+
+    def visit(content):
+        entries = content()
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir:
+                # like os.walk(), symlinks to directories are listed, but not followed
+                if entry.is_symlink or (prune is not None and prune(entry)):
+                    subdirs.append((entry, None))
+                else:
+                    subdirs.append((entry, submit(entry.path)))
+            elif exts is None or entry.ext in exts:
+                yield entry
+
+        for entry, subcontent in subdirs:
+            if include_dirs:
+                yield entry
+            if subcontent is not None:
+                yield from visit(subcontent)
+
+    yield from visit(submit(directory))
+
+
+def walk(directory, exts=None, prune=None, include_dirs=False, jobs=1, stat=False):
+    """Yields the files below ``directory`` as WalkEntry objects, in
+    the same order as os.walk().
+
+    ``exts`` limits the files to the given lowercase extensions,
+    ``prune(entry)`` returning True keeps a directory from being
+    descended into and ``include_dirs`` yields directories as well.
+    With ``jobs`` > 1 subdirectories are scanned ahead on a pool of
+    threads, which helps on network storage. With ``stat`` the
+    entries get stat()'ed while scanning."""
+
+    if exts is not None:
+        exts = set(exts)
+
+    if jobs <= 1:
+        return _walk_entries(directory, exts, prune, include_dirs,
+                             lambda path: lambda: scan_directory(path, stat))
+    else:
+        return _walk_threaded(directory, exts, prune, include_dirs, jobs, stat)
+
+
+def _walk_threaded(directory, exts, prune, include_dirs, jobs, stat):
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from _walk_entries(directory, exts, prune, include_dirs,
+                                 lambda path: executor.submit(scan_directory, path, stat).result)
+
+
+class DirectoryTree:
+
+    """
+    Snapshot of the directory tree below ``directory``, walked once,
+    that can be walked again in memory with the same interface as
+    walk(). Paths outside of the snapshot are read from disk.
+    """
+
+    def __init__(self, directory, jobs=1, stat=False):
+        self.directory = os.path.normpath(directory)
+        self._content = {self.directory: []}
+
+        for entry in walk(self.directory, include_dirs=True, jobs=jobs, stat=stat):
+            self._content[os.path.dirname(entry.path)].append(entry)
+            if entry.is_dir and not entry.is_symlink:
+                self._content[entry.path] = []
+
+    def __contains__(self, directory):
+        return os.path.normpath(directory) in self._content
+
+    def scan_directory(self, directory):
+        """Like scan_directory(), but from the snapshot if possible"""
+        content = self._content.get(os.path.normpath(directory))
+        if content is None:
+            return scan_directory(directory)
+        else:
+            return list(content)
+
+    def walk(self, directory, exts=None, prune=None, include_dirs=False):
+        if exts is not None:
+            exts = set(exts)
+
+        directory = os.path.normpath(directory)
+        if directory not in self._content:
+            return walk(directory, exts, prune, include_dirs)
+        else:
+            return _walk_entries(directory, exts, prune, include_dirs,
+                                 lambda path: lambda: self._content.get(path, []))
+
+
+class BasenameIndex:
+
+    """
+    Index of the files below ``directory`` by their lowercase basename,
+    built from a single walk, or from ``entries`` already collected by
+    walk(). Answers the lookups of find_file() and of searches up the
+    directory hierarchy without touching the disk, paths outside of
+    ``directory`` or behind symlinked directories are looked up on
+    disk instead.
+    """
+
+    def __init__(self, directory, entries=None):
+        self.directory = os.path.normpath(directory)
+        self._root = self.directory.lower()
+        self._names = {}
+        self._paths = {}
+        self._symlinks = []
+
+        if entries is None:
+            entries = walk(self.directory, include_dirs=True)
+
+        for entry in entries:
+            path = os.path.normpath(entry.path)
+            if entry.is_dir:
+                if entry.is_symlink:
+                    self._symlinks.append(path.lower() + os.sep)
+            else:
+                self._names.setdefault(entry.name.lower(), []).append(path)
+                self._paths[path.lower()] = path
+
+    def _covers(self, path):
+        """True if ``path``, lowercase and normalized, can be looked up in the index"""
+        return path.startswith(self._root + os.sep) and \
+            not any(path.startswith(symlink) for symlink in self._symlinks)
+
+    def find(self, name, directory=None):
+        """Returns the first file called ``name`` below ``directory`` in
+        walk order, case insensitive, like find_file()"""
+
+        if directory is None:
+            prefix = self._root + os.sep
+        else:
+            prefix = os.path.normpath(directory).lower() + os.sep
+            if not self._covers(prefix):
+                return find_file(directory, name)
+
+        for path in self._names.get(name.lower(), []):
+            if path.lower().startswith(prefix):
+                return path
+        return None
+
+    def file_exists(self, filename):
+        """Like file_exists(), answered from the index where possible"""
+        path = os.path.normpath(filename).lower()
+        if self._covers(path):
+            return path in self._paths
+        else:
+            return file_exists(filename)
+
+    def find_backwards(self, directory, name):
+        """Returns ``directory/name`` for ``directory`` or the nearest of
+        its parents for which that file exists, None if there is none"""
+
+        while True:
+            filename = os.path.join(directory, name)
+            if self.file_exists(filename):
+                return filename
+
+            newdir = os.path.dirname(directory)
+            if newdir == directory:  # reached the root of the path
+                return None
+            else:
+                directory = newdir
+
+
 def find_files(directory, ext=None):
     """Traverses a directory and returns all files contained within, if
     ``ext`` is given, only files ending with ``ext`` are returned"""
 
-    results = []
-    for path, dirs, files in os.walk(directory):
-        for fname in files:
-            if ext and os.path.splitext(fname)[1].lower() == ext:
-                results.append(os.path.join(path, fname))
-            elif ext is None:
-                results.append(os.path.join(path, fname))
-
-    return results
+    return [entry.path for entry in walk(directory, exts=[ext] if ext else None)]
 
 
 def find_file(directory, name):
-    for path, dirs, files in os.walk(directory):
-        for fname in files:
-            if fname.lower() == name.lower():
-                return os.path.join(path, fname)
+    name = name.lower()
+    for entry in walk(directory):
+        if entry.name.lower() == name:
+            return entry.path
     return None
 
 
-def _lookup_path_icase(root, rest):
+class CaseInsensitiveIndex:
+
     """
-    Given a root directory and a list of directory parts, find all
-    path that match root + rest, while ignoring the case of the filenames.
+    Caches the content of directories as maps of lowercase names to
+    real names, so that case insensitive lookups don't have to list
+    the same directories over and over. A cached listing is thrown
+    away when the mtime of its directory changes. Directories that
+    changed within the last ``racy_window`` seconds are not cached,
+    as further changes might not show up in their mtime.
     """
-    if not rest:
-        return [os.path.normpath(root)]
-    else:
-        results = []
-        if os.path.isdir(root):
-            for f in os.listdir(root):
-                if f.lower() == rest[0].lower():
-                    p = os.path.join(root, f)
-                    results += _lookup_path_icase(p, rest[1:])
-        return results
+
+    def __init__(self, racy_window=2.0):
+        self.racy_window_ns = int(racy_window * 1e9)
+        self._listings = {}
+
+    def clear(self):
+        self._listings.clear()
+
+    def listing(self, directory):
+        """Returns a dict mapping lowercase names to lists of real names
+        for the content of ``directory``, None if it isn't a directory"""
+
+        try:
+            st = os.stat(directory)
+        except OSError:
+            self._listings.pop(directory, None)
+            return None
+
+        if not stat.S_ISDIR(st.st_mode):
+            self._listings.pop(directory, None)
+            return None
+
+        cached = self._listings.get(directory)
+        if cached is not None and cached[0] == st.st_mtime_ns:
+            return cached[1]
+
+        names = {}
+        for name in os.listdir(directory):
+            names.setdefault(name.lower(), []).append(name)
+
+        if time.time_ns() - st.st_mtime_ns > self.racy_window_ns:
+            self._listings[directory] = (st.st_mtime_ns, names)
+        else:
+            self._listings.pop(directory, None)
+
+        return names
+
+    def lookup(self, root, rest):
+        """
+        Given a root directory and a list of directory parts, find all
+        path that match root + rest, while ignoring the case of the filenames.
+        """
+        if not rest:
+            return [os.path.normpath(root)]
+        else:
+            results = []
+            names = self.listing(root)
+            if names:
+                for f in names.get(rest[0].lower(), []):
+                    results += self.lookup(os.path.join(root, f), rest[1:])
+            return results
+
+
+# shared by all the lookup functions below
+_icase_index = CaseInsensitiveIndex()
 
 
 def lookup_path_icase_multi(filename):
@@ -106,9 +372,9 @@ def lookup_path_icase_multi(filename):
         parts = path.parts
 
         if not path.is_absolute():
-            return _lookup_path_icase(os.curdir, parts)
+            return _icase_index.lookup(os.curdir, parts)
         else:
-            return _lookup_path_icase(parts[0], parts[1:])
+            return _icase_index.lookup(parts[0], parts[1:])
 
 
 def lookup_path_icase(filename):
@@ -49,7 +49,10 @@ def find_vehdir(path):
         raise Exception("couldn't locate <VEHDIR> in %s" % path)
 
 
-def find_file_backwards(directory, gen):
+def find_file_backwards(directory, gen, index=None):
+    if index is not None:
+        return index.find_backwards(directory, gen)
+
     while True:
         filename = os.path.join(directory, gen)
         if rfactortools.file_exists(filename):
@@ -130,9 +133,9 @@ def append_errors(context, errs, warns, errors):
         errors.append("%s: %s" % (context, warn))
 
 
-def process_scn_veh_file(modname, veh_filename, scn_short_filename, vehdir, teamdir, fix, errors, fout):
+def process_scn_veh_file(modname, veh_filename, scn_short_filename, vehdir, teamdir, fix, errors, fout, index=None):
     # resolve scn_filename to a proper path
-    scn_filename = find_file_backwards(os.path.dirname(veh_filename), scn_short_filename)
+    scn_filename = find_file_backwards(os.path.dirname(veh_filename), scn_short_filename, index)
     if not scn_filename:
         raise Exception("error: couldn't find .gen file '%s' '%s'" % (veh_filename, scn_short_filename))
 
@@ -150,7 +153,10 @@ def process_scn_veh_file(modname, veh_filename, scn_short_filename, vehdir, team
         append_errors(scn_filename, orig_errs, orig_warns, errors)
     else:
         # if there is a cmaps in the mod, use that instead of the one in <VEHDIR>
-        cmaps = rfactortools.find_file(os.path.join(vehdir, modname), "cmaps.mas")
+        if index is not None:
+            cmaps = index.find("cmaps.mas", os.path.join(vehdir, modname))
+        else:
+            cmaps = rfactortools.find_file(os.path.join(vehdir, modname), "cmaps.mas")
         if cmaps:
             cmaps = os.path.relpath(cmaps, vehdir)
             for i, m in enumerate(info.mas_files):
@@ -185,7 +191,7 @@ def process_scn_veh_file(modname, veh_filename, scn_short_filename, vehdir, team
             rfactortools.modify_vehicle_file(scn_filename, info.search_path, info.mas_files, vehdir, teamdir)
 
 
-def process_veh_file(veh_filename, fix, errors, fout):
+def process_veh_file(veh_filename, fix, errors, fout, index=None):
     teamdir = os.path.dirname(veh_filename)
     modname = find_modname(os.path.dirname(veh_filename))
 
@@ -200,10 +206,12 @@ def process_veh_file(veh_filename, fix, errors, fout):
     fout.write("     spinner: %s\n" % veh_obj.spinner_file)
 
     if veh_obj.graphics_file is not None:
-        process_scn_veh_file(modname, veh_filename, veh_obj.graphics_file, vehdir, teamdir, fix, errors, fout)
+        process_scn_veh_file(modname, veh_filename, veh_obj.graphics_file, vehdir, teamdir, fix, errors, fout,
+                             index)
 
     if veh_obj.spinner_file is not None:
-        process_scn_veh_file(modname, veh_filename, veh_obj.spinner_file, vehdir, teamdir, fix, errors, fout)
+        process_scn_veh_file(modname, veh_filename, veh_obj.spinner_file, vehdir, teamdir, fix, errors, fout,
+                             index)
 
 
 class Tree(defaultdict):
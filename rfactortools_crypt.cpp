@@ -22,6 +22,8 @@
 //    http://aluigi.altervista.org/search.php?src=decrypter
 //
 
+#define PY_SSIZE_T_CLEAN
+
 #include <assert.h>
 #include <Python.h>
 #include <stdint.h>
@@ -35,8 +37,8 @@ typedef uint64_t    u64;
 
 static u64  isi_keyz(int enctype, u64 key, u64 ret, int n);
 static u64  isi_key(int enctype, u64 key);
-static void isi_crypt(int enctype, u8 *output, const u8 *input, int len, u64 key, int encrypt);
-static u64  isi_crypt2(int enctype, int pos, u64 key);
+static void isi_crypt(int enctype, u8 *output, const u8 *input, Py_ssize_t len, u64 key, int encrypt);
+static u64  isi_crypt2(int enctype, u64 pos, u64 key);
 
 typedef struct _GameSignature
 {
@@ -144,7 +146,32 @@ static u64 isi_key(int enctype, u64 key)
   return isi_keyz(enctype, key, 0, 0);
 }
 
-static inline u64 isi_crypt2(int enctype, int pos, u64 key)
+// Small direct mapped cache for isi_key(), as the same few keys are
+// used over and over. Not thread-safe, only use it with the GIL held.
+typedef struct _KeyCacheEntry
+{
+  int valid;
+  int enctype;
+  u64 key;
+  u64 value;
+} KeyCacheEntry;
+
+static KeyCacheEntry isi_key_cache[64];
+
+static u64 isi_key_cached(int enctype, u64 key)
+{
+  KeyCacheEntry* entry = &isi_key_cache[(key ^ (key >> 32) ^ (u64)enctype) & 63];
+  if (!entry->valid || entry->enctype != enctype || entry->key != key)
+  {
+    entry->valid = 1;
+    entry->enctype = enctype;
+    entry->key = key;
+    entry->value = isi_key(enctype, key);
+  }
+  return entry->value;
+}
+
+static inline u64 isi_crypt2(int enctype, u64 pos, u64 key)
 {
   static const u8 table0[8] = { 0x00, 0x28, 0x18, 0x08, 0x20, 0x38, 0x10, 0x30 };
   static const u8 table1[8] = { 0x38, 0x20, 0x30, 0x10, 0x28, 0x00, 0x08, 0x18 };
@@ -160,92 +187,187 @@ static inline u64 isi_crypt2(int enctype, int pos, u64 key)
   return((((u64)0x000000ff000000ffLL << t) & key) >> t);
 }
 
-static void isi_crypt(int enctype, u8* output, const u8* input, int len, u64 key, int encrypt)
+// Keystream bytes for positions pos to pos + 7, which repeat every 8
+// bytes as long as the key stays the same
+static inline u64 isi_crypt2_word(int enctype, u64 pos, u64 key)
 {
-  u64 t = 0;
-  u64 n;
-  u64 c;
-  u64 mask = 1;
-  int x = 0;
-  int blocksz = 0;
-
-  if(len < 0) return;
+  u64 w = 0;
+  for(int j = 0; j < 8; j++) {
+    w |= (isi_crypt2(enctype, pos + j, key) & 0xff) << (8 * j);
+  }
+  return w;
+}
 
-  switch(enctype) {
-    case 0: blocksz = 0x40; break;
-    case 1: blocksz = 0x80; break;
-    default: {
-      assert(!"unsupported enctype");
-    }
+static inline u64 load_le64(const u8* p)
+{
+  u64 v = 0;
+  for(int j = 7; j >= 0; j--) {
+    v = (v << 8) | p[j];
   }
+  return v;
+}
 
-  n = len % blocksz;
-  for(unsigned int i = 0; i < n; i++) {
-    c = input[x];
-    output[x] = isi_crypt2(enctype, x, key) ^ c;
-    if(encrypt) c = output[x];
-    t |= ((c & mask) << (i & 0x3f));
-    x++;
+static inline void store_le64(u8* p, u64 v)
+{
+  for(int j = 0; j < 8; j++) {
+    p[j] = (u8)v;
+    v >>= 8;
   }
+}
+
+// State of an encryption or decryption in progress, allows the data
+// to be processed in chunks of arbitrary size. The data is split into
+// a leading partial block of len % blocksz bytes followed by full
+// blocks, so the total length must be known up front.
+typedef struct _CryptState
+{
+  int enctype;
+  int encrypt;
+  int blocksz;
+  u64 key;
+  u64 t;
+  u64 mask;
+  int bit;     // the bit set in mask
+  u64 block;   // number of full blocks started
+  u64 pos;     // position in the data
+  int i;       // position in the current block
+  int left;    // bytes left in the current block
+} CryptState;
+
+static void isi_crypt_init(CryptState* st, int enctype, u64 key, Py_ssize_t len, int encrypt)
+{
+  // enctype comes from the games table, which only has types 0 and 1,
+  // blocksz must be set even with NDEBUG
+  assert(enctype == 0 || enctype == 1);
+  st->blocksz = (enctype == 1) ? 0x80 : 0x40;
+
+  st->enctype = enctype;
+  st->encrypt = encrypt;
+  st->key   = key;
+  st->t     = 0;
+  st->mask  = 1;
+  st->bit   = 0;
+  st->block = 0;
+  st->pos   = 0;
+  st->i     = 0;
+  st->left  = (len < 0) ? 0 : (int)(len % st->blocksz);
+}
 
-  n = 0;
-  for(len /= blocksz; len; len--) {
-    key ^= t;
-    t    = 0;
-    n++;
-    mask = 1 << (n & 7);
-    for(int i = 0; i < blocksz; i++) {
+// output and input may point to the same buffer, or output may lie
+// before input, as each word is read before it is written
+static void isi_crypt_update(CryptState* st, u8* output, const u8* input, Py_ssize_t len)
+{
+  u64 c;
+  Py_ssize_t x = 0;
+
+  while(x < len) {
+    if (st->left == 0) {
+      st->key ^= st->t;
+      st->t     = 0;
+      st->block++;
+      st->bit   = st->block & 7;
+      st->mask  = 1 << st->bit;
+      st->i     = 0;
+      st->left  = st->blocksz;
+    }
+
+    if ((st->i & 7) == 0 && st->left >= 8 && len - x >= 8) {
+      // eight bytes at a time, the key stays the same until the end
+      // of the block, so does the keystream word
+      Py_ssize_t words = ((len - x < st->left) ? len - x : st->left) / 8;
+      u64 ks = isi_crypt2_word(st->enctype, st->pos, st->key);
+
+      for(Py_ssize_t w = 0; w < words; w++) {
+        u64 in  = load_le64(input + x);
+        u64 out = in ^ ks;
+        store_le64(output + x, out);
+
+        // gather the selected bit of each byte into the low byte
+        c = st->encrypt ? out : in;
+        c = (((c >> st->bit) & 0x0101010101010101ULL) * 0x0102040810204080ULL) >> 56;
+        st->t |= (c << (st->i & 0x3f)) << st->bit;
+
+        st->i    += 8;
+        st->left -= 8;
+        st->pos  += 8;
+        x += 8;
+      }
+    } else {
       c = input[x];
-      output[x] = isi_crypt2(enctype, x, key) ^ c;
-      if(encrypt) c = output[x];
-      t |= ((c & mask) << i);
+      output[x] = isi_crypt2(st->enctype, st->pos, st->key) ^ c;
+      if(st->encrypt) c = output[x];
+      // shifts beyond 63 are undefined, wrap them around like x86 does
+      st->t |= ((c & st->mask) << (st->i & 0x3f));
+
+      st->i++;
+      st->left--;
+      st->pos++;
       x++;
     }
   }
 }
 
-static PyObject*
-rfactor_decrypt_c(const char* input, int length, int skip)
+static void isi_crypt(int enctype, u8* output, const u8* input, Py_ssize_t len, u64 key, int encrypt)
+{
+  CryptState st;
+
+  if(len < 0) return;
+
+  isi_crypt_init(&st, enctype, key, len, encrypt);
+  isi_crypt_update(&st, output, input, len);
+}
+
+// Decrypts ``length`` bytes from ``input`` into ``output``, which must
+// hold ``length - 16`` bytes. ``output`` may be the same buffer as
+// ``input``, as the data is only ever moved towards the front.
+static int
+rfactor_decrypt_c(char* output, const char* input, Py_ssize_t length, int skip)
 {
   assert(length >= 16);
   assert(skip == 0 || skip == 4);
 
-  const char* header  = input;
   const char* content = input + 16;
-  int content_length = length - 16;
+  Py_ssize_t content_length = length - 16;
 
-  u64 key  = *((u64*)&header[8]);
-  u64 sign = *((u64*)&header[0]) ^ key;
+  u64 key;
+  u64 sign;
+  memcpy(&key, input + 8, sizeof(key));
+  memcpy(&sign, input, sizeof(sign));
+  sign ^= key;
 
   const GameSignature* game = isi_game_from_sign(sign);
   if (!game)
   {
     PyErr_SetString(PyExc_RuntimeError, "unknown game signature");
-    return NULL;
+    return -1;
   }
   else
   {
-    key = isi_key(game->enctype, key);
-
-    PyObject* result = PyBytes_FromStringAndSize(NULL, content_length);
-    if (result)
+    if (skip > content_length)
     {
-      char* output = PyBytes_AsString(result);
-
-      memcpy(output, content, skip);
-      isi_crypt(game->enctype,
-                (u8*)output  + skip,
-                (u8*)content + skip,
-                content_length - skip,
-                key,
-                0);
+      skip = (int)content_length;
     }
-    return result;
+
+    key = isi_key_cached(game->enctype, key);
+
+    Py_BEGIN_ALLOW_THREADS
+    memmove(output, content, skip);
+    isi_crypt(game->enctype,
+              (u8*)output  + skip,
+              (u8*)content + skip,
+              content_length - skip,
+              key,
+              0);
+    Py_END_ALLOW_THREADS
+
+    return 0;
   }
 }
 
-static PyObject*
-rfactor_encrypt_c(const char* input, int length, u64 key, u64 sign, int skip)
+// Encrypts ``length`` bytes from ``input`` into ``output``, which must
+// hold ``length + 16`` bytes and must not overlap with ``input``.
+static int
+rfactor_encrypt_c(char* output, const char* input, Py_ssize_t length, u64 key, u64 sign, int skip)
 {
   assert(skip == 0 || skip == 4);
 
@@ -253,86 +375,371 @@ rfactor_encrypt_c(const char* input, int length, u64 key, u64 sign, int skip)
   if (!game)
   {
     PyErr_SetString(PyExc_RuntimeError, "unknown game signature");
-    return NULL;
+    return -1;
   }
   else
   {
-    PyObject* result = PyBytes_FromStringAndSize(NULL, length + 16);
-    if (result)
+    if (skip > length)
     {
-      char* output = PyBytes_AsString(result);
+      skip = (int)length;
+    }
 
-      *((u64*)output) = sign ^ key;
-      *((u64*)(output + 8)) = key;
+    u64 header = sign ^ key;
+    memcpy(output, &header, sizeof(header));
+    memcpy(output + 8, &key, sizeof(key));
 
-      key = isi_key(game->enctype, key);
+    key = isi_key_cached(game->enctype, key);
 
-      memcpy(output+16, input, skip);
-      isi_crypt(game->enctype, (u8*)output+16 + skip, (u8*)input + skip, length - skip, key, 1);
-    }
-    return result;
+    Py_BEGIN_ALLOW_THREADS
+    memcpy(output+16, input, skip);
+    isi_crypt(game->enctype, (u8*)output+16 + skip, (u8*)input + skip, length - skip, key, 1);
+    Py_END_ALLOW_THREADS
+
+    return 0;
   }
 }
 
+static int
+check_skip(int skip)
+{
+  if (skip != 0 && skip != 4)
+  {
+    PyErr_SetString(PyExc_RuntimeError, "only skip values of 0 and 4 are supported");
+    return -1;
+  }
+  return 0;
+}
+
+static int
+check_decrypt_length(Py_ssize_t length)
+{
+  if (length < 16)
+  {
+    PyErr_SetString(PyExc_RuntimeError, "input to small for decryption, must be at least 16 bytes");
+    return -1;
+  }
+  return 0;
+}
+
+static int
+check_output_length(const Py_buffer* output, Py_ssize_t length)
+{
+  if (output->len < length)
+  {
+    PyErr_Format(PyExc_ValueError, "output buffer too small, %zd bytes required", length);
+    return -1;
+  }
+  return 0;
+}
+
 // Python Bindings -----------------------------------------------------
 
 static PyObject*
 rfactor_encrypt(PyObject* self, PyObject* args)
 {
-  const char* input;
-  int   length;
+  Py_buffer input;
   unsigned long long key;
   unsigned long long sign;
   int   skip;
 
-  if (!PyArg_ParseTuple(args, "y#KKi", &input, &length, &key, &sign, &skip))
+  if (!PyArg_ParseTuple(args, "y*KKi", &input, &key, &sign, &skip))
   {
     return NULL;
   }
 
-  if (skip != 0 && skip != 4)
+  PyObject* result = NULL;
+  if (check_skip(skip) == 0)
+  {
+    result = PyBytes_FromStringAndSize(NULL, input.len + 16);
+    if (result && rfactor_encrypt_c(PyBytes_AsString(result), (const char*)input.buf, input.len,
+                                    key, sign, skip) < 0)
+    {
+      Py_CLEAR(result);
+    }
+  }
+
+  PyBuffer_Release(&input);
+  return result;
+}
+
+static PyObject*
+rfactor_encrypt_into(PyObject* self, PyObject* args)
+{
+  Py_buffer output;
+  Py_buffer input;
+  unsigned long long key;
+  unsigned long long sign;
+  int   skip;
+
+  if (!PyArg_ParseTuple(args, "w*y*KKi", &output, &input, &key, &sign, &skip))
   {
-    PyErr_SetString(PyExc_RuntimeError, "only skip values of 0 and 4 are supported");
     return NULL;
   }
 
-  PyObject* result = rfactor_encrypt_c(input, length, key, sign, skip);
+  PyObject* result = NULL;
+  if (check_skip(skip) == 0 &&
+      check_output_length(&output, input.len + 16) == 0 &&
+      rfactor_encrypt_c((char*)output.buf, (const char*)input.buf, input.len, key, sign, skip) == 0)
+  {
+    result = PyLong_FromSsize_t(input.len + 16);
+  }
 
+  PyBuffer_Release(&input);
+  PyBuffer_Release(&output);
   return result;
 }
 
 static PyObject*
 rfactor_decrypt(PyObject* self, PyObject* args)
 {
-  const char* input;
-  int   length;
+  Py_buffer input;
   int   skip;
 
-  if (!PyArg_ParseTuple(args, "y#i", &input, &length, &skip))
+  if (!PyArg_ParseTuple(args, "y*i", &input, &skip))
   {
     return NULL;
   }
 
-  if (length < 16)
+  PyObject* result = NULL;
+  if (check_decrypt_length(input.len) == 0 && check_skip(skip) == 0)
+  {
+    result = PyBytes_FromStringAndSize(NULL, input.len - 16);
+    if (result && rfactor_decrypt_c(PyBytes_AsString(result), (const char*)input.buf, input.len, skip) < 0)
+    {
+      Py_CLEAR(result);
+    }
+  }
+
+  PyBuffer_Release(&input);
+  return result;
+}
+
+static PyObject*
+rfactor_decrypt_into(PyObject* self, PyObject* args)
+{
+  Py_buffer output;
+  Py_buffer input;
+  int   skip;
+
+  if (!PyArg_ParseTuple(args, "w*y*i", &output, &input, &skip))
   {
-    PyErr_SetString(PyExc_RuntimeError, "input to small for decryption, must be at least 16 bytes");
     return NULL;
   }
 
+  PyObject* result = NULL;
+  if (check_decrypt_length(input.len) == 0 &&
+      check_skip(skip) == 0 &&
+      check_output_length(&output, input.len - 16) == 0 &&
+      rfactor_decrypt_c((char*)output.buf, (const char*)input.buf, input.len, skip) == 0)
+  {
+    result = PyLong_FromSsize_t(input.len - 16);
+  }
+
+  PyBuffer_Release(&input);
+  PyBuffer_Release(&output);
+  return result;
+}
+
+// CryptContext ---------------------------------------------------------
+
+typedef struct
+{
+  PyObject_HEAD
+  CryptState state;
+  Py_ssize_t remaining;
+  int skip;
+  int busy;
+} CryptContext;
+
+static int
+CryptContext_init(CryptContext* self, PyObject* args, PyObject* kwds)
+{
+  static const char* kwlist[] = { "key", "sign", "length", "skip", "encrypt", NULL };
+  unsigned long long key;
+  unsigned long long sign;
+  Py_ssize_t length;
+  int skip;
+  int encrypt;
+
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, "KKnip", const_cast<char**>(kwlist),
+                                   &key, &sign, &length, &skip, &encrypt))
+  {
+    return -1;
+  }
+
   if (skip != 0 && skip != 4)
   {
     PyErr_SetString(PyExc_RuntimeError, "only skip values of 0 and 4 are supported");
+    return -1;
+  }
+
+  if (length < 0)
+  {
+    PyErr_SetString(PyExc_ValueError, "length must not be negative");
+    return -1;
+  }
+
+  const GameSignature* game = isi_game_from_sign(sign);
+  if (!game)
+  {
+    PyErr_SetString(PyExc_RuntimeError, "unknown game signature");
+    return -1;
+  }
+
+  if (skip > length)
+  {
+    skip = (int)length;
+  }
+
+  isi_crypt_init(&self->state, game->enctype, isi_key_cached(game->enctype, key), length - skip, encrypt);
+  self->remaining = length;
+  self->skip = skip;
+  self->busy = 0;
+
+  return 0;
+}
+
+// Processes ``length`` bytes from ``input`` into ``output``, which may
+// be the same buffer
+static int
+CryptContext_process(CryptContext* self, u8* output, const u8* input, Py_ssize_t length)
+{
+  if (self->busy)
+  {
+    PyErr_SetString(PyExc_RuntimeError, "CryptContext is in use by another thread");
+    return -1;
+  }
+
+  if (length > self->remaining)
+  {
+    PyErr_SetString(PyExc_ValueError, "more data than announced in the length");
+    return -1;
+  }
+
+  // the GIL is released, so the context is marked busy to keep
+  // other threads from modifying its state in the meantime
+  self->busy = 1;
+  Py_BEGIN_ALLOW_THREADS
+
+  // the skipped bytes at the start are passed through unchanged
+  Py_ssize_t n = (length < self->skip) ? length : self->skip;
+  memmove(output, input, n);
+  self->skip -= (int)n;
+
+  isi_crypt_update(&self->state, output + n, input + n, length - n);
+
+  Py_END_ALLOW_THREADS
+  self->busy = 0;
+
+  self->remaining -= length;
+  return 0;
+}
+
+static PyObject*
+CryptContext_update(CryptContext* self, PyObject* args)
+{
+  Py_buffer input;
+
+  if (!PyArg_ParseTuple(args, "y*", &input))
+  {
     return NULL;
   }
 
-  PyObject* result = rfactor_decrypt_c(input, length, skip);
+  PyObject* result = PyBytes_FromStringAndSize(NULL, input.len);
+  if (result && CryptContext_process(self, (u8*)PyBytes_AsString(result), (const u8*)input.buf, input.len) < 0)
+  {
+    Py_CLEAR(result);
+  }
 
+  PyBuffer_Release(&input);
   return result;
 }
 
+static PyObject*
+CryptContext_update_into(CryptContext* self, PyObject* args)
+{
+  Py_buffer output;
+  Py_buffer input;
+
+  if (!PyArg_ParseTuple(args, "w*y*", &output, &input))
+  {
+    return NULL;
+  }
+
+  PyObject* result = NULL;
+  if (check_output_length(&output, input.len) == 0 &&
+      CryptContext_process(self, (u8*)output.buf, (const u8*)input.buf, input.len) == 0)
+  {
+    result = PyLong_FromSsize_t(input.len);
+  }
+
+  PyBuffer_Release(&input);
+  PyBuffer_Release(&output);
+  return result;
+}
+
+static PyObject*
+CryptContext_finalize(CryptContext* self, PyObject* Py_UNUSED(args))
+{
+  if (self->remaining != 0)
+  {
+    PyErr_Format(PyExc_RuntimeError, "data incomplete, %zd bytes missing", self->remaining);
+    return NULL;
+  }
+
+  return PyBytes_FromStringAndSize(NULL, 0);
+}
+
+static PyObject*
+CryptContext_get_remaining(CryptContext* self, void* Py_UNUSED(closure))
+{
+  return PyLong_FromSsize_t(self->remaining);
+}
+
+static PyMethodDef CryptContext_methods[] = {
+  { "update", (PyCFunction)CryptContext_update, METH_VARARGS, "Encrypt or decrypt the next chunk of data" },
+  { "update_into", (PyCFunction)CryptContext_update_into, METH_VARARGS,
+    "update_into(output, input)\n\nLike update(), but writes into ``output``, which may be ``input`` itself" },
+  { "finalize", (PyCFunction)CryptContext_finalize, METH_NOARGS, "Check that all data has been processed" },
+  { NULL, NULL, 0, NULL },
+};
+
+static PyGetSetDef CryptContext_getset[] = {
+  { "remaining", (getter)CryptContext_get_remaining, NULL, "number of bytes still expected", NULL },
+  { NULL, NULL, NULL, NULL, NULL },
+};
+
+static PyType_Slot CryptContext_slots[] = {
+  { Py_tp_doc, (void*)"CryptContext(key, sign, length, skip, encrypt)\n\n"
+                      "Encrypts or decrypts ``length`` bytes of data, excluding the 16 byte\n"
+                      "header, that are passed in chunks of arbitrary size to update()." },
+  { Py_tp_init, (void*)CryptContext_init },
+  { Py_tp_new, (void*)PyType_GenericNew },
+  { Py_tp_methods, (void*)CryptContext_methods },
+  { Py_tp_getset, (void*)CryptContext_getset },
+  { 0, NULL },
+};
+
+static PyType_Spec CryptContext_spec = {
+  "rfactortools._crypt.CryptContext",
+  sizeof(CryptContext),
+  0,
+  Py_TPFLAGS_DEFAULT,
+  CryptContext_slots
+};
+
+// Module ---------------------------------------------------------------
+
 static PyMethodDef rfactorcrypt_methods[] = {
   { "encrypt", rfactor_encrypt, METH_VARARGS, "Encrypt the given data" },
   { "decrypt", rfactor_decrypt, METH_VARARGS, "Decrypt the given data" },
+  { "encrypt_into", rfactor_encrypt_into, METH_VARARGS,
+    "encrypt_into(output, input, key, sign, skip)\n\n"
+    "Encrypt ``input`` into the ``len(input) + 16`` bytes at the start of ``output``" },
+  { "decrypt_into", rfactor_decrypt_into, METH_VARARGS,
+    "decrypt_into(output, input, skip)\n\n"
+    "Decrypt ``input`` into the ``len(input) - 16`` bytes at the start of ``output``, "
+    "which may be ``input`` itself" },
   { NULL, NULL, 0, NULL },
 };
 
@@ -352,7 +759,21 @@ extern "C"
 PyMODINIT_FUNC
 PyInit__crypt(void)
 {
-  return PyModule_Create(&moduledef);
+  PyObject* module = PyModule_Create(&moduledef);
+  if (!module)
+  {
+    return NULL;
+  }
+
+  PyObject* context_type = PyType_FromSpec(&CryptContext_spec);
+  if (!context_type || PyModule_AddObject(module, "CryptContext", context_type) < 0)
+  {
+    Py_XDECREF(context_type);
+    Py_DECREF(module);
+    return NULL;
+  }
+
+  return module;
 }
 
 /* EOF */
@@ -17,8 +17,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from distutils.core import setup
-from distutils.extension import Extension
+from setuptools import setup, Extension
 
 setup(name='rfactortools',
       version='0.3.1',
@@ -29,6 +28,7 @@ setup(name='rfactortools',
           "gmttool.py",
           "gtr2-to-gsc2013.py",
           "imgtool.py",
+          "masindex.py",
           "maspack.py",
           "masunpack.py",
           "minised-gui.py",
@@ -42,7 +42,10 @@ setup(name='rfactortools',
       ],
       packages=['rfactortools', 'rfactortools.gui'],
       ext_modules=[Extension('rfactortools._crypt', ['rfactortools_crypt.cpp'])],
-      requires=['PIL', 'pathlib'])
+      requires=['PIL', 'pathlib'],
+      python_requires=">=3.9",
+      # fallback for rfactortools._crypt, see crypt_backends()
+      extras_require={"numpy": ["numpy>=1.17"]})
 
 
 # EOF #
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# rfactortools benchmarks
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for the .gen and cmaps.mas lookups of a mod with many liveries
+
+Run with: python3 -m tests.bench_basename_index [LIVERIES]
+"""
+
+
+import os
+import sys
+import tempfile
+import time
+
+import rfactortools
+import rfactortools.veh
+
+
+def write_mod(directory, liveries):
+    """Creates Vehicles/MyMod with a shared .gen and cmaps.mas and
+    ``liveries`` teams of a .veh and a few textures, returns the .veh files"""
+    moddir = os.path.join(directory, "GameData", "Vehicles", "MyMod")
+    os.makedirs(os.path.join(moddir, "Shared"))
+    for fname in ["Shared/car.gen", "Shared/cmaps.mas"]:
+        open(os.path.join(moddir, fname), "w").close()
+
+    veh_files = []
+    for i in range(liveries):
+        teamdir = os.path.join(moddir, "Shared", "Teams", "Team%03d" % i)
+        os.makedirs(teamdir)
+        for fname in ["car.dds", "car_region.dds", "carWINDOW.dds", "icon.tga"]:
+            open(os.path.join(teamdir, fname), "w").close()
+        veh_files.append(os.path.join(teamdir, "car%03d.veh" % i))
+        open(veh_files[-1], "w").close()
+
+    return moddir, veh_files
+
+
+def main():
+    liveries = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+
+    with tempfile.TemporaryDirectory(prefix="rfactortools") as tmpdir:
+        moddir, veh_files = write_mod(tmpdir, liveries)
+
+        def legacy():
+            for veh in veh_files:
+                rfactortools.veh.find_file_backwards(os.path.dirname(veh), "car.gen")
+                rfactortools.find_file(moddir, "cmaps.mas")
+
+        def indexed():
+            index = rfactortools.BasenameIndex(tmpdir)
+            for veh in veh_files:
+                rfactortools.veh.find_file_backwards(os.path.dirname(veh), "car.gen", index)
+                index.find("cmaps.mas", moddir)
+
+        print("%d liveries:" % liveries)
+        for name, func in [("legacy", legacy), ("index", indexed)]:
+            start = time.perf_counter()
+            func()
+            t = time.perf_counter() - start
+            print("  %-8s %8.3f s" % (name, t))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# EOF #
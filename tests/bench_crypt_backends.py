@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+# rfactortools benchmarks
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Throughput of the available crypt backends
+
+Run with: python3 -m tests.bench_crypt_backends [SIZE_KB]
+"""
+
+
+import os
+import sys
+import timeit
+
+import rfactortools.crypt
+
+
+signs = [("enctype 0", 0x38af5637e81bc9a0),
+         ("enctype 1", 0x4b1dca9f960524e8)]
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else 4096) * 1024
+    data = os.urandom(size)
+
+    print("%d KiB of data:" % (size // 1024))
+    for name, backend in rfactortools.crypt.crypt_backends.items():
+        for enctype, sign in signs:
+            encrypted = backend.encrypt(data, 1, sign, 0)
+            for op, func in [("encrypt", lambda: backend.encrypt(data, 1, sign, 0)),
+                             ("decrypt", lambda: backend.decrypt(encrypted, 0))]:
+                t = min(timeit.repeat(func, number=1, repeat=3))
+                print("  %-6s %-10s %-8s %10.1f MB/s" % (name, enctype, op, size / t / 1000000))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# EOF #
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# rfactortools benchmarks
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Micro-benchmark of the C crypt loop for small and large entries
+
+Small entries are dominated by the per call overhead and key setup,
+large ones by the crypt loop itself.
+
+Run with: python3 -m tests.bench_crypt_kernel
+"""
+
+
+import os
+import timeit
+
+import rfactortools._crypt
+
+
+signs = [("enctype 0", 0x38af5637e81bc9a0),
+         ("enctype 1", 0x4b1dca9f960524e8)]
+
+sizes = [64, 1024, 64 * 1024, 4 * 1024 * 1024]
+
+
+def main():
+    for enctype, sign in signs:
+        for size in sizes:
+            data = os.urandom(size)
+            encrypted = rfactortools._crypt.encrypt(data, 1, sign, 4)
+            number = max(1, (16 * 1024 * 1024) // size)
+
+            for op, func in [("encrypt", lambda: rfactortools._crypt.encrypt(data, 1, sign, 4)),
+                             ("decrypt", lambda: rfactortools._crypt.decrypt(encrypted, 4))]:
+                t = min(timeit.repeat(func, number=number, repeat=3)) / number
+                print("%-10s %-8s %8d bytes %10.2f us %10.1f MB/s" % (enctype, op, size, t * 1e6, size / t / 1e6))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# EOF #
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# rfactortools benchmarks
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for encrypting .mas entries on multiple threads
+
+Run with: python3 -m tests.bench_crypt_threads [ENTRIES] [SIZE_KB]
+"""
+
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import tempfile
+import time
+
+import rfactortools
+
+
+def bench_encrypt(entries, jobs):
+    encryptor = rfactortools.MASEncryptor()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        start = time.perf_counter()
+        list(executor.map(lambda entry: encryptor(*entry), entries))
+        return time.perf_counter() - start
+
+
+def bench_pack(entries, jobs, masfile):
+    encryptor = rfactortools.MASEncryptor()
+    policy = rfactortools.MASCompressionPolicy(level=1)
+    start = time.perf_counter()
+    rfactortools.mas_pack_from_iter(entries, masfile, jobs=jobs, policy=policy, transform=encryptor)
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    size = (int(sys.argv[2]) if len(sys.argv) > 2 else 1024) * 1024
+
+    entries = [("car%03d.gmt" % i, os.urandom(size)) for i in range(count)]
+    total = count * size / (1024 * 1024)
+
+    print("%d entries of %d KiB, %d cpus:" % (count, size // 1024, os.cpu_count()))
+    with tempfile.TemporaryDirectory(prefix="rfactortools") as tmpdir:
+        masfile = os.path.join(tmpdir, "bench.mas")
+        for name, func in [("encrypt", lambda jobs: bench_encrypt(entries, jobs)),
+                           ("pack", lambda jobs: bench_pack(entries, jobs, masfile))]:
+            base = None
+            for jobs in sorted({1, 2, 4, 8, os.cpu_count()}):
+                t = min(func(jobs) for _ in range(3))
+                base = base or t
+                print("  %-8s jobs=%-3d %8.2f s  %8.1f MiB/s  %5.2fx" % (name, jobs, t, total / t, base / t))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# EOF #
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# rfactortools benchmarks
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for case insensitive path lookups in a large GameData tree
+
+Run with: python3 -m tests.bench_icase_lookup [FILES] [LOOKUPS]
+"""
+
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+import rfactortools.util
+
+
+def legacy_lookup_path_icase(root, rest):
+    """The previous uncached lookup, for comparison"""
+    if not rest:
+        return [os.path.normpath(root)]
+    else:
+        results = []
+        if os.path.isdir(root):
+            for f in os.listdir(root):
+                if f.lower() == rest[0].lower():
+                    p = os.path.join(root, f)
+                    results += legacy_lookup_path_icase(p, rest[1:])
+        return results
+
+
+def write_gamedata(directory, count):
+    """Creates a GameData/Vehicles tree with ``count`` empty files in
+    mods of 20 cars of 50 files each, returns their relative paths"""
+    files = []
+    for i in range(count):
+        mod, car, n = i // 1000, (i // 50) % 20, i % 50
+        files.append(os.path.join("GameData", "Vehicles", "Mod%03d" % mod, "Car%02d" % car, "file%02d.dds" % n))
+
+    for relpath in files:
+        path = os.path.join(directory, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+
+    # move everything out of the racy window of the index
+    mtime = time.time() - 60
+    for path, dirs, fnames in os.walk(directory):
+        os.utime(path, (mtime, mtime))
+
+    return files
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    with tempfile.TemporaryDirectory(prefix="rfactortools") as tmpdir:
+        files = write_gamedata(tmpdir, count)
+        queries = [relpath.upper() for relpath in random.Random(0).sample(files, min(lookups, len(files)))]
+        queries = [(tmpdir, tuple(q.split(os.sep))) for q in queries]
+
+        index = rfactortools.util.CaseInsensitiveIndex()
+        assert [legacy_lookup_path_icase(*q) for q in queries[:10]] == [index.lookup(*q) for q in queries[:10]]
+
+        print("%d files, %d lookups:" % (count, len(queries)))
+        for name, func in [("legacy", legacy_lookup_path_icase),
+                           ("index", rfactortools.util.CaseInsensitiveIndex().lookup)]:
+            start = time.perf_counter()
+            for q in queries:
+                func(*q)
+            t = time.perf_counter() - start
+            print("  %-8s %8.3f s  %10.0f lookups/s" % (name, t, len(queries) / t))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# EOF #
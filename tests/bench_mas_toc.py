@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# rfactortools benchmarks
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for reading the file table of huge .mas files
+
+Run with: python3 -m tests.bench_mas_toc [ENTRIES]
+"""
+
+
+import os
+import struct
+import sys
+import tempfile
+import timeit
+
+import rfactortools.mas
+
+
+def legacy_file_table(fin):
+    """The previous one entry at a time decoder, for comparison"""
+    fin.seek(16)
+    file_count, data_size = struct.unpack("<4xll", fin.read(12))
+
+    file_table = []
+    for i in range(0, file_count):
+        entry = rfactortools.mas.MASFileEntry(*struct.unpack("<BBxx236slll4x", fin.read(256)))
+        entry.name = entry.name.split(b'\0', 1)[0].decode('latin-1')
+        file_table.append(entry)
+
+    base_offset = fin.tell()
+    for entry in file_table:
+        entry.offset += base_offset
+
+    return file_table
+
+
+def write_synthetic_mas(masfile, count):
+    """Writes a mas_type 1 file with ``count`` empty entries"""
+    file_table = [(rfactortools.mas.MASFileType.DDS, 0, "texture%06d.dds" % i, 0, 0, 0) for i in range(count)]
+    with open(masfile, "wb") as fout:
+        rfactortools.mas._write_mas_header(fout, 1, len(file_table), 0)
+        rfactortools.mas._write_file_table(fout, 1, file_table)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    with tempfile.TemporaryDirectory(prefix="rfactortools") as tmpdir:
+        masfile = os.path.join(tmpdir, "synthetic.mas")
+        write_synthetic_mas(masfile, count)
+
+        def bench(func):
+            with open(masfile, "rb") as fin:
+                return func(fin)
+
+        assert [e.name for e in bench(legacy_file_table)] == \
+            [e.name for e in bench(rfactortools.mas.mas_unpack_file_table)]
+
+        print("%d entries:" % count)
+        for name, func in [("legacy", legacy_file_table),
+                           ("bulk", rfactortools.mas.mas_unpack_file_table)]:
+            t = min(timeit.repeat(lambda: bench(func), number=1, repeat=10))
+            print("  %-8s %8.2f ms  %8.0f entries/s" % (name, t * 1000, count / t))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# EOF #
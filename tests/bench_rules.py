@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# rfactortools benchmarks
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark for rewriting the lines of .veh and .gdb files
+
+Run with: python3 -m tests.bench_rules [VEHFILES]
+"""
+
+
+import re
+import sys
+import time
+
+import rfactortools
+import rfactortools.gsc2013
+
+
+def legacy_veh_lines(cfg, lines, mod_name):
+    """The previous per line rewrite of convert_veh(), for comparison"""
+
+    if cfg.unique_team_names:
+        team_suffix = " %s" % mod_name
+    else:
+        team_suffix = ""
+
+    for line in lines:
+        if cfg.clear_classes:
+            line = re.sub(r'^Classes=".*',
+                          r'Classes="%s"' % cfg.reiza_class,
+                          line, flags=re.IGNORECASE)
+        elif cfg.reiza_class:
+            line = re.sub(r'^Classes="',
+                          r'Classes="%s,' % cfg.reiza_class,
+                          line, flags=re.IGNORECASE)
+
+        line = re.sub(r'^Team="([^"]*)"',
+                      r'Team="\1%s"' % team_suffix,
+                      line, flags=re.IGNORECASE)
+
+        if cfg.vehicle_category:
+            line = re.sub(r'^Category="([^"]*)"',
+                          r'Category="%s, \1"' % cfg.vehicle_category,
+                          line, flags=re.IGNORECASE)
+
+        yield line
+
+
+def legacy_gdb_lines(cfg, lines):
+    """The previous per line rewrite of convert_gdb(), for comparison"""
+
+    for line in lines:
+        line = re.sub(r'Filter Properties *=.*',
+                      r'Filter Properties = %s' % cfg.track_filter_properties,
+                      line, flags=re.IGNORECASE)
+
+        if cfg.track_category:
+            line = re.sub(r'^(\s*)VenueName\s*=\s*(.*)',
+                          r'\1VenueName = %s, \2' % cfg.track_category,
+                          line, flags=re.IGNORECASE)
+
+        yield line
+
+
+def veh_lines(i):
+    """A typical .veh file of about 40 lines"""
+    lines = ['DefaultLivery="car%d.dds"\n' % i,
+             'HDVehicle=car.hdv\n',
+             'Graphics=car.gen\n',
+             'Spinner=car_spinner.gen\n',
+             'Classes="F1, Open Wheel"\n',
+             'Category="Formula, Season 2013"\n',
+             'Team="Team %d"\n' % i,
+             'Driver="Driver %d"\n' % i,
+             'Description="Car %d"\n' % i,
+             'Number=%d\n' % i]
+    lines += ['// comment %d about the setup of the car\n' % n for n in range(10)]
+    lines += ['Sounds%d=car_sound%d.sfx\n' % (n, n) for n in range(10)]
+    lines += ['Upgrades%d=car_upgrades%d.ini  // no team here\n' % (n, n) for n in range(10)]
+    return lines
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    cfg = rfactortools.rFactorToGSC2013Config()
+    cfg.vehicle_category = "Classic"
+    cfg.track_category = "Classic"
+    files = [veh_lines(i) for i in range(count)]
+    gdb = ['VenueName = Monza\n', 'Filter Properties = F1\n'] + ['TrackData%d = 1\n' % n for n in range(40)]
+
+    for name, legacy, compiled in [
+            (".veh",
+             lambda: [list(legacy_veh_lines(cfg, lines, "MyMod")) for lines in files],
+             lambda: [[rules.veh("MyMod").rewrite(line) for line in lines] for lines in files]),
+            (".gdb",
+             lambda: [list(legacy_gdb_lines(cfg, gdb)) for lines in files],
+             lambda: [[rules.gdb.rewrite(line) for line in gdb] for lines in files])]:
+
+        start = time.perf_counter()
+        expected = legacy()
+        t_legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rules = rfactortools.gsc2013.ConversionRules(cfg)
+        result = compiled()
+        t_compiled = time.perf_counter() - start
+
+        assert result == expected
+        print("%d %s files: legacy %.3f s, rules %.3f s, %.1fx" %
+              (count, name, t_legacy, t_compiled, t_legacy / t_compiled))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# EOF #
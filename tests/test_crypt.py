@@ -17,7 +17,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import os
+import shutil
+import tempfile
 import unittest
+
+import rfactortools
 import rfactortools.crypt
 
 
@@ -50,6 +55,208 @@ class CryptTestCase(unittest.TestCase):
         self.assertEqual(data_out, expected_out)
         self.assertEqual(rfactortools.crypt.decrypt_data(data_out, 0), data_in)
 
+    def test_transcode(self):
+        data = b"GMT" * 100
+        gsc_data, action = rfactortools.crypt.transcode(data, 1, 0x4b1dca9f960524e8, 4)
+        self.assertEqual(action, "encrypted")
+
+        result, action = rfactortools.crypt.transcode(gsc_data, 1, 0x4b1dca9f960524e8, 4)
+        self.assertEqual(action, "passthrough")
+        self.assertIs(result, gsc_data)
+
+        rfactor_data = rfactortools.crypt.encrypt_data(data, 1, 0x38af5637e81bc9a0, 4)
+        self.assertEqual(rfactortools.crypt.transcode(rfactor_data, 1, 0x4b1dca9f960524e8, 4),
+                         (gsc_data, "reencrypted"))
+
+        # the right signature on the outside isn't enough, inner layers get removed
+        layered = rfactortools._crypt.encrypt(rfactor_data, 1, 0x4b1dca9f960524e8, 4)
+        self.assertEqual(rfactortools.crypt.transcode(layered, 1, 0x4b1dca9f960524e8, 4),
+                         (gsc_data, "reencrypted"))
+
+    def test_crypt_context(self):
+        data = os.urandom(1000)
+        for sign in [0x38af5637e81bc9a0, 0x4b1dca9f960524e8]:
+            encrypted = rfactortools.crypt.encrypt_data(data, 0xdeadbeaf, sign, 4)
+
+            context = rfactortools._crypt.CryptContext(0xdeadbeaf, sign, len(data), 4, True)
+            chunks = [context.update(data[i:i + 7]) for i in range(0, len(data), 7)]
+            context.finalize()
+            self.assertEqual(b"".join(chunks), encrypted[16:])
+
+            context = rfactortools._crypt.CryptContext(0xdeadbeaf, sign, len(data), 4, False)
+            self.assertEqual(context.update(encrypted[16:500]) + context.update(encrypted[500:]), data)
+            self.assertEqual(context.remaining, 0)
+            with self.assertRaises(ValueError):
+                context.update(b"X")
+
+        context = rfactortools._crypt.CryptContext(1, 0x4b1dca9f960524e8, len(data), 0, True)
+        context.update(data[:10])
+        with self.assertRaises(RuntimeError):
+            context.finalize()
+
+    def test_crypt_into(self):
+        data = os.urandom(1000)
+        encrypted = rfactortools._crypt.encrypt(data, 5, 0x4b1dca9f960524e8, 4)
+
+        buf = bytearray(2000)
+        self.assertEqual(rfactortools._crypt.encrypt_into(buf, memoryview(data), 5, 0x4b1dca9f960524e8, 4), 1016)
+        self.assertEqual(buf[:1016], encrypted)
+        self.assertEqual(rfactortools._crypt.decrypt(memoryview(buf)[:1016], 4), data)
+
+        # in place
+        self.assertEqual(rfactortools._crypt.decrypt_into(buf, memoryview(buf)[:1016], 4), 1000)
+        self.assertEqual(buf[:1000], data)
+
+        with self.assertRaises(ValueError):
+            rfactortools._crypt.encrypt_into(bytearray(1000), data, 5, 0x4b1dca9f960524e8, 4)
+        with self.assertRaises(TypeError):
+            rfactortools._crypt.decrypt_into(encrypted, encrypted, 4)
+
+        # several layers, from a read-only buffer
+        layered = rfactortools._crypt.encrypt(encrypted, 7, 0x38af5637e81bc9a0, 4)
+        self.assertEqual(rfactortools.crypt.decrypt_data(memoryview(layered), 4), data)
+
+    def test_crypt_file(self):
+        tmpdir = tempfile.mkdtemp(prefix='rfactortools')
+        try:
+            data = os.urandom(5000)
+            # encrypted twice, both layers get removed
+            encrypted = rfactortools.crypt.encrypt_data(data, 5, 0x38af5637e81bc9a0, 4)
+            encrypted = rfactortools._crypt.encrypt(encrypted, 7, 0x38af5637e81bc9a0, 4)
+
+            filename = os.path.join(tmpdir, "car.gmt")
+            with open(filename, "wb") as fout:
+                fout.write(encrypted)
+
+            self.assertEqual(rfactortools.crypt.encrypt_file(filename, filename, chunk_size=7), "reencrypted")
+            with open(filename, "rb") as fin:
+                self.assertEqual(fin.read(), rfactortools.crypt.encrypt_data(data, 1, 0x4b1dca9f960524e8, 4))
+
+            copy = os.path.join(tmpdir, "copy.gmt")
+            self.assertEqual(rfactortools.crypt.encrypt_file(filename, copy), "passthrough")
+            with open(filename, "rb") as lhs, open(copy, "rb") as rhs:
+                self.assertEqual(lhs.read(), rhs.read())
+            os.remove(copy)
+
+            rfactortools.crypt.decrypt_file(filename, filename, chunk_size=100)
+            with open(filename, "rb") as fin:
+                self.assertEqual(fin.read(), data)
+
+            self.assertEqual(os.listdir(tmpdir), ["car.gmt"])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_scan_crypt_info(self):
+        tmpdir = tempfile.mkdtemp(prefix='rfactortools')
+        try:
+            gsc_data = rfactortools.crypt.encrypt_data(b"GMT" * 100, 1, 0x4b1dca9f960524e8, 4)
+            rfactor_data = rfactortools.crypt.encrypt_data(b"GMT" * 100, 1, 0x38af5637e81bc9a0, 4)
+            files = [("gsc.gmt", gsc_data), ("rfactor.gmt", rfactor_data), ("plain.dds", b"DDS" * 100)]
+
+            moddir = os.path.join(tmpdir, "mod")
+            os.mkdir(moddir)
+            rfactortools.mas_pack_from_data(files, os.path.join(moddir, "car.mas"))
+            for name, data in files:
+                with open(os.path.join(moddir, name), "wb") as fout:
+                    fout.write(data)
+
+            cache = rfactortools.CryptInfoCache(os.path.join(tmpdir, "cache.json"))
+            results = rfactortools.scan_crypt_info([moddir], mas_entries=True, cache=cache)
+            cache.save()
+            self.assertEqual(sorted((os.path.basename(r["file"]), r["entry"], r["game"]) for r in results),
+                             [("car.mas", "gsc.gmt", "Game Stock Car"),
+                              ("car.mas", "plain.dds", None),
+                              ("car.mas", "rfactor.gmt", "rFactor"),
+                              ("gsc.gmt", None, "Game Stock Car"),
+                              ("plain.dds", None, None),
+                              ("rfactor.gmt", None, "rFactor")])
+            self.assertEqual(rfactortools.summarize_crypt_info(results),
+                             {"Game Stock Car": (2, 632), "rFactor": (2, 632), None: (2, 600)})
+
+            cache = rfactortools.CryptInfoCache(os.path.join(tmpdir, "cache.json"))
+            self.assertEqual(rfactortools.scan_crypt_info([moddir], mas_entries=True, cache=cache), results)
+            self.assertEqual((cache.hits, cache.misses), (4, 0))
+
+            # unreadable files are reported, the others still get scanned
+            missing = os.path.join(moddir, "missing.gmt")
+            results = rfactortools.scan_crypt_info([moddir, missing], mas_entries=True)
+            self.assertEqual(len(results), 7)
+            self.assertEqual([r["file"] for r in results if r["error"] is not None], [missing])
+            self.assertEqual(list(rfactortools.summarize_crypt_info(results).items())[-1], ("error", (1, 0)))
+
+            # broken archives are reported too and never cached
+            masfile = os.path.join(moddir, "car.mas")
+            with open(masfile, "r+b") as fout:
+                fout.truncate(40)
+            for _ in range(2):
+                cache = rfactortools.CryptInfoCache(os.path.join(tmpdir, "cache.json"))
+                results = rfactortools.scan_crypt_info([moddir], mas_entries=True, cache=cache)
+                cache.save()
+                self.assertEqual(len(results), 4)
+                self.assertEqual([r["file"] for r in results if r["error"] is not None], [masfile])
+                self.assertEqual((cache.hits, cache.misses), (3, 1))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_mas_encryptor_entries(self):
+        """Entries already encrypted for GSC2013 keep their compressed data"""
+        tmpdir = tempfile.mkdtemp(prefix='rfactortools')
+        try:
+            gsc_data = rfactortools.crypt.encrypt_data(b"GMT" * 100, 1, 0x4b1dca9f960524e8, 4)
+            rfactor_data = rfactortools.crypt.encrypt_data(b"GMT" * 100, 1, 0x38af5637e81bc9a0, 4)
+            files = [("gsc.gmt", gsc_data), ("rfactor.gmt", rfactor_data), ("plain.dds", b"DDS" * 100)]
+
+            masfile = os.path.join(tmpdir, "in.mas")
+            rfactortools.mas_pack_from_data(files, masfile)
+
+            with rfactortools.MASArchive(masfile) as mas:
+                encryptor = rfactortools.crypt.MASEncryptor()
+                entries = list(encryptor.entries(mas))
+                self.assertIsInstance(entries[0], rfactortools.MASCompressedEntry)
+                self.assertEqual(entries[0].zdata, mas.read_raw("gsc.gmt"))
+                self.assertEqual(entries[1], ("rfactor.gmt", rfactor_data))
+                self.assertEqual(entries[2], ("plain.dds", b"DDS" * 100))
+
+                outfile = os.path.join(tmpdir, "out.mas")
+                rfactortools.mas_pack_from_iter(entries, outfile, transform=encryptor)
+                del entries
+                self.assertEqual(encryptor.actions, {"passthrough": 1, "reencrypted": 1, "encrypted": 1})
+
+            self.assertEqual([(name, rfactortools.crypt.decrypt_data(data, rfactortools.crypt.get_skip(name)))
+                              for name, data in rfactortools.mas_unpack_to_data(outfile)],
+                             [("gsc.gmt", b"GMT" * 100), ("rfactor.gmt", b"GMT" * 100), ("plain.dds", b"DDS" * 100)])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_mas_encryptor(self):
+        tmpdir = tempfile.mkdtemp(prefix='rfactortools')
+        try:
+            files = [("a.gmt", b"GMT" * 100), ("b.gmt", b"GMT" * 100), ("c.dds", b"DDS" * 100)]
+            cache = rfactortools.MASBlobCache()
+            encryptor = rfactortools.crypt.MASEncryptor()
+
+            masfile = os.path.join(tmpdir, "out.mas")
+            # a single job, so the duplicate is only looked up once the first one is done
+            rfactortools.mas_pack_from_iter(files, masfile, jobs=1, cache=cache, transform=encryptor)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+            self.assertEqual(encryptor.actions, {"encrypted": 3})
+
+            self.assertEqual(rfactortools.mas_unpack_to_data(masfile),
+                             [(name, encryptor(name, data)) for name, data in files])
+
+            # warm cache, the actions are still counted
+            encryptor = rfactortools.crypt.MASEncryptor()
+            other = rfactortools.crypt.encrypt_data(b"GMT" * 100, 1, 0x38af5637e81bc9a0, 4)
+            rfactortools.mas_pack_from_iter(files + [("d.gmt", other)], masfile, jobs=1, cache=cache,
+                                            transform=encryptor)
+            self.assertEqual((cache.hits, cache.misses), (4, 3))
+            self.assertEqual(encryptor.actions, {"encrypted": 3, "reencrypted": 1})
+            rfactortools.mas_pack_from_iter(files + [("d.gmt", other)], masfile, jobs=1, cache=cache,
+                                            transform=encryptor)
+            self.assertEqual(encryptor.actions, {"encrypted": 6, "reencrypted": 2})
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# rfactortools test cases
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import random
+import unittest
+
+import rfactortools.crypt
+
+
+@unittest.skipUnless("c" in rfactortools.crypt.crypt_backends and "numpy" in rfactortools.crypt.crypt_backends,
+                     "requires both the C and the NumPy crypt backend")
+class CryptNumpyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.c = rfactortools.crypt.crypt_backends["c"]
+        self.numpy = rfactortools.crypt.crypt_backends["numpy"]
+        self.random = random.Random(0)
+
+    def test_identical_to_c(self):
+        """Sizes around the block boundaries of both enctypes, plus some large ones"""
+        for sign in [0x38af5637e81bc9a0, 0x4b1dca9f960524e8]:
+            for skip in [0, 4]:
+                for size in [4, 5, 63, 64, 65, 127, 128, 129, 1000, 70000, 300000]:
+                    data = os.urandom(size)
+                    key = self.random.getrandbits(64)
+                    encrypted = self.c.encrypt(data, key, sign, skip)
+                    self.assertEqual(self.numpy.encrypt(data, key, sign, skip), encrypted)
+                    self.assertEqual(self.numpy.decrypt(encrypted, skip), data)
+
+    def test_context_chunked(self):
+        for sign in [0x38af5637e81bc9a0, 0x4b1dca9f960524e8]:
+            data = os.urandom(5000)
+            encrypted = self.c.encrypt(data, 7, sign, 4)
+
+            for encrypt, source, expected in [(True, data, encrypted[16:]), (False, encrypted[16:], data)]:
+                context = self.numpy.CryptContext(7, sign, len(data), 4, encrypt)
+                chunks = []
+                pos = 0
+                while pos < len(source):
+                    n = self.random.randint(1, 300)
+                    chunks.append(context.update(source[pos:pos + n]))
+                    pos += n
+                context.finalize()
+                self.assertEqual(b"".join(chunks), expected)
+
+    def test_decrypt_into_in_place(self):
+        data = os.urandom(1000)
+        buf = bytearray(self.c.encrypt(data, 5, 0x4b1dca9f960524e8, 4))
+        self.assertEqual(self.numpy.decrypt_into(buf, memoryview(buf), 4), 1000)
+        self.assertEqual(buf[:1000], data)
+
+    def test_errors(self):
+        for backend in [self.c, self.numpy]:
+            with self.assertRaises(RuntimeError):
+                backend.encrypt(b"My Data", 1, 0x4b1dca9f960524e8, 6)
+            with self.assertRaises(RuntimeError):
+                backend.encrypt(b"My Data", 1, 0x1234, 0)
+            with self.assertRaises(RuntimeError):
+                backend.decrypt(b"short", 0)
+            with self.assertRaises(ValueError):
+                backend.encrypt_into(bytearray(10), b"My Data", 1, 0x4b1dca9f960524e8, 0)
+            with self.assertRaises(TypeError):
+                backend.decrypt_into(bytes(100), backend.encrypt(b"My Data", 1, 0x4b1dca9f960524e8, 0), 0)
+
+    def test_select_backend(self):
+        data = b"GMT" * 1000
+        expected = rfactortools.crypt.encrypt_data(data, 1, 0x4b1dca9f960524e8, 4)
+
+        backend = rfactortools.crypt.get_crypt_backend()
+        try:
+            rfactortools.crypt.set_crypt_backend("numpy")
+            self.assertEqual(rfactortools.crypt.get_crypt_backend(), "numpy")
+            self.assertEqual(rfactortools.crypt.encrypt_data(data, 1, 0x4b1dca9f960524e8, 4), expected)
+            self.assertEqual(rfactortools.crypt.decrypt_data(expected, 4), data)
+        finally:
+            rfactortools.crypt.set_crypt_backend(backend)
+
+        with self.assertRaises(RuntimeError):
+            rfactortools.crypt.set_crypt_backend("missing")
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# EOF #
@@ -17,16 +17,97 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
 import unittest
+import unittest.mock
+import zlib
+
+import PIL.Image
+
 import rfactortools.gsc2013
 
 
 class GSC2013TestCase(unittest.TestCase):
     def setUp(self):
-        pass  # print("setUp()")
+        self.tmpdir = tempfile.mkdtemp(prefix='rfactortools')
 
     def tearDown(self):
-        pass  # print("tearDown()")
+        shutil.rmtree(self.tmpdir)
+
+    def write_mod(self):
+        source = os.path.join(self.tmpdir, "source")
+        for i in range(8):
+            teamdir = os.path.join(source, "GameData", "Vehicles", "MyMod", "Team%d" % i)
+            os.makedirs(teamdir)
+            with open(os.path.join(teamdir, "car%d.veh" % i), "w") as fout:
+                fout.write('Team="Team %d"\nClasses="F1"\n' % i)
+            with open(os.path.join(teamdir, "readme.txt"), "w") as fout:
+                fout.write("Team %d\n" % i)
+        return source
+
+    def convert(self, source, jobs, cfg=None, target="target"):
+        cfg = cfg or rfactortools.rFactorToGSC2013Config()
+        cfg.jobs = jobs
+        converter = rfactortools.rFactorToGSC2013(source, cfg)
+
+        events = []
+        converter.progress_cb = lambda *args: events.append(args)
+        target = os.path.join(self.tmpdir, target)
+        converter.convert_all(target)
+        return target, events
+
+    def count_events(self, events):
+        return (len([args for args in events if args[0] == "file_done"]),
+                len([args for args in events if args[0] == "file_uptodate"]))
+
+    def read_tree(self, directory):
+        result = {}
+        for path in rfactortools.find_files(directory):
+            if os.path.basename(path) in (rfactortools.gsc2013.manifest_filename, rfactortools.gsc2013.stats_filename):
+                continue
+            with open(path, "rb") as fin:
+                result[os.path.relpath(path, directory)] = fin.read()
+        return result
+
+    def test_parallel_conversion(self):
+        source = self.write_mod()
+        serial, serial_events = self.convert(source, 1)
+        parallel, parallel_events = self.convert(source, 4, target="parallel")
+
+        self.assertEqual(parallel_events[:-2], serial_events[:-2])
+        self.assertEqual(serial_events[0], ("start",))
+        self.assertEqual(serial_events[-2][0], "stats")
+        self.assertEqual(serial_events[-1], ("finished",))
+        self.assertEqual(len([args for args in serial_events if args[0] == "file_done"]), 16)
+
+        self.assertEqual(self.read_tree(parallel), self.read_tree(serial))
+        veh = os.path.join(parallel, "GameData", "Vehicles", "MyMod", "Team3", "car3.veh")
+        with open(veh, "r", newline="") as fin:
+            self.assertEqual(fin.read(), 'Team="Team 3 MyMod"\r\nClasses="reiza5,F1"\r\n')
+
+    def test_job_error(self):
+        source = self.write_mod()
+        record_stats = rfactortools.rFactorToGSC2013.record_stats
+
+        def failing_record_stats(converter, handler, modname, filename, status, *args):
+            if status == "done" and filename.endswith("car3.veh"):
+                raise OSError("failed")
+            record_stats(converter, handler, modname, filename, status, *args)
+
+        with unittest.mock.patch.object(rfactortools.rFactorToGSC2013, "record_stats", failing_record_stats):
+            for jobs in (1, 4):
+                target, events = self.convert(source, jobs, target="target%d" % jobs)
+                self.assertEqual(self.count_events(events), (15, 0))
+                errors = [args for args in events if args[0] == "file_error"]
+                self.assertEqual(errors,
+                                 [("file_error", "MyMod", os.path.join("Vehicles", "MyMod", "Team3", "car3.veh"))])
+                self.assertEqual(events[-1], ("finished",))
 
     def test_find_sublist(self):
         self.assertEqual(rfactortools.gsc2013.find_sublist([0, 1, 2, 3, 4, 5, 6, 7, 8], [3, 4, 5]), 3)
@@ -66,6 +147,228 @@ class GSC2013TestCase(unittest.TestCase):
             self.assertEqual(rfactortools.gsc2013.find_track_directory_from_searchpath(d, sp), expected,
                              "(%r, %r)" % (d, sp))
 
+    def test_incremental_conversion(self):
+        source = self.write_mod()
+        target, events = self.convert(source, 1)
+        self.assertEqual(self.count_events(events), (16, 0))
+        self.assertTrue(os.path.isfile(os.path.join(target, rfactortools.gsc2013.manifest_filename)))
+
+        target, events = self.convert(source, 1)
+        self.assertEqual(self.count_events(events), (0, 16))
+
+        # changed content, touched but unchanged, deleted output
+        teamdir = os.path.join(source, "GameData", "Vehicles", "MyMod", "Team1")
+        with open(os.path.join(teamdir, "car1.veh"), "a") as fout:
+            fout.write('Category="Race"\n')
+        st = os.stat(os.path.join(teamdir, "readme.txt"))
+        os.utime(os.path.join(teamdir, "readme.txt"), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        os.remove(os.path.join(target, "GameData", "Vehicles", "MyMod", "Team2", "readme.txt"))
+
+        target, events = self.convert(source, 4)
+        self.assertEqual(self.count_events(events), (2, 14))
+        with open(os.path.join(target, "GameData", "Vehicles", "MyMod", "Team1", "car1.veh"), "r") as fin:
+            self.assertIn('Category="Race"', fin.read())
+
+        # different settings convert everything again
+        cfg = rfactortools.rFactorToGSC2013Config()
+        cfg.reiza_class = "reiza6"
+        target, events = self.convert(source, 4, cfg)
+        self.assertEqual(self.count_events(events), (16, 0))
+
+        cfg = rfactortools.rFactorToGSC2013Config()
+        cfg.reiza_class = "reiza6"
+        cfg.incremental = False
+        target, events = self.convert(source, 1, cfg)
+        self.assertEqual(self.count_events(events), (16, 0))
+
+    def test_incremental_unreadable_source(self):
+        source = self.write_mod()
+        teamdir = os.path.join(source, "GameData", "Vehicles", "MyMod", "Team1")
+        converter = rfactortools.rFactorToGSC2013(source, rfactortools.rFactorToGSC2013Config())
+        events = []
+        converter.progress_cb = lambda *args: events.append(args)
+        target = os.path.join(self.tmpdir, "target")
+        plan = converter.plan(target)
+
+        # source gone after planning
+        os.remove(os.path.join(teamdir, "readme.txt"))
+        converter.convert_all(target, plan)
+        self.assertEqual(self.count_events(events), (15, 0))
+        self.assertEqual(len([args for args in events if args[0] == "file_error"]), 1)
+        self.assertEqual(events[-1], ("finished",))
+
+        # source can't be hashed, neither for checking nor for recording
+        with open(os.path.join(teamdir, "readme.txt"), "w") as fout:
+            fout.write("Team 1\n")
+        st = os.stat(os.path.join(teamdir, "car1.veh"))
+        os.utime(os.path.join(teamdir, "car1.veh"), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        with unittest.mock.patch("rfactortools.manifest.hash_file", side_effect=PermissionError("denied")):
+            target, events = self.convert(source, 1)
+        self.assertEqual(self.count_events(events), (2, 14))
+
+        target, events = self.convert(source, 1)
+        self.assertEqual(self.count_events(events), (2, 14))
+        target, events = self.convert(source, 1)
+        self.assertEqual(self.count_events(events), (0, 16))
+
+    def test_plan(self):
+        source = self.write_mod()
+        moddir = os.path.join(source, "GameData", "Vehicles", "MyMod")
+        rfactortools.mas_pack_from_data([("a.txt", b"a" * 1000), ("b.txt", b"b" * 3000)],
+                                        os.path.join(moddir, "car.mas"))
+        PIL.Image.new("RGB", (64, 32)).save(os.path.join(moddir, "Team0", "car0number.tga"))
+
+        converter = rfactortools.rFactorToGSC2013(source, rfactortools.rFactorToGSC2013Config())
+        target = os.path.join(self.tmpdir, "target")
+        plan = converter.plan(target)
+        self.assertFalse(os.path.exists(target))
+
+        self.assertEqual(len(plan.steps), 1)
+        files = {os.path.basename(f.filename): f for f in plan.files()}
+        self.assertEqual(len(list(plan.files())), 18)
+        self.assertEqual(files["car.mas"].handler, "mas")
+        self.assertEqual(files["car.mas"].cost, files["car.mas"].size + 2 * 4000)
+        self.assertEqual(files["car0number.tga"].handler, "tga")
+        self.assertEqual(files["car0number.tga"].cost, files["car0number.tga"].size + 64 * 32 * 4)
+        self.assertEqual(files["car3.veh"].handler, "veh")
+        self.assertEqual(files["readme.txt"].handler, "copy")
+        self.assertEqual(plan.summary()["mas"], (1, files["car.mas"].size, files["car.mas"].cost))
+
+        fout = io.StringIO()
+        plan.write(fout)
+        self.assertIn("car.mas", fout.getvalue())
+
+        events = []
+        converter.progress_cb = lambda *args: events.append(args)
+        converter.convert_all(target, plan)
+        progress = [args[1:] for args in events if args and args[0] == "progress"]
+        self.assertEqual(progress[0], (0, plan.total_cost))
+        self.assertEqual(progress[-1], (plan.total_cost, plan.total_cost))
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(len(progress), 19)
+
+    def test_convert_mod_subdir(self):
+        source = self.write_mod()
+        gamedata = os.path.join(source, "GameData")
+        target = os.path.join(self.tmpdir, "target")
+
+        converter = rfactortools.rFactorToGSC2013(source, rfactortools.rFactorToGSC2013Config())
+        events = []
+        converter.progress_cb = lambda *args: events.append(args)
+        converter.copy_directory_hierachy(gamedata, target)
+        converter.convert_mod_subdir(gamedata, target, os.path.join("Vehicles", "MyMod"), "MyMod")
+
+        self.assertEqual(self.count_events(events), (16, 0))
+        with open(os.path.join(target, "Vehicles", "MyMod", "Team3", "car3.veh"), "r", newline="") as fin:
+            self.assertEqual(fin.read(), 'Team="Team 3 MyMod"\r\nClasses="reiza5,F1"\r\n')
+
+    def test_stats(self):
+        source = self.write_mod()
+        cfg = rfactortools.rFactorToGSC2013Config()
+        cfg.stats_csv = os.path.join(self.tmpdir, "stats.csv")
+        target, events = self.convert(source, 2, cfg)
+
+        summary = events[-2][1]
+        self.assertEqual(summary["totals"]["count"], 17)
+        self.assertEqual(summary["handlers"]["veh"]["count"], 8)
+        self.assertEqual(summary["handlers"]["copy"]["bytes_in"], sum(len("Team %d\n" % i) for i in range(8)))
+        self.assertEqual(summary["handlers"]["copy"]["bytes_out"], summary["handlers"]["copy"]["bytes_in"])
+        self.assertEqual(summary["handlers"]["gen_check"]["count"], 1)
+        self.assertEqual(summary["mods"]["MyMod"]["count"], 16)
+
+        with open(os.path.join(target, rfactortools.gsc2013.stats_filename)) as fin:
+            self.assertEqual(json.load(fin)["totals"], summary["totals"])
+        with open(cfg.stats_csv, newline="") as fin:
+            rows = list(csv.DictReader(fin))
+        self.assertEqual(len(rows), 17)
+        self.assertEqual(sorted(set(row["status"] for row in rows)), ["done"])
+
+    def test_rules(self):
+        cfg = rfactortools.rFactorToGSC2013Config()
+        cfg.vehicle_category = "Classic"
+        cfg.track_category = "Classics"
+        rules = rfactortools.gsc2013.ConversionRules(cfg)
+
+        veh = rules.veh("MyMod")
+        self.assertIs(rules.veh("MyMod"), veh)
+        self.assertEqual(veh.rewrite('classes="F1"\n'), 'Classes="reiza5,F1"\n')
+        self.assertEqual(veh.rewrite('Team="Lotus"\n'), 'Team="Lotus MyMod"\n')
+        self.assertEqual(veh.rewrite('Category="F1, 1967"\n'), 'Category="Classic, F1, 1967"\n')
+        self.assertEqual(veh.rewrite('Description="Team=\\"Lotus\\""\n'), 'Description="Team=\\"Lotus\\""\n')
+
+        cfg.unique_team_names = False
+        veh = rfactortools.gsc2013.ConversionRules(cfg).veh("MyMod")
+        self.assertEqual(veh.rewrite('team="Lotus"\n'), 'Team="Lotus"\n')
+        self.assertEqual(veh.rewrite('TEAM="Lotus"\n'), 'Team="Lotus"\n')
+
+        self.assertEqual(rules.gdb.rewrite("  VenueName = Monza\n"), "  VenueName = Classics, Monza\n")
+        self.assertEqual(rules.gdb.rewrite("filter properties=F1\n"), "Filter Properties = StockV8 *\n")
+        self.assertEqual(rules.gdb.rewrite("TrackName = Monza\n"), "TrackName = Monza\n")
+
+        self.assertEqual(rules.track_scn.rewrite(" Type=Directional Intensity=(1.5) Color=(1,1,1)\n"),
+                         " Type=Directional Intensity=(0.900000) Color=(1,1,1)\n")
+        self.assertEqual(rules.track_scn.rewrite(" Type=Directional Intensity=(0.5)\n"),
+                         " Type=Directional Intensity=(0.5)\n")
+
+    def test_convert_mas_corrupt_entry(self):
+        source = self.write_mod()
+        masfile = os.path.join(source, "GameData", "Vehicles", "MyMod", "car.mas")
+        # stored and already encrypted for GSC2013, so passed through as view into the archive
+        gsc_data = rfactortools.crypt.encrypt_data(os.urandom(5000), 1, 0x4b1dca9f960524e8, 0)
+        rfactortools.mas_pack_from_data([("a.dds", gsc_data), ("b.gmt", b"Hello World\r\n" * 1000),
+                                         ("c.dds", gsc_data)], masfile)
+        with rfactortools.MASArchive(masfile) as mas:
+            entry = mas.get_entry("b.gmt")
+        with open(masfile, "r+b") as fout:
+            fout.seek(entry.offset)
+            fout.write(b"\xff" * 8)
+
+        converter = rfactortools.rFactorToGSC2013(source, rfactortools.rFactorToGSC2013Config())
+        with self.assertRaises(zlib.error):
+            converter.convert_mas(masfile, os.path.join(self.tmpdir, "car.mas"))
+
+    def test_convert_gmt_actions(self):
+        source = self.write_mod()
+        moddir = os.path.join(source, "GameData", "Vehicles", "MyMod")
+        gsc_data = rfactortools.crypt.encrypt_data(b"GMT" * 100, 1, 0x4b1dca9f960524e8, 4)
+        with open(os.path.join(moddir, "gsc.gmt"), "wb") as fout:
+            fout.write(gsc_data)
+        with open(os.path.join(moddir, "plain.gmt"), "wb") as fout:
+            fout.write(b"GMT" * 100)
+        rfactortools.mas_pack_from_data([("car.gmt", gsc_data)], os.path.join(moddir, "car.mas"))
+
+        converter = rfactortools.rFactorToGSC2013(source, rfactortools.rFactorToGSC2013Config())
+        target = os.path.join(self.tmpdir, "target")
+        converter.convert_all(target)
+
+        self.assertEqual(converter.mas_encryptor.actions, {"passthrough": 2, "encrypted": 1})
+        with open(os.path.join(target, "GameData", "Vehicles", "MyMod", "gsc.gmt"), "rb") as fin:
+            self.assertEqual(fin.read(), gsc_data)
+
+    def test_stats_mas_cpu(self):
+        source = self.write_mod()
+        entries = [("entry%d.txt" % i, b"entry %d\r\n" % i * 1000) for i in range(8)]
+        rfactortools.mas_pack_from_data(entries, os.path.join(source, "GameData", "Vehicles", "MyMod", "car.mas"))
+
+        # the converting thread uses no CPU time, every call in another
+        # thread one second more, so each .mas entry costs one second
+        main_thread = threading.current_thread()
+        local = threading.local()
+
+        def thread_time():
+            if threading.current_thread() is main_thread:
+                return 0.0
+            local.calls = getattr(local, "calls", 0) + 1
+            return float(local.calls)
+
+        with unittest.mock.patch("rfactortools.stats.time.thread_time", thread_time):
+            target, events = self.convert(source, 1)
+        handlers = events[-2][1]["handlers"]
+        self.assertEqual(handlers["mas"]["count"], 1)
+        self.assertEqual(handlers["mas"]["cpu"], len(entries))
+        self.assertEqual(handlers["veh"]["cpu"], 0.0)
+
+
 if __name__ == '__main__':
     unittest.main()
 
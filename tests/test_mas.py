@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+# rfactortools test cases
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import rfactortools.mas
+
+
+class MASTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='rfactortools')
+        self.files = [("car.gmt", b"GMT" * 1000),
+                      ("car.dds", os.urandom(5000)),
+                      ("empty.txt", b""),
+                      ("readme.txt", b"Hello World\r\n" * 50)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_pack_roundtrip(self):
+        for mas_type in [0, 1, 3]:
+            masfile = os.path.join(self.tmpdir, "test%d.mas" % mas_type)
+            rfactortools.mas.mas_pack_from_data(self.files, masfile, mas_type)
+            self.assertEqual(rfactortools.mas.mas_unpack_to_data(masfile), self.files)
+
+    def test_pack_from_iter(self):
+        """Entries without len() get spooled, the result must be identical"""
+        masfile_list = os.path.join(self.tmpdir, "list.mas")
+        masfile_iter = os.path.join(self.tmpdir, "iter.mas")
+
+        rfactortools.mas.mas_pack_from_iter(self.files, masfile_list)
+        rfactortools.mas.mas_pack_from_iter(iter(self.files), masfile_iter, max_inflight=1024)
+
+        with open(masfile_list, "rb") as lhs, open(masfile_iter, "rb") as rhs:
+            self.assertEqual(lhs.read(), rhs.read())
+
+    def test_pack_wrong_count(self):
+        with self.assertRaises(RuntimeError):
+            rfactortools.mas.mas_pack_from_iter(iter(self.files), os.path.join(self.tmpdir, "count.mas"),
+                                                count=len(self.files) + 1)
+
+    def test_pack_files(self):
+        filenames = []
+        for name, data in self.files:
+            filename = os.path.join(self.tmpdir, name)
+            with open(filename, "wb") as fout:
+                fout.write(data)
+            filenames.append(filename)
+
+        masfile = os.path.join(self.tmpdir, "files.mas")
+        rfactortools.mas.mas_pack(filenames, masfile, jobs=2, max_inflight=1)
+        self.assertEqual(rfactortools.mas.mas_unpack_to_data(masfile), self.files)
+
+    def test_unpack_parallel(self):
+        masfile = os.path.join(self.tmpdir, "parallel.mas")
+        rfactortools.mas.mas_pack_from_data(self.files, masfile)
+
+        self.assertEqual(rfactortools.mas.mas_unpack_to_data(masfile, jobs=4, max_inflight=1), self.files)
+
+        outdir = os.path.join(self.tmpdir, "parallel")
+        rfactortools.mas.mas_unpack(masfile, outdir, jobs=4)
+        for name, data in self.files:
+            with open(os.path.join(outdir, name), "rb") as fin:
+                self.assertEqual(fin.read(), data)
+
+    def test_unpack_duplicates(self):
+        first = b"".join(b"%08d" % i for i in range(100000))
+        last = b"".join(b"%08x" % i for i in range(50000))
+        files = self.files + [("dup.gmt", first), ("dup.gmt", last)]
+        masfile = os.path.join(self.tmpdir, "duplicates.mas")
+        rfactortools.mas.mas_pack_from_data(files, masfile)
+
+        outdir = os.path.join(self.tmpdir, "duplicates")
+        rfactortools.mas.mas_unpack(masfile, outdir, jobs=4, chunk_size=7)
+        with open(os.path.join(outdir, "dup.gmt"), "rb") as fin:
+            self.assertEqual(fin.read(), last)
+        for name, data in self.files:
+            with open(os.path.join(outdir, name), "rb") as fin:
+                self.assertEqual(fin.read(), data)
+
+    def test_unpack_chunked(self):
+        files = self.files + [("big.gmt", b"".join(b"%08d" % i for i in range(100000)))]
+        masfile = os.path.join(self.tmpdir, "chunked.mas")
+        rfactortools.mas.mas_pack_from_data(files, masfile)
+
+        outdir = os.path.join(self.tmpdir, "chunked")
+        rfactortools.mas.mas_unpack(masfile, outdir, jobs=2, chunk_size=7)
+        for name, data in files:
+            with open(os.path.join(outdir, name), "rb") as fin:
+                self.assertEqual(fin.read(), data)
+
+        # cut the last entry short
+        with open(masfile, "r+b") as fout:
+            fout.truncate(os.path.getsize(masfile) - 16)
+        with self.assertRaises(RuntimeError):
+            rfactortools.mas.mas_unpack(masfile, os.path.join(self.tmpdir, "truncated"), chunk_size=7)
+
+    def test_verify(self):
+        masdir = os.path.join(self.tmpdir, "verify")
+        os.mkdir(masdir)
+        good = os.path.join(masdir, "good.mas")
+        bad = os.path.join(masdir, "bad.mas")
+        rfactortools.mas.mas_pack_from_data(self.files, good)
+        rfactortools.mas.mas_pack_from_data(self.files, bad)
+
+        report = rfactortools.mas.mas_verify(good)
+        self.assertTrue(report["ok"])
+        self.assertEqual(report["entries"], len(self.files))
+
+        # corrupt the compressed data of car.gmt
+        with rfactortools.mas.MASArchive(bad) as mas:
+            entry = mas.get_entry("car.gmt")
+        with open(bad, "r+b") as fout:
+            fout.seek(entry.offset + entry.zsize // 2)
+            fout.write(b"\xff" * 8)
+
+        reports = rfactortools.mas.mas_verify_tree(masdir, jobs=2)
+        self.assertEqual([(os.path.basename(r["file"]), r["ok"]) for r in reports],
+                         [("bad.mas", False), ("good.mas", True)])
+        self.assertEqual([e["entry"] for e in reports[0]["errors"]], ["car.gmt"])
+
+        # entries reaching past the end of the file
+        with open(bad, "r+b") as fout:
+            fout.truncate(entry.offset + 1)
+        report = rfactortools.mas.mas_verify(bad)
+        self.assertFalse(report["ok"])
+        self.assertIn("outside of data section", report["errors"][-1]["error"])
+
+        # negative and implausibly large file counts
+        for file_count in (-1, 1 << 30):
+            with open(bad, "r+b") as fout:
+                fout.seek(20)
+                fout.write(struct.pack("<l", file_count))
+            with open(bad, "rb") as fin:
+                self.assertRaises(RuntimeError, rfactortools.mas.mas_unpack_file_table, fin)
+            report = rfactortools.mas.mas_verify(bad)
+            self.assertFalse(report["ok"])
+            self.assertIn("file count %d" % file_count, report["errors"][0]["error"])
+
+    def test_archive(self):
+        masfile = os.path.join(self.tmpdir, "archive.mas")
+        rfactortools.mas.mas_pack_from_data(self.files, masfile)
+
+        with rfactortools.mas.MASArchive(masfile) as mas:
+            self.assertEqual(len(mas), len(self.files))
+            self.assertEqual([e.name for e in mas], [name for name, data in self.files])
+            self.assertIn("CAR.GMT", mas)
+            self.assertNotIn("missing.gmt", mas)
+            with self.assertRaises(KeyError):
+                mas.read("missing.gmt")
+
+            for name, data in self.files:
+                self.assertEqual(bytes(mas.read(name.upper())), data)
+
+            self.assertEqual(mas.peek("readme.txt", 5), b"Hello")
+            self.assertEqual(mas.peek("empty.txt", 16), b"")
+
+            # incompressible data is stored and returned without a copy
+            entry = mas.get_entry("car.dds")
+            self.assertEqual(entry.size, entry.zsize)
+            view = mas.read(entry)
+            self.assertIsInstance(view, memoryview)
+            view.release()
+
+            # views handed out are released on close
+            view = mas.read(entry)
+            mas.close()
+            self.assertRaises(ValueError, bytes, view)
+
+        with rfactortools.mas.MASArchive(masfile) as mas:
+            # closing while a derived view is alive fails and can be retried
+            view = mas.read_raw("car.dds")[1:]
+            self.assertRaises(BufferError, mas.close)
+            view.release()
+            mas.close()
+
+        # an error inside the block comes out instead of the BufferError
+        with self.assertRaises(KeyError):
+            with rfactortools.mas.MASArchive(masfile) as mas:
+                view = mas.read("car.dds")
+                mas.get_entry("missing.dds")
+        self.assertTrue(mas._fin.closed)
+        view.release()
+
+    def test_archive_failed_pack(self):
+        masfile = os.path.join(self.tmpdir, "archive.mas")
+        rfactortools.mas.mas_pack_from_data(self.files, masfile)
+
+        def transform(name, data):
+            if name == "fail.txt":
+                raise RuntimeError("transform failed")
+            return data
+
+        with rfactortools.mas.MASArchive(masfile) as mas:
+            entries = [mas.compressed_entry(entry) for entry in mas]
+            entries.insert(2, ("fail.txt", b"fail"))
+            with self.assertRaises(RuntimeError) as cm:
+                rfactortools.mas.mas_pack_from_iter(entries, os.path.join(self.tmpdir, "out.mas"), jobs=4,
+                                                    transform=transform)
+        # the views in ``entries`` and the traceback didn't keep the archive from closing
+        self.assertEqual(str(cm.exception), "transform failed")
+        self.assertRaises(ValueError, bytes, entries[0].zdata)
+
+    def test_compression_policy(self):
+        text = b"Hello World\r\n" * 1000
+        noise = os.urandom(1000)
+
+        policy = rfactortools.mas.MASCompressionPolicy()
+        self.assertLess(len(policy.compress("readme.txt", text)), len(text))
+        self.assertIs(policy.compress("noise.dds", noise), noise)
+        self.assertIs(policy.compress("empty.txt", b""), b"")
+
+        policy = rfactortools.mas.MASCompressionPolicy(level=9, strategy="filtered", store_extensions=[".TXT"])
+        self.assertIs(policy.compress("readme.txt", text), text)
+        self.assertLess(len(policy.compress("readme.gmt", text)), len(text))
+
+        # compressible text behind an incompressible probe
+        data = noise + text
+        policy = rfactortools.mas.MASCompressionPolicy(probe_size=len(noise))
+        self.assertIs(policy.compress("probe.gmt", data), data)
+        policy = rfactortools.mas.MASCompressionPolicy(probe_size=0)
+        self.assertLess(len(policy.compress("probe.gmt", data)), len(data))
+        policy = rfactortools.mas.MASCompressionPolicy()
+        self.assertLess(len(policy.compress("probe.gmt", data)), len(data))
+
+        # saves about a third, so a 50% minimum gain stores it
+        data = noise + b"\0" * 500
+        policy = rfactortools.mas.MASCompressionPolicy(min_gain=0.5)
+        self.assertIs(policy.compress("gain.gmt", data), data)
+        policy = rfactortools.mas.MASCompressionPolicy(min_gain=0.2)
+        self.assertLess(len(policy.compress("gain.gmt", data)), len(data))
+
+        masfile = os.path.join(self.tmpdir, "policy.mas")
+        policy = rfactortools.mas.MASCompressionPolicy(store_extensions=[".gmt"])
+        rfactortools.mas.mas_pack_from_data(self.files, masfile, policy=policy)
+        self.assertEqual(rfactortools.mas.mas_unpack_to_data(masfile), self.files)
+        with rfactortools.mas.MASArchive(masfile) as mas:
+            entry = mas.get_entry("car.gmt")
+            self.assertEqual(entry.size, entry.zsize)
+
+    def test_blob_cache(self):
+        cache = rfactortools.mas.MASBlobCache()
+        rfactortools.mas.mas_pack_from_data(self.files, os.path.join(self.tmpdir, "a.mas"), cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 4))
+        rfactortools.mas.mas_pack_from_data(self.files, os.path.join(self.tmpdir, "b.mas"), cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (4, 4))
+
+        with open(os.path.join(self.tmpdir, "a.mas"), "rb") as lhs, \
+                open(os.path.join(self.tmpdir, "b.mas"), "rb") as rhs:
+            self.assertEqual(lhs.read(), rhs.read())
+
+        # different compression settings must not share entries
+        policy = rfactortools.mas.MASCompressionPolicy(level=1)
+        rfactortools.mas.mas_pack_from_data(self.files, os.path.join(self.tmpdir, "c.mas"),
+                                            policy=policy, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (4, 8))
+
+    def test_blob_cache_directory(self):
+        cachedir = os.path.join(self.tmpdir, "cache")
+        masfile = os.path.join(self.tmpdir, "cached.mas")
+
+        cache = rfactortools.mas.MASBlobCache(cachedir)
+        rfactortools.mas.mas_pack_from_data(self.files, masfile, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 4))
+
+        cache = rfactortools.mas.MASBlobCache(cachedir, max_memory=0)
+        rfactortools.mas.mas_pack_from_data(self.files, masfile, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (4, 0))
+        self.assertEqual(rfactortools.mas.mas_unpack_to_data(masfile), self.files)
+
+        # truncated and corrupted files are misses and get removed
+        blobs = sorted(os.path.join(root, name) for root, dirs, files in os.walk(cachedir) for name in files)
+        self.assertEqual(len(blobs), 4)
+        with open(blobs[0], "r+b") as fout:
+            fout.truncate(4)
+        with open(blobs[1], "r+b") as fout:
+            fout.truncate(os.path.getsize(blobs[1]) - 1)
+        with open(blobs[2], "r+b") as fout:
+            fout.seek(-1, os.SEEK_END)
+            fout.write(b"?")
+
+        cache = rfactortools.mas.MASBlobCache(cachedir, max_memory=0)
+        rfactortools.mas.mas_pack_from_data(self.files, masfile, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertEqual(rfactortools.mas.mas_unpack_to_data(masfile), self.files)
+
+        cache = rfactortools.mas.MASBlobCache(cachedir, max_memory=0)
+        rfactortools.mas.mas_pack_from_data(self.files, masfile, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (4, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# EOF #
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# rfactortools test cases
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import rfactortools
+
+
+class MASIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='rfactortools')
+        self.datadir = os.path.join(self.tmpdir, "GameData")
+        os.makedirs(os.path.join(self.datadir, "Vehicles", "TheMod"))
+        os.makedirs(os.path.join(self.datadir, "Locations", "TheTrack"))
+
+        self.car_mas = os.path.join(self.datadir, "Vehicles", "TheMod", "car.mas")
+        self.track_mas = os.path.join(self.datadir, "Locations", "TheTrack", "track.mas")
+        rfactortools.mas_pack_from_data([("Car.gmt", b"car"), ("shared.dds", b"dds")], self.car_mas)
+        rfactortools.mas_pack_from_data([("track.gmt", b"track"), ("SHARED.dds", b"dds")], self.track_mas)
+
+        self.indexfile = os.path.join(self.tmpdir, "index.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_find(self):
+        with rfactortools.MASIndex(self.indexfile) as index:
+            self.assertEqual(index.update(self.datadir), (2, 0))
+
+            self.assertEqual([(e.archive, e.name) for e in index.find("car.GMT")],
+                             [(self.car_mas, "Car.gmt")])
+            self.assertEqual([e.archive for e in index.find("shared.dds")],
+                             sorted([self.track_mas, self.car_mas]))
+            self.assertEqual([e.name for e in index.find("*.gmt")], ["track.gmt", "Car.gmt"])
+            self.assertEqual(index.find("missing.gmt"), [])
+
+            self.assertEqual(len(index.list()), 4)
+            self.assertEqual(len(index.list(os.path.join(self.datadir, "Vehicles"))), 2)
+            self.assertEqual(len(index.list(os.path.join(self.datadir, "VEHICLES"))),
+                             2 if os.path.normcase("A") == "a" else 0)
+            self.assertEqual(len(index.list(self.car_mas)), 2)
+            self.assertEqual(index.list(os.path.join(self.datadir, "Vehicle")), [])
+
+    def test_incremental_update(self):
+        with rfactortools.MASIndex(self.indexfile) as index:
+            index.update(self.datadir)
+
+        with rfactortools.MASIndex(self.indexfile) as index:
+            # nothing changed
+            self.assertEqual(index.update(self.datadir), (0, 0))
+
+            rfactortools.mas_pack_from_data([("Car.gmt", b"car"), ("wheel.gmt", b"wheel")], self.car_mas)
+            st = os.stat(self.car_mas)
+            os.utime(self.car_mas, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+            os.remove(self.track_mas)
+
+            self.assertEqual(index.update(self.datadir), (1, 1))
+            self.assertEqual(index.archives(), [self.car_mas])
+            self.assertEqual([e.name for e in index.find("wheel.gmt")], ["wheel.gmt"])
+            self.assertEqual(index.find("shared.dds"), [])
+
+            # archives that can't be read don't stop the update
+            broken = os.path.join(self.datadir, "Vehicles", "TheMod", "broken.mas")
+            os.symlink(os.path.join(self.tmpdir, "missing.mas"), broken)
+            with open(os.path.join(self.datadir, "Locations", "TheTrack", "garbage.mas"), "wb") as fout:
+                fout.write(b"garbage")
+            self.assertEqual(index.update(self.datadir), (1, 0))
+            self.assertEqual(index.archives(),
+                             [os.path.join(self.datadir, "Locations", "TheTrack", "garbage.mas"), self.car_mas])
+
+    @unittest.skipIf(os.path.normcase("A") == "a", "needs a case-sensitive filesystem")
+    def test_case_distinct_directories(self):
+        upper = os.path.join(self.tmpdir, "Mods")
+        lower = os.path.join(self.tmpdir, "mods")
+        os.makedirs(upper)
+        os.makedirs(lower)
+        upper_mas = os.path.join(upper, "upper.mas")
+        lower_mas = os.path.join(lower, "lower.mas")
+        rfactortools.mas_pack_from_data([("upper.gmt", b"upper")], upper_mas)
+        rfactortools.mas_pack_from_data([("lower.gmt", b"lower")], lower_mas)
+
+        with rfactortools.MASIndex(self.indexfile) as index:
+            self.assertEqual(index.update(lower), (1, 0))
+            self.assertEqual(index.update(upper), (1, 0))
+            self.assertEqual(index.update(upper), (0, 0))
+
+            self.assertEqual(index.archives(), [upper_mas, lower_mas])
+            self.assertEqual([e.archive for e in index.list(upper)], [upper_mas])
+            self.assertEqual([e.archive for e in index.list(lower)], [lower_mas])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# EOF #
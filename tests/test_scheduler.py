@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# rfactortools test cases
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+import time
+import unittest
+
+import rfactortools
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def run_jobs(self, jobs):
+        events = []
+        scheduler = rfactortools.ConversionScheduler(jobs, lambda *args: events.append(args))
+
+        def job(i):
+            scheduler.report("file", i)
+            # later jobs finish first
+            time.sleep(0.001 * (15 - i))
+            scheduler.report("file_done", i, threading.current_thread() is main_thread)
+
+        main_thread = threading.current_thread()
+        scheduler.report("start")
+        for i in range(10):
+            scheduler.submit(job, i)
+        scheduler.report("middle")
+        for i in range(10, 15):
+            scheduler.submit(job, i)
+        scheduler.wait()
+        scheduler.shutdown()
+        return events
+
+    def test_event_order(self):
+        serial = self.run_jobs(1)
+        self.assertEqual(len(serial), 32)
+        self.assertEqual(serial[0], ("start",))
+        self.assertEqual(serial[21], ("middle",))
+        self.assertTrue(all(args[2] for args in serial if args[0] == "file_done"))
+
+        parallel = self.run_jobs(4)
+        self.assertEqual([args[:2] for args in parallel], [args[:2] for args in serial])
+        self.assertFalse(any(args[2] for args in parallel if args[0] == "file_done"))
+
+    def test_error(self):
+        scheduler = rfactortools.ConversionScheduler(4)
+
+        def fail():
+            raise RuntimeError("job failed")
+
+        with self.assertRaises(RuntimeError):
+            scheduler.submit(fail)
+            scheduler.wait()
+        scheduler.shutdown()
+
+    def test_error_cb(self):
+        for jobs in (1, 4):
+            events = []
+            scheduler = rfactortools.ConversionScheduler(jobs, lambda *args: events.append(args),
+                                                         lambda err, i: scheduler.report("file_error", i, str(err)))
+
+            def job(i):
+                scheduler.report("file", i)
+                if i % 3 == 0:
+                    raise RuntimeError("job %d failed" % i)
+                scheduler.report("file_done", i)
+
+            for i in range(10):
+                scheduler.submit(job, i)
+            scheduler.wait()
+            scheduler.shutdown()
+
+            self.assertEqual(len(events), 20)
+            self.assertEqual(events[:4],
+                             [("file", 0), ("file_error", 0, "job 0 failed"), ("file", 1), ("file_done", 1)])
+            self.assertEqual(events[-2:], [("file", 9), ("file_error", 9, "job 9 failed")])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# EOF #
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# rfactortools test cases
+# Copyright (C) 2014 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import rfactortools.util
+import rfactortools.veh
+
+
+class UtilTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='rfactortools')
+        os.makedirs(os.path.join(self.tmpdir, "GameData", "Vehicles", "MyMod"))
+        with open(os.path.join(self.tmpdir, "GameData", "Vehicles", "MyMod", "Car.veh"), "w") as fout:
+            fout.write("Description=\"Car\"\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def age(self, path, seconds=60):
+        """Moves the mtime of ``path`` out of the racy window"""
+        mtime = time.time() - seconds
+        os.utime(path, (mtime, mtime))
+
+    def test_lookup_path_icase(self):
+        expected = os.path.join(self.tmpdir, "GameData", "Vehicles", "MyMod", "Car.veh")
+        path = os.path.join(self.tmpdir, "gamedata/VEHICLES/mymod/car.VEH")
+        self.assertEqual(rfactortools.util.lookup_path_icase(path), expected)
+        self.assertTrue(rfactortools.util.file_exists(os.path.join(self.tmpdir, "GAMEDATA/vehicles/MyMod/CAR.veh")))
+        self.assertFalse(rfactortools.util.directory_exists(path))
+        self.assertTrue(rfactortools.util.directory_exists(os.path.join(self.tmpdir, "gamedata/vehicles/mymod")))
+        self.assertFalse(rfactortools.util.path_exists(os.path.join(self.tmpdir, "gamedata/vehicles/missing")))
+
+        with rfactortools.util.open_read(os.path.join(self.tmpdir, "gamedata/vehicles/mymod/car.veh")) as fin:
+            self.assertEqual(fin.read(), "Description=\"Car\"\n")
+
+    def test_index_invalidation(self):
+        index = rfactortools.util.CaseInsensitiveIndex()
+        moddir = os.path.join(self.tmpdir, "GameData", "Vehicles", "MyMod")
+
+        # recently modified directories are not cached
+        self.assertIsNot(index.listing(moddir), index.listing(moddir))
+
+        self.age(moddir)
+        names = index.listing(moddir)
+        self.assertIs(index.listing(moddir), names)
+        self.assertEqual(names, {"car.veh": ["Car.veh"]})
+
+        # a new file changes the mtime of the directory
+        open(os.path.join(moddir, "CAR.VEH"), "w").close()
+        self.assertEqual(sorted(index.lookup(moddir, ["car.veh"])),
+                         [os.path.join(moddir, "CAR.VEH"), os.path.join(moddir, "Car.veh")])
+
+        shutil.rmtree(moddir)
+        self.assertIsNone(index.listing(moddir))
+        self.assertEqual(index.lookup(moddir, ["car.veh"]), [])
+
+    def test_walk(self):
+        os.makedirs(os.path.join(self.tmpdir, "GameData", "Locations", "Track"))
+        for fname in ["Track/Track.GDB", "Track/Track.scn", "readme.txt"]:
+            open(os.path.join(self.tmpdir, "GameData", "Locations", fname), "w").close()
+
+        expected = [os.path.join(path, fname)
+                    for path, dirs, files in os.walk(self.tmpdir) for fname in files]
+        for jobs in [1, 4]:
+            self.assertEqual([entry.path for entry in rfactortools.util.walk(self.tmpdir, jobs=jobs)], expected)
+
+        tree = rfactortools.util.DirectoryTree(self.tmpdir)
+        self.assertEqual([entry.path for entry in tree.walk(self.tmpdir)], expected)
+        self.assertEqual([entry.path for entry in tree.walk(os.path.join(self.tmpdir, "GameData", "Vehicles"))],
+                         [os.path.join(self.tmpdir, "GameData", "Vehicles", "MyMod", "Car.veh")])
+
+        entries = list(tree.walk(self.tmpdir, exts=[".gdb", ".veh"]))
+        self.assertEqual(sorted(entry.name for entry in entries), ["Car.veh", "Track.GDB"])
+        self.assertEqual(entries[0].stat().st_size, os.path.getsize(entries[0].path))
+
+        def prune(entry):
+            return entry.name == "Vehicles"
+
+        dirs = [entry.name for entry in tree.walk(self.tmpdir, exts=[], include_dirs=True, prune=prune)]
+        self.assertEqual(sorted(dirs), ["GameData", "Locations", "Track", "Vehicles"])
+        self.assertTrue(all(entry.is_file for entry in tree.walk(self.tmpdir)))
+        self.assertFalse(any(entry.is_file for entry in tree.walk(self.tmpdir, exts=[], include_dirs=True)))
+
+        self.assertEqual(rfactortools.util.find_files(self.tmpdir, ".scn"),
+                         [os.path.join(self.tmpdir, "GameData", "Locations", "Track", "Track.scn")])
+        self.assertEqual(rfactortools.util.find_file(self.tmpdir, "track.gdb"),
+                         os.path.join(self.tmpdir, "GameData", "Locations", "Track", "Track.GDB"))
+
+    def test_basename_index(self):
+        vehdir = os.path.join(self.tmpdir, "GameData", "Vehicles")
+        teamdir = os.path.join(vehdir, "MyMod", "Teams", "Team1")
+        os.makedirs(teamdir)
+        for fname in ["MyMod/Car.gen", "MyMod/Teams/CMAPS.mas", "cmaps.mas"]:
+            open(os.path.join(vehdir, fname), "w").close()
+        outside = os.path.join(self.tmpdir, "outside.gen")
+        open(outside, "w").close()
+
+        index = rfactortools.util.BasenameIndex(vehdir)
+        self.assertEqual(index.find("cmaps.mas"), os.path.join(vehdir, "cmaps.mas"))
+        self.assertEqual(index.find("cmaps.mas", os.path.join(vehdir, "MyMod")),
+                         os.path.join(vehdir, "MyMod", "Teams", "CMAPS.mas"))
+        self.assertIsNone(index.find("missing.mas"))
+
+        self.assertEqual(index.find_backwards(teamdir, "car.gen"), os.path.join(vehdir, "MyMod", "car.gen"))
+        self.assertIsNone(index.find_backwards(teamdir, "missing.gen"))
+
+        # lookups above the root of the index go to the disk
+        self.assertEqual(index.find_backwards(teamdir, "outside.gen"), outside)
+        self.assertEqual(index.find_backwards(teamdir, "Teams/cmaps.mas"),
+                         rfactortools.veh.find_file_backwards(teamdir, "Teams/cmaps.mas"))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# EOF #